@@ -3,9 +3,16 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import glob
 import os
+import sys
+
+# Shared cache (Code version 2/analysis_cache.py): re-runs skip CSV parsing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Code version 2'))
+from analysis_cache import AnalysisCache
+from sensor_parser import SAMPLE_FIELDS
 
 # Read data
-df = pd.read_csv("sensor_data_log_20250523_094412.csv")
+samples = AnalysisCache().source("sensor_data_log_20250523_094412.csv").value
+df = pd.DataFrame({name: samples[name] for name in SAMPLE_FIELDS})
 print("\nFirst data:")
 print(df.head())
 
@@ -3,8 +3,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import glob
 import os
+import sys
 from datetime import datetime
 
+# Bộ nhớ đệm dùng chung (Code version 2/analysis_cache.py): đọc lại file CSV đã phân tích nhanh hơn nhiều
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Code version 2'))
+from analysis_cache import AnalysisCache
+from sensor_parser import SAMPLE_FIELDS
+
 def setup_plot_style():
     """Cấu hình style cho đồ thị"""
     plt.style.use('seaborn')
@@ -20,7 +26,12 @@ def get_latest_csv():
         raise FileNotFoundError("Không tìm thấy file CSV nào trong thư mục hiện tại!")
     latest_file = max(csv_files, key=os.path.getctime)
     print(f"Đang đọc file: {latest_file}")
-    return pd.read_csv(latest_file)
+    return load_csv(latest_file)
+
+def load_csv(path):
+    """Đọc file CSV qua bộ nhớ đệm, trả về DataFrame với các cột ax..gz"""
+    samples = AnalysisCache().source(path).value
+    return pd.DataFrame({name: samples[name] for name in SAMPLE_FIELDS})
 
 def plot_acceleration(df, save_path='plots'):
     """Vẽ đồ thị gia tốc"""
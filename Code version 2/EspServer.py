@@ -1,56 +1,83 @@
+import argparse
 import serial
 import serial.tools.list_ports
 import time
-import json
-import re
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import threading
-import collections
 import os
-import datetime
 
-# --- Matplotlib for plotting ---
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.animation import FuncAnimation
-import numpy as np
+from bounded_queue import POLICY_DROP_OLDEST, POLICY_SPILL, QUEUE_POLICIES, BoundedQueue, format_queue_stats
+from ingest_engine import IngestEngine, BAUD_RATE, UDP_SCHEME
+from ingest_supervisor import PORT_SEPARATOR, SupervisedEngine, format_health
+from udp_gateway import UDP_PORT
+from live_plot import ACC_COLUMNS, GYRO_COLUMNS, SignalPanel
+from latency import LATENCY, SamplingProfiler, format_latency
+from link_stats import STATUS_OK, write_snapshot
+from log_ring import LogRing
+from rate_controller import MAX_FREQ, RateController, parse_node_config
+from recorder import CSV_HEADER, RECORD_FORMATS, get_output_filename
+from rep_detector import DEFAULT_LATENCY_S, RepMonitor
+from segmentation import DEFAULT_DISTANCE, DEFAULT_THRESHOLD
+from sensor_parser import LINE_HANDSHAKE, LINE_WIFI_CLIENTS, LINE_UPTIME, LINE_SEPARATOR
+
+# --- Matplotlib for plotting (imported only when the GUI is built, see import_plotting) ---
+Figure = None
+FigureCanvasTkAgg = None
 
 # --- General Configuration ---
-BAUD_RATE = 115200
-MAX_PLOT_POINTS = 200
+MAX_PLOT_POINTS = 200 # Newest samples shown per node (history lives in engine.buffers)
+PLOT_INTERVAL_MS = 100 # Plot refresh period (blitted, see live_plot.SignalPanel)
 MAX_LOG_LINES = 100 # Increased for better log visibility
+LOG_REFRESH_MS = 200 # The log widget is updated in one batch at this interval
+RAW_LOG_EVERY = 20 # Show 1 of N RAW lines
+UNPARSED_LOG_EVERY = 10 # Show 1 of N warnings for non-sample lines
+SUMMARY_INTERVAL_S = 5
+TABLE_REFRESH_HZ = 10 # Node table is refreshed at most this often, however fast samples arrive
+LINK_REFRESH_S = 1.0 # Node table link columns are refreshed this often even without new samples
+DISPLAY_QUEUE_ROWS = 20000 # Lines/samples waiting for the GUI; beyond this the oldest batches are dropped
+DEBUG = False # Print node table updates to stdout (--debug)
+
+# --- Acquisition engine (serial port, parsing, recording, stats) ---
+engine = None
+EXTRA_PORTS = [] # Ports given with --port (e.g. serial_simulator.py's /dev/pts/N), listed first
+UDP_GATEWAY_PORT = f"{UDP_SCHEME}0.0.0.0:{UDP_PORT}" # Receive the nodes directly, without the ESP32 bridge
+SUPERVISE = False # --supervise: one reader process per port, several ports separated by commas
 
 # --- Global variables for connection and data management ---
-ser = None
 running = False
-connected_nodes_data = {} # Stores latest data for each node
-serial_thread = None
+connected_nodes_data = {} # Latest data for each node, refreshed from the engine
+displayed_rows = {} # Values currently shown in data_tree, keyed by node ID
+table_refresh_pending = False
 last_summary_time = time.time()
-# Thêm biến toàn cục
-recording_thread = None
-recording_thread_stop = threading.Event()
-
+last_link_refresh = time.time()
+LINK_STATS_PATH = None # --link-stats: per-node link statistics appended every SUMMARY_INTERVAL_S
+rate_controller = None # --adaptive-rate: RateController sending CONFIG with new freq values
+rep_monitor = None # --detect-reps: RepMonitor counting leg-press reps per node and set
 
 # --- Global variables for file recording ---
 is_recording = False
 output_directory = os.path.dirname(os.path.abspath(__file__)) # Default to script directory
-active_recording_file_handles = {} # Dictionary to store open file handles for continuous recording
-recording_queue = collections.deque() # Separate queue for data recording
+RECORD_FORMAT = "csv" # "csv" or "columnar" (.imu directories, see columnar_format.py)
+RECORD_QUEUE_POLICY = POLICY_SPILL # What the recorder does when the disk falls behind (see bounded_queue.py)
 
 # --- Data for plotting ---
-plot_data_buffers = {} # Stores historical data for plotting, keyed by node ID
-data_queue = collections.deque() # Queue to transfer new data from serial thread to main/plot thread
+# (enqueue time, IngestBatch) from the engine thread to main/plot thread.  Plots read engine.buffers, so a
+# dropped batch only costs log lines and a table refresh; the recorder has its own queue.
+data_queue = BoundedQueue("display", DISPLAY_QUEUE_ROWS, POLICY_DROP_OLDEST,
+                          weight=lambda item: max(len(item[1].lines), len(item[1].samples), 1))
+profiler = SamplingProfiler() # Started/stopped with the "Profiler" checkbox or --profile
+
+# --- Log view (ring buffer flushed to log_text by flush_log_view) ---
+log_ring = LogRing(MAX_LOG_LINES, sample_every={"RAW": RAW_LOG_EVERY, "UNPARSED": UNPARSED_LOG_EVERY})
 
 # --- Matplotlib objects ---
 fig_acc = None
-ax_acc = None
-line_ax, line_ay, line_az = None, None, None
 fig_gyro = None
-ax_gyro = None
-line_gx, line_gy, line_gz = None, None, None
-ani_acc = None
-ani_gyro = None
+acc_panel = None
+gyro_panel = None
+show_all_nodes_var = None # Tk BooleanVar: grid of all nodes instead of the selected one
+profiler_var = None # Tk BooleanVar of the "Profiler" checkbox
 
 # --- Global variables for configuration management (saving state) ---
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "esp_server_config.txt")
@@ -58,98 +85,21 @@ CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "esp_serv
 # --- Node selection for plotting ---
 selected_node_for_plot = None # Global variable to hold the ID of the node currently selected for plotting
 
-# --- Timestamp Conversion Function ---
-def format_microseconds_to_mmss_us(microseconds):
-    if not isinstance(microseconds, (int, float)) or microseconds < 0:
-        return "Invalid_TS"
-
-    total_seconds = int(microseconds // 1_000_000)
-    us_part = int(microseconds % 1_000_000)
-    minutes = (total_seconds // 60) % 60
-    seconds = total_seconds % 60
-
-    return f"{minutes:02}:{seconds:02}:{us_part:06}"
-
-# This function is no longer used directly but can be useful for re-parsing
-def parse_mmss_us_to_microseconds(timestamp_str):
-    try:
-        parts = timestamp_str.split(':')
-        if len(parts) == 3:
-            minutes = int(parts[0])
-            seconds = int(parts[1])
-            microseconds_part = int(parts[2])
-            total_microseconds = (minutes * 60 * 1_000_000) + (seconds * 1_000_000) + microseconds_part
-            return total_microseconds
-    except ValueError:
-        pass
-    return 0
-
-# --- Functions to parse different types of data from Serial ---
-def parse_sensor_data(line):
-    # --- Case 1: Dữ liệu dạng JSON (cũ)
-    json_str_start_idx = line.find("Processed UDP from Queue: ")
-    if json_str_start_idx != -1:
-        json_candidate = line[json_str_start_idx + len("Processed UDP from Queue: "):].strip()
-    else:
-        json_candidate = line.strip()
-
-    if json_candidate.startswith("{") and json_candidate.endswith("}"):
-        try:
-            data = json.loads(json_candidate)
-            required_keys = ["id", "ax", "ay", "az", "gx", "gy", "gz", "ts"]
-            if all(k in data for k in required_keys):
-                return {
-                    "id": data["id"],
-                    "ax": float(data["ax"]),
-                    "ay": float(data["ay"]),
-                    "az": float(data["az"]),
-                    "gx": float(data["gx"]),
-                    "gy": float(data["gy"]),
-                    "gz": float(data["gz"]),
-                    "ts": int(data["ts"]) * 1000  # milliseconds -> microseconds
-                }
-        except (json.JSONDecodeError, ValueError, TypeError):
-            return None
-
-    # --- Case 2: Dữ liệu dạng text phân tách bằng `:`
-    if line.startswith("DATA:"):
-        try:
-            parts = line.strip().split(":")
-            if len(parts) >= 10:
-                return {
-                    "id": parts[1],
-                    "ts": int(parts[3]) * 1000,  # convert ms -> µs
-                    "ax": float(parts[4]),
-                    "ay": float(parts[5]),
-                    "az": float(parts[6]),
-                    "gx": float(parts[7]),
-                    "gy": float(parts[8]),
-                    "gz": float(parts[9])
-                }
-        except (ValueError, IndexError):
-            return None
-
-    return None
-
-
-def parse_server_uptime(line):
-    if "Server Uptime:" in line and "seconds" in line:
-        try:
-            match = re.search(r'Server Uptime: (\d+) seconds', line)
-            if match:
-                return int(match.group(1))
-        except ValueError:
-            pass
-    return None
-
-def is_separator_line(line):
-    return line.strip() == "--------------------------------------------------" or \
-           line.strip() == "-------------------------------------------------"
+def import_plotting():
+    """Load matplotlib only when a window is actually requested."""
+    global Figure, FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 # --- GUI Functions ---
 def update_com_ports():
     ports = serial.tools.list_ports.comports()
-    com_ports = [port.device for port in ports]
+    com_ports = EXTRA_PORTS + [port.device for port in ports if port.device not in EXTRA_PORTS]
+    if UDP_GATEWAY_PORT not in com_ports:
+        com_ports.append(UDP_GATEWAY_PORT)
+    serial_ports = [port for port in com_ports if not port.startswith(UDP_SCHEME)]
+    if SUPERVISE and len(serial_ports) > 1:
+        com_ports.insert(0, f"{PORT_SEPARATOR} ".join(serial_ports)) # All stations at once
     com_port_combobox['values'] = com_ports
     if com_ports:
         com_port_combobox.set(com_ports[0])
@@ -157,7 +107,7 @@ def update_com_ports():
         com_port_combobox.set("Không tìm thấy cổng")
 
 def start_serial_read_thread():
-    global ser, running, serial_thread, last_summary_time, ani_acc, ani_gyro, selected_node_for_plot
+    global running, last_summary_time, selected_node_for_plot
     selected_port = com_port_combobox.get()
 
     if not selected_port or selected_port == "Không tìm thấy cổng":
@@ -169,36 +119,33 @@ def start_serial_read_thread():
         return
 
     try:
-        ser = serial.Serial(selected_port, BAUD_RATE, timeout=0.1)
+        # Clear node selection and data buffers on new connection
+        selected_node_for_plot = None
+        connected_nodes_data.clear()
+        data_queue.clear()
+        data_queue.reset_stats()
+
+        engine.open(selected_port)
         running = True
         connect_button.config(text="Đang kết nối...", state=tk.DISABLED)
         disconnect_button.config(state=tk.NORMAL)
         toggle_recording_buttons_state()
         status_label.config(text=f"Đã kết nối tới {selected_port}", style="Green.TLabel")
-        log_text.insert(tk.END, f"[INFO] Đã mở cổng Serial {selected_port} với tốc độ {BAUD_RATE} bps.\n")
-        log_text.insert(tk.END, "[INFO] Đang chờ dữ liệu từ ESP32...\n")
-        log_text.insert(tk.END, "[INFO] Dữ liệu RAW từ Serial sẽ hiển thị ngay khi nhận được.\n")
-        log_text.insert(tk.END, "[INFO] Nhấn 'Ngắt kết nối' hoặc đóng cửa sổ để dừng chương trình.\n\n")
-        log_text.see(tk.END)
+        if SUPERVISE:
+            log_message("INFO", f"Đã khởi động một tiến trình đọc cho mỗi cổng: {selected_port}.")
+        elif selected_port.startswith(UDP_SCHEME):
+            log_message("INFO", f"Đang nghe UDP {selected_port} (nhận trực tiếp từ các Node).")
+        else:
+            log_message("INFO", f"Đã mở cổng Serial {selected_port} với tốc độ {BAUD_RATE} bps.")
+        log_message("INFO", "Đang chờ dữ liệu từ ESP32...")
+        log_message("INFO", f"Dữ liệu RAW từ Serial được hiển thị 1/{RAW_LOG_EVERY} dòng.")
+        log_message("INFO", "Nhấn 'Ngắt kết nối' hoặc đóng cửa sổ để dừng chương trình.")
 
         last_summary_time = time.time()
-        serial_thread = threading.Thread(target=read_serial_data_loop, daemon=True)
-        serial_thread.start()
-
-        # Initialize animations for plots (only run when connected)
-        ani_acc = FuncAnimation(fig_acc, update_acc_plot, interval=100, blit=False)
-        ani_gyro = FuncAnimation(fig_gyro, update_gyro_plot, interval=100, blit=False)
-        fig_acc_canvas.draw()
-        fig_gyro_canvas.draw()
 
-        # Clear node selection and data buffers on new connection
-        selected_node_for_plot = None
-        connected_nodes_data.clear()
-        plot_data_buffers.clear()
         update_node_selection_combobox()
         root.after(50, process_queue_loop)
-
- # Clear combobox initially
+        root.after(PLOT_INTERVAL_MS, refresh_plots) # Plots only refresh while connected
 
     except serial.SerialException as e:
         messagebox.showerror("Lỗi kết nối", f"Không thể mở cổng {selected_port}:\n{e}\nVui lòng kiểm tra:\n  - Cổng COM có đang bị sử dụng bởi chương trình khác không? (VD: Arduino IDE Serial Monitor)\n  - ESP32 đã kết nối chưa và driver đã cài đặt?")
@@ -206,6 +153,12 @@ def start_serial_read_thread():
         connect_button.config(text="Kết nối", state=tk.NORMAL)
         disconnect_button.config(state=tk.DISABLED)
         toggle_recording_buttons_state()
+    except OSError as e: # UDP: address in use / not available
+        messagebox.showerror("Lỗi kết nối", f"Không thể mở {selected_port}:\n{e}\nCổng UDP có đang bị chương trình khác sử dụng không?")
+        status_label.config(text="Không kết nối", style="Red.TLabel")
+        connect_button.config(text="Kết nối", state=tk.NORMAL)
+        disconnect_button.config(state=tk.DISABLED)
+        toggle_recording_buttons_state()
     except Exception as e:
         messagebox.showerror("Lỗi hệ thống", f"Đã xảy ra lỗi không mong muốn khi bắt đầu kết nối: {e}")
         status_label.config(text="Lỗi hệ thống", style="Red.TLabel")
@@ -214,14 +167,11 @@ def start_serial_read_thread():
         toggle_recording_buttons_state()
 
 def stop_serial_read():
-    global running, ser, serial_thread
-    global ani_acc, ani_gyro
-    global is_recording, selected_node_for_plot
-    global connected_nodes_data, plot_data_buffers
+    global running
+    global selected_node_for_plot
 
     if not running:
-        log_text.insert(tk.END, "[INFO] Chương trình đã dừng hoặc chưa kết nối.\n")
-        log_text.see(tk.END)
+        log_message("INFO", "Chương trình đã dừng hoặc chưa kết nối.")
         return
 
     # Dừng ghi dữ liệu nếu đang ghi
@@ -231,15 +181,8 @@ def stop_serial_read():
 
     running = False  # Đặt sau khi stop_recording để đảm bảo nút được xử lý đúng
 
-    # Ngắt thread đọc serial
-    if serial_thread and serial_thread.is_alive():
-        serial_thread.join(timeout=1.0)
-
-    # Đóng serial port nếu còn mở
-    if ser and ser.is_open:
-        ser.close()
-        log_text.insert(tk.END, "[INFO] Đã đóng cổng Serial.\n")
-        log_text.see(tk.END)
+    # Dừng thread đọc và đóng cổng Serial
+    engine.close()
 
     # Cập nhật giao diện
     status_label.config(text="Đã ngắt kết nối", style="Orange.TLabel")
@@ -247,363 +190,286 @@ def stop_serial_read():
     disconnect_button.config(state=tk.DISABLED)
     toggle_recording_buttons_state()
 
-    # Dừng animation nếu đang chạy
-    if ani_acc:
-        ani_acc.event_source.stop()
-        ani_acc = None
-    if ani_gyro:
-        ani_gyro.event_source.stop()
-        ani_gyro = None
-
     # Dọn dữ liệu buffer và hiển thị
+    data_queue.clear()
     connected_nodes_data.clear()
-    plot_data_buffers.clear()
     selected_node_for_plot = None
     update_data_display()
-    update_node_selection_combobox()
+    update_node_selection_combobox() # Also resets the plots to "Waiting for data..."
 
-    # Reset biểu đồ
-    if ax_acc:
-        ax_acc.clear()
-        ax_acc.set_title("Gia tốc (Accelerometer) - Waiting for data...")
-        ax_acc.set_ylabel("Giá trị")
-        ax_acc.set_xlabel("Thời gian (Điểm)")
-        global line_ax, line_ay, line_az
-        line_ax, = ax_acc.plot([], [], label='Ax')
-        line_ay, = ax_acc.plot([], [], label='Ay')
-        line_az, = ax_acc.plot([], [], label='Az')
-        ax_acc.legend()
-        ax_acc.set_ylim(-9000, 9000)
-        ax_acc.set_xlim(0, MAX_PLOT_POINTS)
-        fig_acc_canvas.draw_idle()
-
-    if ax_gyro:
-        ax_gyro.clear()
-        ax_gyro.set_title("Vận tốc góc (Gyroscope) - Waiting for data...")
-        ax_gyro.set_ylabel("Giá trị")
-        ax_gyro.set_xlabel("Thời gian (Điểm)")
-        global line_gx, line_gy, line_gz
-        line_gx, = ax_gyro.plot([], [], label='Gx')
-        line_gy, = ax_gyro.plot([], [], label='Gy')
-        line_gz, = ax_gyro.plot([], [], label='Gz')
-        ax_gyro.legend()
-        ax_gyro.set_ylim(-35000, 35000)
-        ax_gyro.set_xlim(0, MAX_PLOT_POINTS)
-        fig_gyro_canvas.draw_idle()
-
-    log_text.insert(tk.END, "[INFO] Chương trình đã dừng đọc dữ liệu Serial.\n")
-    log_text.see(tk.END)
+    log_message("INFO", "Chương trình đã dừng đọc dữ liệu Serial.")
 
 
-def read_serial_data_loop():
-    global ser, running, last_summary_time, data_queue
-    while running:
-        if ser and ser.is_open:
-            try:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    data_queue.append(line)
-                    root.after(0, process_queue_data)
-
-                current_time = time.time()
-                if current_time - last_summary_time > 5:
-                    if connected_nodes_data:
-                        root.after(0, update_summary_display)
-                    last_summary_time = current_time
-
-            except serial.SerialException as e:
-                root.after(0, lambda: log_error_and_stop(f"Lỗi Serial trong khi đọc: {e}. Vui lòng kiểm tra kết nối."))
-                break
-            except Exception as e:
-                root.after(0, lambda: log_error_and_stop(f"Lỗi không xác định trong khi đọc: {e}"))
-                break
-        else:
-            break
-        time.sleep(0.01)
+# --- Engine callbacks (called from the engine's reader/recorder threads) ---
+def on_engine_batch(batch):
+    # Chỉ đưa lô vào hàng đợi; GUI tự lấy theo chu kỳ trong process_queue_loop
+    data_queue.put((time.perf_counter(), batch))
+
+def on_engine_log(level, text):
+    # LogRing is thread-safe, the line shows up at the next flush_log_view
+    log_message(level, text)
+
+def on_engine_error(message):
+    root.after(0, lambda: log_error_and_stop(message))
 
 def process_queue_data():
-    # Xử lý các dòng dữ liệu Serial đã nhận
-    while data_queue:
+    # Xử lý các lô dữ liệu đã nhận từ engine
+    for enqueued_at, batch in data_queue.get_all():
+        started = time.perf_counter()
+        LATENCY.record("display_queue", started - enqueued_at)
         try:
-            line = data_queue.popleft()
-            process_serial_line_gui(line)
+            process_batch_gui(batch)
         except Exception as e:
-            log_text.insert(tk.END, f"[ERROR] Lỗi khi xử lý dòng dữ liệu: {e}\n")
-            log_text.see(tk.END)
+            log_message("ERROR", f"Lỗi khi xử lý dòng dữ liệu: {e}")
+        LATENCY.record("gui", time.perf_counter() - started)
 
 def process_queue_loop():
+    global last_summary_time, last_link_refresh
+    if not running:
+        return
     process_queue_data()
+    current_time = time.time()
+    if current_time - last_link_refresh > LINK_REFRESH_S:
+        # A node that stopped sending must turn "Stale" even though no batch mentions it
+        if connected_nodes_data:
+            request_data_display()
+        last_link_refresh = current_time
+    if current_time - last_summary_time > SUMMARY_INTERVAL_S:
+        if connected_nodes_data:
+            update_summary_display()
+        report_suppressed_log()
+        last_summary_time = current_time
+    if rate_controller is not None:
+        rate_controller.step()  # Does nothing until CONTROL_INTERVAL_S has passed
     root.after(50, process_queue_loop)  # Kiểm tra mỗi 50ms (phù hợp với 10Hz = 100ms)
 
 
-def parse_handshake_data(line):
-    """
-    Trích xuất node_id từ các thông điệp bắt tay (handshake).
-    Có thể là:
-    - "Received HELLO from Node ID: Sensor_1"
-    - "Sent WELCOME to IP:192.168.4.2 -> WELCOME:Sensor_1:..."
-    """
-    if "Received HELLO from Node ID:" in line:
-        try:
-            return line.split("Received HELLO from Node ID:")[1].strip()
-        except IndexError:
-            return None
-
-    elif "WELCOME:" in line:
-        try:
-            parts = line.split("WELCOME:")[1].split(":")
-            if parts:
-                return parts[0].strip()  # Node ID ở đầu
-        except IndexError:
-            return None
-
-    return None
+def process_batch_gui(batch):
+    global selected_node_for_plot, connected_nodes_data
 
+    # RAW log (sampled) and messages for non-sample lines, shown at the next flush_log_view
+    log_ring.append_many("DEBUG", [f"RAW: {line}" if line.__class__ is str else f"RAW: [frame] {line.hex(' ')}"
+                                   for line in batch.lines], "RAW")
+    for event in batch.events:
+        log_event_gui(event)
 
-def parse_wifi_client_count(line):
-    """
-    Trích xuất số lượng client WiFi từ chuỗi debug ESP32.
-    Ví dụ chuỗi: "DEBUG: WiFi SoftAP Connected Clients (WiFi layer): --- 3 clients"
-    """
-    keyword = "DEBUG: WiFi SoftAP Connected Clients"
-    if keyword in line:
-        try:
-            # Lấy phần sau dấu ":" cuối cùng, tách lấy số đầu tiên
-            tail = line.split(":")[-1]
-            count_str = tail.strip().split()[0]
-            return int(count_str)
-        except (ValueError, IndexError):
-            return None
-    return None
+    # Samples are already in engine.buffers (appended on the reader thread)
+    if not len(batch.samples) and not batch.events:
+        return
 
-def process_serial_line_gui(line):
-    global selected_node_for_plot
+    connected_nodes_data = engine.nodes_snapshot()
 
-    # Clear old lines if exceeding limit
-    current_lines = int(log_text.index('end-1c').split('.')[0])
-    if current_lines > MAX_LOG_LINES:
-        log_text.delete(1.0, float(current_lines - MAX_LOG_LINES + 1))
+    # If no node is selected for plot yet, select the first one
+    if selected_node_for_plot is None and connected_nodes_data:
+        selected_node_for_plot = next(iter(connected_nodes_data))
+        node_select_combobox.set(selected_node_for_plot) # Update combobox display
 
-    log_text.insert(tk.END, f"RAW: {line}\n")
-    log_text.see(tk.END)
+    request_data_display()
+    toggle_save_button_state() # Activate Save button if data is present
+    update_node_selection_combobox() # Update combobox with new nodes
 
-    if is_separator_line(line):
-        pass
+def log_event_gui(event):
+    kind, value, line = event
+    if kind == LINE_SEPARATOR:
+        return
+    if kind == LINE_HANDSHAKE:
+        log_message("INFO", f"HANDSHAKE: Node ID '{value}' connected.")
+    elif kind == LINE_WIFI_CLIENTS:
+        log_message("DEBUG", f"Số lượng client WiFi kết nối: {value}")
+    elif kind == LINE_UPTIME:
+        log_message("INFO", f"Server Uptime: {value} seconds")
     else:
-        node_id_handshake = parse_handshake_data(line)
-        if node_id_handshake:
-            log_text.insert(tk.END, f"  -> HANDSHAKE: Node ID '{node_id_handshake}' connected.\n")
-            log_text.see(tk.END)
-            if node_id_handshake not in connected_nodes_data:
-                connected_nodes_data[node_id_handshake] = {
-                    "ax": 0, "ay": 0, "az": 0,
-                    "gx": 0, "gy": 0, "gz": 0,
-                    "ts_us": 0,
-                    "ts_formatted": "00:00:000000",
-                    "status": "Connected (Handshake)"
-                }
-                # If no node is selected, select this new one
-                if selected_node_for_plot is None:
-                    selected_node_for_plot = node_id_handshake
-                    node_select_combobox.set(selected_node_for_plot) # Update combobox display
-                    update_node_selection_combobox() # Ensure it's in the list
-                    fig_acc_canvas.draw_idle()
-                    fig_gyro_canvas.draw_idle()
-
-            else:
-                connected_nodes_data[node_id_handshake]["status"] = "Connected (Handshake)"
-            update_data_display()
-            update_node_selection_combobox() # Update combobox with new nodes
-
-        wifi_client_count = parse_wifi_client_count(line)
-        if wifi_client_count is not None:
-            log_text.insert(tk.END, f"  -> DEBUG: Số lượng client WiFi kết nối: {wifi_client_count}\n")
-            log_text.see(tk.END)
-
-        server_uptime = parse_server_uptime(line)
-        if server_uptime is not None:
-            log_text.insert(tk.END, f"  -> INFO: Server Uptime: {server_uptime} seconds\n")
-            log_text.see(tk.END)
-
-        sensor_data = parse_sensor_data(line)
-        if not sensor_data:
-            log_text.insert(tk.END, f"[WARN] Không parse được sensor data từ dòng:\n  {line}\n")
-            log_text.see(tk.END)
-            return
+        log_message("WARN", f"Không parse được sensor data từ dòng:\n  {line}", "UNPARSED")
+
+def log_message(level, text, category=None):
+    log_ring.append(level, f"[{level}] {text}", category)
+
+def flush_log_view():
+    # Một lần insert/trim/see cho tất cả dòng log mới, thay vì mỗi dòng
+    lines = log_ring.drain()
+    if lines:
+        log_text.insert(tk.END, "\n".join(lines) + "\n")
+        current_lines = int(log_text.index('end-1c').split('.')[0])
+        if current_lines > MAX_LOG_LINES:
+            log_text.delete(1.0, float(current_lines - MAX_LOG_LINES + 1))
+        log_text.see(tk.END)
+    root.after(LOG_REFRESH_MS, flush_log_view)
 
-        if "id" not in sensor_data:
-            log_text.insert(tk.END, f"[ERROR] Dữ liệu thiếu 'id': {sensor_data}\n")
-            log_text.see(tk.END)
-            return
+def report_suppressed_log():
+    counts = log_ring.take_suppressed()
+    if counts:
+        summary = ", ".join(f"{category}: {count}" for category, count in sorted(counts.items()))
+        log_message("INFO", f"Số dòng log đã ẩn trong {SUMMARY_INTERVAL_S}s - {summary}")
 
-        if sensor_data:
-            node_id = sensor_data["id"]
-            ts_microseconds = sensor_data.pop('ts')
-
-            ts_formatted_str = format_microseconds_to_mmss_us(ts_microseconds)
-
-            node_current_data = {
-                'id': node_id,
-                'ax': sensor_data['ax'], 'ay': sensor_data['ay'], 'az': sensor_data['az'],
-                'gx': sensor_data['gx'], 'gy': sensor_data['gy'], 'gz': sensor_data['gz'],
-                'ts_us': ts_microseconds,
-                'ts_formatted': ts_formatted_str,
-                "status": "Active"
-            }
-            connected_nodes_data[node_id] = node_current_data
-
-            # Initialize plot buffer for new nodes
-            if node_id not in plot_data_buffers:
-                plot_data_buffers[node_id] = {
-                    "ax": collections.deque(maxlen=MAX_PLOT_POINTS),
-                    "ay": collections.deque(maxlen=MAX_PLOT_POINTS),
-                    "az": collections.deque(maxlen=MAX_PLOT_POINTS),
-                    "gx": collections.deque(maxlen=MAX_PLOT_POINTS),
-                    "gy": collections.deque(maxlen=MAX_PLOT_POINTS),
-                    "gz": collections.deque(maxlen=MAX_PLOT_POINTS),
-                }
-
-            # Append all sensor data to their respective node's buffer
-            plot_data_buffers[node_id]["ax"].append(sensor_data['ax'])
-            plot_data_buffers[node_id]["ay"].append(sensor_data['ay'])
-            plot_data_buffers[node_id]["az"].append(sensor_data['az'])
-            plot_data_buffers[node_id]["gx"].append(sensor_data['gx'])
-            plot_data_buffers[node_id]["gy"].append(sensor_data['gy'])
-            plot_data_buffers[node_id]["gz"].append(sensor_data['gz'])
-
-            # If no node is selected for plot yet, select this one
-            if selected_node_for_plot is None:
-                selected_node_for_plot = node_id
-                node_select_combobox.set(selected_node_for_plot) # Update combobox display
-                update_node_selection_combobox() # Ensure it's in the list
-                fig_acc_canvas.draw_idle()
-                fig_gyro_canvas.draw_idle()
-
-            # Add data to recording queue if recording is active
-            if is_recording:
-                recording_queue.append(node_current_data)
-
-            update_data_display()
-            toggle_save_button_state() # Activate Save button if data is present
-            update_node_selection_combobox() # Update combobox with new nodes
+def request_data_display():
+    # Gom các lần cập nhật bảng lại, tối đa TABLE_REFRESH_HZ lần mỗi giây
+    global table_refresh_pending
+    if not table_refresh_pending:
+        table_refresh_pending = True
+        root.after(int(1000 / TABLE_REFRESH_HZ), update_data_display)
 
 def update_data_display():
-    print(">>> Updating data display...")
-    for item in data_tree.get_children():
-        data_tree.delete(item)
-
+    global table_refresh_pending
+    table_refresh_pending = False
+    if DEBUG:
+        print(">>> Updating data display...")
+
+    # Remove rows of nodes that are gone
+    for node_id in list(displayed_rows):
+        if node_id not in connected_nodes_data:
+            data_tree.delete(node_id)
+            del displayed_rows[node_id]
+
+    # Insert new nodes, update only the rows whose values changed
+    link = engine.link_stats.snapshot()
+    reps = rep_monitor.snapshot() if rep_monitor is not None else {}
     for node_id, data in connected_nodes_data.items():
-        print(f">>> Inserting node: {node_id} | data = {data}")
-        data_tree.insert("", tk.END, iid=node_id, values=(
+        status = data.get('status', 'Unknown')
+        m = link.get(node_id)
+        if m is not None and m['status'] != STATUS_OK and status == STATUS_OK:
+            status = m['status'] # "Degraded" / "Stale" instead of "Active"
+        values = (
             node_id,
-            data.get('status', 'Unknown'),
+            status,
             f"{data['ax']:.2f}", f"{data['ay']:.2f}", f"{data['az']:.2f}",
             f"{data['gx']:.2f}", f"{data['gy']:.2f}", f"{data['gz']:.2f}",
             data['ts_formatted'],
-            data['ts_us']
-        ))
+            data['ts_us'],
+        ) + format_link_columns(m) + format_rep_columns(reps.get(node_id))
+        shown = displayed_rows.get(node_id)
+        if shown == values:
+            continue
+        if DEBUG:
+            print(f">>> {'Updating' if shown else 'Inserting'} node: {node_id} | data = {data}")
+        if shown is None:
+            data_tree.insert("", tk.END, iid=node_id, values=values)
+        else:
+            data_tree.item(node_id, values=values)
+        displayed_rows[node_id] = values
+
+def format_link_columns(m):
+    if m is None:
+        return ("", "", "", "", "", "")
+    return (
+        f"{m['rate_hz']:.1f}",
+        f"{m['jitter_ms']:.1f}",
+        f"{m['gaps']} ({m['max_gap_s']:.1f}s)" if m['gaps'] else "0",
+        f"{m['out_of_order']}/{m['duplicates']}",
+        m['parse_failures'],
+        f"{m['bytes_per_s']:.0f}",
+    )
+
+def format_rep_columns(r):
+    # Số lần đạp của hiệp hiện tại và lần đạp có biên độ lớn nhất trong hiệp
+    if r is None:
+        return ("", "")
+    return (
+        f"{r['reps']} (hiệp {r['set']})",
+        f"{r['best_amplitude']:.2f} (lần {r['best_rep']})" if r['best_rep'] is not None else "",
+    )
 
 def update_summary_display():
     # Summary data is now primarily in the Treeview and can be written to file.
-    pass
+    recorder = engine.recorder
+    if recorder is not None:
+        s = recorder.stats()
+        log_message("INFO", f"Ghi dữ liệu: {s['rows_written']} dòng, {s['rows_dropped']} bị bỏ, "
+                            f"{s['queued_rows']} đang chờ, độ trễ ghi {s['latency_ms_last']:.0f} ms "
+                            f"(max {s['latency_ms_max']:.0f} ms)")
+        if s['queue']['dropped'] or s['queue']['spilled'] or s['queue']['blocked_s']:
+            log_message("WARN", "Hàng đợi " + format_queue_stats(s['queue']))
+    display = data_queue.stats()
+    if display['dropped']:
+        log_message("WARN", "Hàng đợi " + format_queue_stats(display))
+    if SUPERVISE and engine.supervisor is not None:
+        for line in format_health(engine.supervisor.health()):
+            log_message("INFO", line)
+    if LINK_STATS_PATH:
+        try:
+            write_snapshot(LINK_STATS_PATH, engine.link_stats.snapshot(), engine.link_stats.unattributed_failures)
+        except OSError as e:
+            log_message("ERROR", f"Không thể ghi thống kê kết nối vào {LINK_STATS_PATH}: {e}")
+    for node_id, t in (engine.timestamp_stats() or {}).items():
+        log_message("INFO", f"Timestamp {node_id}: {t['outliers']} điểm lệch, {t['steps']} bước nhảy, "
+                            f"{t['discontinuities']} gián đoạn, trôi {t['drift_ppm']:.0f} ppm")
 
 def log_error_and_stop(message):
-    log_text.insert(tk.END, f"[ERROR] {message}\n")
-    log_text.see(tk.END)
+    log_message("ERROR", message)
     stop_serial_read()
 
 def on_closing():
     if messagebox.askokcancel("Thoát", "Bạn có chắc chắn muốn thoát không?"):
         stop_serial_read()
+        if profiler.running:
+            profiler.stop()
+            dump_profile()
         root.destroy()
 
+# --- Latency histograms and sampling profiler (see latency.py) ---
+def dump_latency():
+    # Ghi histogram độ trễ từng công đoạn (và profile nếu đang bật) vào thư mục ghi dữ liệu
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    try:
+        path = LATENCY.dump(os.path.join(output_directory, f"latency_{stamp}.json"))
+        for line in format_latency(LATENCY.snapshot()):
+            log_message("INFO", line)
+        log_message("INFO", f"Đã lưu histogram độ trễ vào: {path}")
+        if profiler.samples:
+            dump_profile(stamp)
+    except IOError as e:
+        log_message("ERROR", f"Không thể lưu histogram độ trễ: {e}")
+
+def dump_profile(stamp=None):
+    stamp = stamp or time.strftime("%Y%m%d_%H%M%S")
+    try:
+        path = profiler.dump(os.path.join(output_directory, f"profile_{stamp}.folded"))
+        log_message("INFO", f"Đã lưu profile ({profiler.samples} mẫu) vào: {path}")
+    except IOError as e:
+        log_message("ERROR", f"Không thể lưu profile: {e}")
+
+def toggle_profiler():
+    if profiler_var.get():
+        profiler.start()
+        log_message("INFO", f"Đã bật sampling profiler (mỗi {profiler.interval * 1000:.0f} ms).")
+    else:
+        profiler.stop()
+        log_message("INFO", f"Đã tắt sampling profiler ({profiler.samples} mẫu).")
+
 # --- Matplotlib Plotting Functions ---
 def setup_plots():
-    global fig_acc, ax_acc, line_ax, line_ay, line_az, fig_gyro, ax_gyro, line_gx, line_gy, line_gz
-
-    # Figure for Accelerometer
-    fig_acc = plt.Figure(figsize=(6, 4), dpi=100)
-    ax_acc = fig_acc.add_subplot(111)
-    ax_acc.set_title("Gia tốc (Accelerometer) - Waiting for data...")
-    ax_acc.set_ylabel("Giá trị")
-    ax_acc.set_xlabel("Thời gian (Điểm)")
-    line_ax, = ax_acc.plot([], [], label='Ax')
-    line_ay, = ax_acc.plot([], [], label='Ay')
-    line_az, = ax_acc.plot([], [], label='Az')
-    ax_acc.legend()
-    ax_acc.set_ylim(-9000, 9000)
-    ax_acc.set_xlim(0, MAX_PLOT_POINTS)
-
-    # Figure for Gyroscope
-    fig_gyro = plt.Figure(figsize=(6, 4), dpi=100)
-    ax_gyro = fig_gyro.add_subplot(111)
-    ax_gyro.set_title("Vận tốc góc (Gyroscope) - Waiting for data...")
-    ax_gyro.set_ylabel("Giá trị")
-    ax_gyro.set_xlabel("Thời gian (Điểm)")
-    line_gx, = ax_gyro.plot([], [], label='Gx')
-    line_gy, = ax_gyro.plot([], [], label='Gy')
-    line_gz, = ax_gyro.plot([], [], label='Gz')
-    ax_gyro.legend()
-    ax_gyro.set_ylim(-35000, 35000)
-    ax_gyro.set_xlim(0, MAX_PLOT_POINTS)
-
-def update_acc_plot(frame):
-    """Update accelerometer plot for the selected node."""
-    if selected_node_for_plot and selected_node_for_plot in plot_data_buffers:
-        data = plot_data_buffers[selected_node_for_plot]
-        x_data = list(range(len(data["ax"])))
-        y_ax_data = list(data["ax"])
-        y_ay_data = list(data["ay"])
-        y_az_data = list(data["az"])
-
-        line_ax.set_data(x_data, y_ax_data)
-        line_ay.set_data(x_data, y_ay_data)
-        line_az.set_data(x_data, y_az_data)
-
-        all_y_data = y_ax_data + y_ay_data + y_az_data
-        if all_y_data:
-            min_val = np.min(all_y_data)
-            max_val = np.max(all_y_data)
-            padding = (max_val - min_val) * 0.1 if (max_val - min_val) != 0 else 1
-            ax_acc.set_ylim(min_val - padding, max_val + padding)
-
-        if x_data:
-            ax_acc.set_xlim(x_data[0], x_data[-1] + 1)
-        else:
-            ax_acc.set_xlim(0, MAX_PLOT_POINTS)
-
-        ax_acc.set_title(f"Gia tốc (Accelerometer) - Node: {selected_node_for_plot}")
-        return line_ax, line_ay, line_az
-    return []
-
-def update_gyro_plot(frame):
-    """Update gyroscope plot for the selected node."""
-    if selected_node_for_plot and selected_node_for_plot in plot_data_buffers:
-        data = plot_data_buffers[selected_node_for_plot]
-        x_data = list(range(len(data["gx"])))
-        y_gx_data = list(data["gx"])
-        y_gy_data = list(data["gy"])
-        y_gz_data = list(data["gz"])
-
-        line_gx.set_data(x_data, y_gx_data)
-        line_gy.set_data(x_data, y_gy_data)
-        line_gz.set_data(x_data, y_gz_data)
-
-        all_y_data = y_gx_data + y_gy_data + y_gz_data
-        if all_y_data:
-            min_val = np.min(all_y_data)
-            max_val = np.max(all_y_data)
-            padding = (max_val - min_val) * 0.1 if (max_val - min_val) != 0 else 1
-            ax_gyro.set_ylim(min_val - padding, max_val + padding)
-
-        if x_data:
-            ax_gyro.set_xlim(x_data[0], x_data[-1] + 1)
-        else:
-            ax_gyro.set_xlim(0, MAX_PLOT_POINTS)
+    global fig_acc, fig_gyro
+    # Axes and lines are created by the SignalPanels once the canvases exist
+    fig_acc = Figure(figsize=(6, 4), dpi=100)
+    fig_gyro = Figure(figsize=(6, 4), dpi=100)
+
+def setup_plot_panels():
+    global acc_panel, gyro_panel
+    acc_panel = SignalPanel(fig_acc, fig_acc_canvas, "Gia tốc (Accelerometer)", ["Ax", "Ay", "Az"],
+                            ACC_COLUMNS, MAX_PLOT_POINTS, (-9000, 9000))
+    gyro_panel = SignalPanel(fig_gyro, fig_gyro_canvas, "Vận tốc góc (Gyroscope)", ["Gx", "Gy", "Gz"],
+                             GYRO_COLUMNS, MAX_PLOT_POINTS, (-35000, 35000))
+
+def get_plot_window(node_id):
+    # Zero-copy view of the newest samples of the node
+    return engine.buffers.last_values(node_id, MAX_PLOT_POINTS)
+
+def configure_plot_nodes():
+    """Show the selected node, or every known node when "Tất cả Node" is ticked."""
+    if show_all_nodes_var is not None and show_all_nodes_var.get():
+        node_ids = sorted(connected_nodes_data)
+    else:
+        node_ids = [selected_node_for_plot] if selected_node_for_plot else []
+    acc_panel.set_nodes(node_ids)
+    gyro_panel.set_nodes(node_ids)
 
-        ax_gyro.set_title(f"Vận tốc góc (Gyroscope) - Node: {selected_node_for_plot}")
-        return line_gx, line_gy, line_gz
-    return []
+def refresh_plots():
+    if not running:
+        return
+    started = time.perf_counter()
+    acc_panel.update(get_plot_window)
+    gyro_panel.update(get_plot_window)
+    LATENCY.record("plot", time.perf_counter() - started)
+    root.after(PLOT_INTERVAL_MS, refresh_plots)
 
 # --- Functions to remember and load directory ---
 def save_last_directory(directory_path):
@@ -629,30 +495,12 @@ def select_output_directory():
     if folder_selected:
         output_directory = folder_selected
         output_dir_label.config(text=f"Thư mục: {output_directory}")
-        log_text.insert(tk.END, f"[INFO] Thư mục lưu dữ liệu được chọn: {output_directory}\n")
-        log_text.see(tk.END)
+        log_message("INFO", f"Thư mục lưu dữ liệu được chọn: {output_directory}")
         toggle_recording_buttons_state()
         save_last_directory(output_directory)
 
-def get_output_filename(sensor_id, base_name):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{sensor_id}_{base_name}_{timestamp}.csv"
-    return os.path.join(output_directory, filename)
-
-def recording_worker():
-    while not recording_thread_stop.is_set() or recording_queue:
-        try:
-            data = recording_queue.popleft()
-            write_data_to_file(data['id'], data)
-        except IndexError:
-            time.sleep(0.005)  # Không có dữ liệu thì nghỉ nhẹ
-        except Exception as e:
-            log_text.insert(tk.END, f"[ERROR] Thread ghi file lỗi: {e}\n")
-            log_text.see(tk.END)
-
-
 def start_recording_data():
-    global is_recording, active_recording_file_handles, recording_thread, recording_thread_stop
+    global is_recording
 
     if not running:
         messagebox.showwarning("Cảnh báo", "Vui lòng kết nối thiết bị trước khi ghi dữ liệu.")
@@ -666,115 +514,35 @@ def start_recording_data():
     if not output_directory or not os.path.isdir(output_directory):
         try:
             os.makedirs(output_directory, exist_ok=True)
-            log_text.insert(tk.END, f"[INFO] Đã tạo thư mục lưu dữ liệu: {output_directory}\n")
+            log_message("INFO", f"Đã tạo thư mục lưu dữ liệu: {output_directory}")
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể tạo thư mục:\n{e}")
             return
 
+    # Tên file và thư mục được chốt lúc bắt đầu, thread ghi không đọc lại GUI
+    try:
+        engine.start_recording(output_directory, base_file_name, record_format=RECORD_FORMAT,
+                               queue_policy=RECORD_QUEUE_POLICY)
+    except (OSError, ValueError) as e:
+        log_message("ERROR", f"Không thể bắt đầu ghi dữ liệu: {e}")
+        messagebox.showerror("Lỗi", f"Không thể bắt đầu ghi dữ liệu:\n{e}")
+        return
     is_recording = True
-    active_recording_file_handles.clear()
     record_button.config(text="Dừng Ghi", command=stop_recording_data, state=tk.NORMAL)
     save_current_data_button.config(state=tk.DISABLED)
-    log_text.insert(tk.END, "[INFO] Đã bắt đầu ghi dữ liệu.\n")
-    log_text.see(tk.END)
     toggle_recording_buttons_state()
 
-    # Bắt đầu thread ghi
-    recording_thread_stop.clear()
-    recording_thread = threading.Thread(target=recording_worker, daemon=True)
-    recording_thread.start()
-
-
 
 def stop_recording_data():
-    global is_recording, active_recording_file_handles, recording_thread, recording_thread_stop
+    global is_recording
     is_recording = False
 
-    # Kết thúc thread ghi an toàn
-    recording_thread_stop.set()
-    if recording_thread is not None:
-        recording_thread.join(timeout=5)
+    # Kết thúc thread ghi an toàn và đóng file
+    engine.stop_recording()
 
-    # Đóng file
-    for sensor_id, file_handle in list(active_recording_file_handles.items()):
-        try:
-            file_handle.close()
-            log_text.insert(tk.END, f"[INFO] Đã đóng file ghi dữ liệu cho Node '{sensor_id}'.\n")
-        except Exception as e:
-            log_text.insert(tk.END, f"[ERROR] Lỗi khi đóng file cho Node '{sensor_id}': {e}\n")
-        finally:
-            del active_recording_file_handles[sensor_id]
-
-    recording_queue.clear()
     record_button.config(text="Bắt đầu Ghi", command=start_recording_data)
-    log_text.insert(tk.END, "[INFO] Đã dừng ghi dữ liệu. Tất cả file đã được đóng.\n")
     toggle_recording_buttons_state()
-    toggle_save_button_state()
- # Re-enable Save button after stopping recording
-
-def write_data_to_file(sensor_id, data):
-    global is_recording, active_recording_file_handles
-
-    if not is_recording:
-        return
-
-    base_file_name = file_name_entry.get().strip()
-    if not base_file_name:
-        log_text.insert(tk.END, f"[ERROR] Không có tên file để ghi dữ liệu cho Node '{sensor_id}'.\n")
-        log_text.see(tk.END)
-        return
-
-    # Mở file nếu chưa mở cho node này
-    if sensor_id not in active_recording_file_handles:
-        output_path= get_output_filename(sensor_id, base_file_name)
-        if not output_path:
-            log_text.insert(tk.END, f"[ERROR] Đường dẫn file không hợp lệ cho Node '{sensor_id}'.\n")
-            log_text.see(tk.END)
-            return
-
-        try:
-            file_handle = open(output_path, 'a', encoding='utf-8')
-
-            # Ghi header nếu file mới
-            if os.path.getsize(output_path) == 0:
-                header = "ID,Status,AccX,AccY,AccZ,GyroX,GyroY,GyroZ,Timestamp,Timestamp_us\n"
-                file_handle.write(header)
-
-            active_recording_file_handles[sensor_id] = file_handle
-
-            log_text.insert(tk.END, f"[INFO] Đã tạo file ghi dữ liệu cho Node '{sensor_id}': {output_path}\n")
-            log_text.see(tk.END)
-        except IOError as e:
-            log_text.insert(tk.END, f"[ERROR] Không thể mở file để ghi cho Node '{sensor_id}': {e}\n")
-            log_text.see(tk.END)
-            return
-
-    # Ghi 1 dòng dữ liệu CSV
-    file_handle = active_recording_file_handles[sensor_id]
-    try:
-        csv_line = (
-            f"{data['id']},"
-            f"{data.get('status', 'Active')},"
-            f"{data['ax']:.2f},"
-            f"{data['ay']:.2f},"
-            f"{data['az']:.2f},"
-            f"{data['gx']:.2f},"
-            f"{data['gy']:.2f},"
-            f"{data['gz']:.2f},"
-            f"{data['ts_formatted']},"
-            f"{data['ts_us']}\n"
-        )
-        file_handle.write(csv_line)
-        file_handle.flush()
-    except Exception as e:
-        log_text.insert(tk.END, f"[ERROR] Ghi dữ liệu vào file lỗi cho Node '{sensor_id}': {e}\n")
-        log_text.see(tk.END)
-        try:
-            file_handle.close()
-            del active_recording_file_handles[sensor_id]
-        except Exception as close_error:
-            log_text.insert(tk.END, f"[ERROR] Không thể đóng file lỗi: {close_error}\n")
-            log_text.see(tk.END)
+    toggle_save_button_state() # Re-enable Save button after stopping recording
 
 def save_current_treeview_data():
     def worker():
@@ -790,21 +558,20 @@ def save_current_treeview_data():
         if not output_directory or not os.path.isdir(output_directory):
             try:
                 os.makedirs(output_directory, exist_ok=True)
-                root.after(0, lambda: log_text.insert(tk.END, f"[INFO] Đã tạo thư mục: {output_directory}\n"))
+                log_message("INFO", f"Đã tạo thư mục: {output_directory}")
             except Exception as e:
                 root.after(0, lambda: messagebox.showerror("Lỗi", f"Không thể tạo thư mục:\n{e}"))
                 return
 
         for node_id, data in connected_nodes_data.items():
-            save_path = get_output_filename(node_id, base_file_name)
+            save_path = get_output_filename(output_directory, node_id, base_file_name)
             if not save_path:
-                root.after(0, lambda nid=node_id: log_text.insert(tk.END, f"[ERROR] Đường dẫn file không hợp lệ cho Node '{nid}'.\n"))
+                log_message("ERROR", f"Đường dẫn file không hợp lệ cho Node '{node_id}'.")
                 continue
 
             try:
                 with open(save_path, 'w', encoding='utf-8') as f:
-                    header = "ID,Status,AccX,AccY,AccZ,GyroX,GyroY,GyroZ,Timestamp,Timestamp_us\n"
-                    f.write(header)
+                    f.write(CSV_HEADER)
                     csv_line = (
                         f"{data['id']},{data.get('status', 'Active')},"
                         f"{data['ax']:.2f},{data['ay']:.2f},{data['az']:.2f},"
@@ -812,15 +579,13 @@ def save_current_treeview_data():
                         f"{data['ts_formatted']},{data['ts_us']}\n"
                     )
                     f.write(csv_line)
-                root.after(0, lambda nid=node_id, path=save_path:
-                           log_text.insert(tk.END, f"[INFO] Dữ liệu Node '{nid}' đã được lưu vào: {path}\n"))
+                log_message("INFO", f"Dữ liệu Node '{node_id}' đã được lưu vào: {save_path}")
             except Exception as e:
                 root.after(0, lambda nid=node_id:
                            messagebox.showerror("Lỗi lưu file", f"Không thể lưu dữ liệu cho Node '{nid}':\n{e}"))
                 continue
 
-        root.after(0, lambda: [log_text.see(tk.END),
-                               messagebox.showinfo("Thành công", f"Dữ liệu hiện tại của các Sensor Node đã được lưu vào:\n{output_directory}")])
+        root.after(0, lambda: messagebox.showinfo("Thành công", f"Dữ liệu hiện tại của các Sensor Node đã được lưu vào:\n{output_directory}"))
 
     threading.Thread(target=worker, daemon=True).start()
 # --- Toggle Button States ---
@@ -874,214 +639,298 @@ def update_node_selection_combobox():
         selected_node_for_plot = None
         node_select_combobox.set("Chọn Node")
         node_select_combobox.config(state="disabled")
+    configure_plot_nodes() # No-op when the displayed nodes did not change
 
 
 def on_node_selected_for_plot(event):
-    global ani_acc, ani_gyro, selected_node_for_plot
+    global selected_node_for_plot
     node = node_select_combobox.get()
 
     if node not in connected_nodes_data:
         return  # Node không tồn tại, bỏ qua
 
+    # Chỉ đổi node hiển thị, vòng lặp refresh_plots vẫn chạy như cũ
     selected_node_for_plot = node
-
-    # Dừng animation cũ
-    if ani_acc: ani_acc.event_source.stop()
-    if ani_gyro: ani_gyro.event_source.stop()
-
-    # Nếu đang chạy, khởi động lại vẽ
-    if running:
-        ani_acc = FuncAnimation(fig_acc, update_acc_plot, interval=100, blit=False)
-        ani_gyro = FuncAnimation(fig_gyro, update_gyro_plot, interval=100, blit=False)
-
-    fig_acc_canvas.draw_idle()
-    fig_gyro_canvas.draw_idle()
+    configure_plot_nodes()
 
 
 
 # --- GUI Setup ---
-root = tk.Tk()
-root.title("ESP32 Sensor Data Reader with Plotting & Recording")
-root.state('zoomed') # Open in full screen (Windows)
-
-style = ttk.Style()
-style.configure("Red.TLabel", foreground="red")
-style.configure("Green.TLabel", foreground="green")
-style.configure("Orange.TLabel", foreground="orange")
-
-# Configure Grid for root window
-root.grid_rowconfigure(0, weight=0) # Toolbar Frame (no expansion)
-root.grid_rowconfigure(1, weight=0) # Log Frame (no expansion)
-root.grid_rowconfigure(2, weight=1) # Main Content Frame (expands and fills remaining space)
-root.grid_columnconfigure(0, weight=1) # Single column occupies full width
-
-# --- Toolbar Frame (Row 0) ---
-toolbar_frame = ttk.LabelFrame(root, text="Điều khiển & Ghi dữ liệu")
-toolbar_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=5)
-
-# Configure grid for toolbar_frame (more columns for new elements)
-toolbar_frame.grid_columnconfigure(0, weight=0) # "Cổng COM:" label
-toolbar_frame.grid_columnconfigure(1, weight=0) # com_port_combobox
-toolbar_frame.grid_columnconfigure(2, weight=0) # "Select Node:" label
-toolbar_frame.grid_columnconfigure(3, weight=0) # node_select_combobox
-toolbar_frame.grid_columnconfigure(4, weight=0) # "Tên File:" label
-toolbar_frame.grid_columnconfigure(5, weight=1) # file_name_entry (expands)
-toolbar_frame.grid_columnconfigure(6, weight=0) # Select Dir button
-toolbar_frame.grid_columnconfigure(7, weight=0) # Dir Label
-toolbar_frame.grid_columnconfigure(8, weight=0) # Connect button
-toolbar_frame.grid_columnconfigure(9, weight=0) # Disconnect button
-toolbar_frame.grid_columnconfigure(10, weight=0) # Start/Stop Record button
-toolbar_frame.grid_columnconfigure(11, weight=0) # Save Current Data button
-toolbar_frame.grid_columnconfigure(12, weight=0) # Exit button
-toolbar_frame.grid_columnconfigure(13, weight=0) # Status Label
-
-# Widgets in Toolbar Frame
-com_port_label = ttk.Label(toolbar_frame, text="Cổng COM:")
-com_port_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
-
-com_port_combobox = ttk.Combobox(toolbar_frame, state="readonly", width=15)
-com_port_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-
-# Node Selection Combobox
-node_select_label = ttk.Label(toolbar_frame, text="Chọn Node:")
-node_select_label.grid(row=0, column=2, padx=(10, 5), pady=5, sticky="w")
-
-node_select_combobox = ttk.Combobox(toolbar_frame, state="disabled", width=15)
-node_select_combobox.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
-node_select_combobox.set("Không có Node")
-node_select_combobox.bind("<<ComboboxSelected>>", on_node_selected_for_plot)
-
-
-ttk.Label(toolbar_frame, text="Tên File:").grid(row=0, column=4, padx=(10, 5), pady=5, sticky="w")
-file_name_entry = ttk.Entry(toolbar_frame, width=30)
-file_name_entry.grid(row=0, column=5, padx=5, pady=5, sticky="ew")
-file_name_entry.insert(0, "sensor_data") # Default file name
-
-select_dir_button = ttk.Button(toolbar_frame, text="Mở Thư mục", command=select_output_directory)
-select_dir_button.grid(row=0, column=6, padx=5, pady=5)
-
-output_dir_label = ttk.Label(toolbar_frame, text=f"Thư mục: {output_directory}", wraplength=200)
-output_dir_label.grid(row=0, column=7, padx=5, pady=5, sticky="w")
-
-# Connection Control Buttons
-connect_button = ttk.Button(toolbar_frame, text="Kết nối", command=start_serial_read_thread)
-connect_button.grid(row=0, column=8, padx=(10, 2), pady=5)
-
-disconnect_button = ttk.Button(toolbar_frame, text="Ngắt kết nối", command=stop_serial_read, state=tk.DISABLED)
-disconnect_button.grid(row=0, column=9, padx=(2, 10), pady=5)
-
-# Data Recording Control Buttons
-record_button = ttk.Button(toolbar_frame, text="Bắt đầu Ghi", command=start_recording_data, state=tk.DISABLED)
-record_button.grid(row=0, column=10, padx=(10, 2), pady=5)
-
-save_current_data_button = ttk.Button(toolbar_frame, text="Lưu dữ liệu hiện tại", command=save_current_treeview_data, state=tk.DISABLED)
-save_current_data_button.grid(row=0, column=11, padx=(2, 10), pady=5)
-
-exit_button = ttk.Button(toolbar_frame, text="Thoát", command=on_closing)
-exit_button.grid(row=0, column=12, padx=(10, 5), pady=5)
-
-status_label = ttk.Label(toolbar_frame, text="Không kết nối", style="Red.TLabel")
-status_label.grid(row=0, column=13, padx=10, pady=5, sticky="e")
-
-
-# --- Log Frame (Row 1) ---
-log_frame = ttk.LabelFrame(root, text="Serial Log (Dữ liệu RAW và thông báo hệ thống)")
-log_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=5)
-
-log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=8, font=("Consolas", 9))
-log_text.pack(padx=5, pady=5, fill=tk.BOTH, expand=True)
-log_text.insert(tk.END, "Chào mừng! Chọn cổng COM và nhấn 'Kết nối' để bắt đầu.\n")
-log_text.see(tk.END)
-
-
-# --- Main Content Frame (Row 2, Column 0) ---
-main_content_frame = ttk.Frame(root)
-main_content_frame.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
-
-# Configure Grid for main_content_frame
-main_content_frame.grid_columnconfigure(0, weight=1) # Left column (Treeview)
-main_content_frame.grid_columnconfigure(1, weight=2) # Right column (plots) will be twice as wide
-main_content_frame.grid_rowconfigure(0, weight=1) # Single row, expands
-
-# Left Column (Treeview)
-left_column_frame = ttk.Frame(main_content_frame)
-left_column_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
-left_column_frame.grid_rowconfigure(0, weight=1)
-left_column_frame.grid_columnconfigure(0, weight=1)
-
-# Data Treeview Frame
-data_frame = ttk.LabelFrame(left_column_frame, text="Dữ liệu Sensor Node")
-data_frame.grid(row=0, column=0, sticky="nsew", pady=5)
-
-columns = ("ID", "Trạng thái", "AccX", "AccY", "AccZ", "GyroX", "GyroY", "GyroZ", "Timestamp", "Timestamp_us")
-data_tree = ttk.Treeview(data_frame, columns=columns, show="headings")
-
-for col in columns:
-    data_tree.heading(col, text=col)
-    data_tree.column(col, width=80, anchor=tk.CENTER)
-
-data_tree.column("ID", width=70)
-data_tree.column("Trạng thái", width=90)
-data_tree.column("AccX", width=55)
-data_tree.column("AccY", width=55)
-data_tree.column("AccZ", width=55)
-data_tree.column("GyroX", width=55)
-data_tree.column("GyroY", width=55)
-data_tree.column("GyroZ", width=55)
-data_tree.column("Timestamp", width=110)
-data_tree.column("Timestamp_us", width=80)
-
-data_tree.pack(padx=5, pady=5, fill=tk.BOTH, expand=True)
-
-# Right Column (Plots)
-right_column_frame = ttk.Frame(main_content_frame)
-right_column_frame.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
-
-# Configure Grid for right_column_frame to split 2 plots
-right_column_frame.grid_rowconfigure(0, weight=1)
-right_column_frame.grid_rowconfigure(1, weight=1)
-right_column_frame.grid_columnconfigure(0, weight=1)
-
-# Setup Matplotlib figures
-setup_plots()
-
-# Accelerometer Plot Frame
-acc_plot_frame = ttk.LabelFrame(right_column_frame, text="Đồ thị Gia tốc (Accelerometer)")
-acc_plot_frame.grid(row=0, column=0, sticky="nsew", pady=5)
-fig_acc_canvas = FigureCanvasTkAgg(fig_acc, master=acc_plot_frame)
-fig_acc_canvas_widget = fig_acc_canvas.get_tk_widget()
-fig_acc_canvas_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-# Gyroscope Plot Frame
-gyro_plot_frame = ttk.LabelFrame(right_column_frame, text="Đồ thị Vận tốc góc (Gyroscope)")
-gyro_plot_frame.grid(row=1, column=0, sticky="nsew", pady=5)
-fig_gyro_canvas = FigureCanvasTkAgg(fig_gyro, master=gyro_plot_frame)
-fig_gyro_canvas_widget = fig_gyro_canvas.get_tk_widget()
-fig_gyro_canvas_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-
-
-# --- Initialize GUI Application ---
-# Load last selected directory, or use current script directory
-last_dir = load_last_directory()
-if last_dir and os.path.isdir(last_dir):
-    output_directory = last_dir
-
-# Create default directory if it doesn't exist
-if not os.path.exists(output_directory):
-    os.makedirs(output_directory)
+def build_gui():
+    global root, com_port_combobox, node_select_combobox, file_name_entry, select_dir_button
+    global output_dir_label, connect_button, disconnect_button, record_button, save_current_data_button
+    global status_label, log_text, data_tree, fig_acc_canvas, fig_gyro_canvas, output_directory
+    global show_all_nodes_var, profiler_var
+
+    root = tk.Tk()
+    root.title("ESP32 Sensor Data Reader with Plotting & Recording")
+    root.state('zoomed') # Open in full screen (Windows)
+
+    style = ttk.Style()
+    style.configure("Red.TLabel", foreground="red")
+    style.configure("Green.TLabel", foreground="green")
+    style.configure("Orange.TLabel", foreground="orange")
+
+    # Configure Grid for root window
+    root.grid_rowconfigure(0, weight=0) # Toolbar Frame (no expansion)
+    root.grid_rowconfigure(1, weight=0) # Log Frame (no expansion)
+    root.grid_rowconfigure(2, weight=1) # Main Content Frame (expands and fills remaining space)
+    root.grid_columnconfigure(0, weight=1) # Single column occupies full width
+
+    # --- Toolbar Frame (Row 0) ---
+    toolbar_frame = ttk.LabelFrame(root, text="Điều khiển & Ghi dữ liệu")
+    toolbar_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=5)
+
+    # Configure grid for toolbar_frame (more columns for new elements)
+    toolbar_frame.grid_columnconfigure(0, weight=0) # "Cổng COM:" label
+    toolbar_frame.grid_columnconfigure(1, weight=0) # com_port_combobox
+    toolbar_frame.grid_columnconfigure(2, weight=0) # "Select Node:" label
+    toolbar_frame.grid_columnconfigure(3, weight=0) # node_select_combobox
+    toolbar_frame.grid_columnconfigure(4, weight=0) # "Tên File:" label
+    toolbar_frame.grid_columnconfigure(5, weight=1) # file_name_entry (expands)
+    toolbar_frame.grid_columnconfigure(6, weight=0) # Select Dir button
+    toolbar_frame.grid_columnconfigure(7, weight=0) # Dir Label
+    toolbar_frame.grid_columnconfigure(8, weight=0) # Connect button
+    toolbar_frame.grid_columnconfigure(9, weight=0) # Disconnect button
+    toolbar_frame.grid_columnconfigure(10, weight=0) # Start/Stop Record button
+    toolbar_frame.grid_columnconfigure(11, weight=0) # Save Current Data button
+    toolbar_frame.grid_columnconfigure(12, weight=0) # Exit button
+    toolbar_frame.grid_columnconfigure(13, weight=0) # Status Label
+    toolbar_frame.grid_columnconfigure(14, weight=0) # Show all nodes checkbox
+    toolbar_frame.grid_columnconfigure(15, weight=0) # Save latency button
+    toolbar_frame.grid_columnconfigure(16, weight=0) # Profiler checkbox
+
+    # Widgets in Toolbar Frame
+    com_port_label = ttk.Label(toolbar_frame, text="Cổng COM:")
+    com_port_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+
+    # Editable with --supervise so several ports can be entered ("COM8, COM9")
+    com_port_combobox = ttk.Combobox(toolbar_frame, state="normal" if SUPERVISE else "readonly", width=15)
+    com_port_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+
+    # Node Selection Combobox
+    node_select_label = ttk.Label(toolbar_frame, text="Chọn Node:")
+    node_select_label.grid(row=0, column=2, padx=(10, 5), pady=5, sticky="w")
+
+    node_select_combobox = ttk.Combobox(toolbar_frame, state="disabled", width=15)
+    node_select_combobox.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
+    node_select_combobox.set("Không có Node")
+    node_select_combobox.bind("<<ComboboxSelected>>", on_node_selected_for_plot)
+
+
+    ttk.Label(toolbar_frame, text="Tên File:").grid(row=0, column=4, padx=(10, 5), pady=5, sticky="w")
+    file_name_entry = ttk.Entry(toolbar_frame, width=30)
+    file_name_entry.grid(row=0, column=5, padx=5, pady=5, sticky="ew")
+    file_name_entry.insert(0, "sensor_data") # Default file name
+
+    select_dir_button = ttk.Button(toolbar_frame, text="Mở Thư mục", command=select_output_directory)
+    select_dir_button.grid(row=0, column=6, padx=5, pady=5)
+
+    output_dir_label = ttk.Label(toolbar_frame, text=f"Thư mục: {output_directory}", wraplength=200)
+    output_dir_label.grid(row=0, column=7, padx=5, pady=5, sticky="w")
+
+    # Connection Control Buttons
+    connect_button = ttk.Button(toolbar_frame, text="Kết nối", command=start_serial_read_thread)
+    connect_button.grid(row=0, column=8, padx=(10, 2), pady=5)
+
+    disconnect_button = ttk.Button(toolbar_frame, text="Ngắt kết nối", command=stop_serial_read, state=tk.DISABLED)
+    disconnect_button.grid(row=0, column=9, padx=(2, 10), pady=5)
+
+    # Data Recording Control Buttons
+    record_button = ttk.Button(toolbar_frame, text="Bắt đầu Ghi", command=start_recording_data, state=tk.DISABLED)
+    record_button.grid(row=0, column=10, padx=(10, 2), pady=5)
+
+    save_current_data_button = ttk.Button(toolbar_frame, text="Lưu dữ liệu hiện tại", command=save_current_treeview_data, state=tk.DISABLED)
+    save_current_data_button.grid(row=0, column=11, padx=(2, 10), pady=5)
+
+    exit_button = ttk.Button(toolbar_frame, text="Thoát", command=on_closing)
+    exit_button.grid(row=0, column=12, padx=(10, 5), pady=5)
+
+    status_label = ttk.Label(toolbar_frame, text="Không kết nối", style="Red.TLabel")
+    status_label.grid(row=0, column=13, padx=10, pady=5, sticky="e")
+
+    # Plot every node in a grid instead of only the selected one
+    show_all_nodes_var = tk.BooleanVar(value=False)
+    show_all_nodes_check = ttk.Checkbutton(toolbar_frame, text="Tất cả Node", variable=show_all_nodes_var,
+                                           command=configure_plot_nodes)
+    show_all_nodes_check.grid(row=0, column=14, padx=5, pady=5)
+
+    # Latency histograms are always on; the button writes them (and the profile) to the output directory
+    latency_button = ttk.Button(toolbar_frame, text="Lưu độ trễ", command=dump_latency)
+    latency_button.grid(row=0, column=15, padx=5, pady=5)
+    profiler_var = tk.BooleanVar(value=profiler.running)
+    profiler_check = ttk.Checkbutton(toolbar_frame, text="Profiler", variable=profiler_var, command=toggle_profiler)
+    profiler_check.grid(row=0, column=16, padx=5, pady=5)
+
+
+    # --- Log Frame (Row 1) ---
+    log_frame = ttk.LabelFrame(root, text="Serial Log (Dữ liệu RAW và thông báo hệ thống)")
+    log_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=5)
+
+    log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=8, font=("Consolas", 9))
+    log_text.pack(padx=5, pady=5, fill=tk.BOTH, expand=True)
+    log_text.insert(tk.END, "Chào mừng! Chọn cổng COM và nhấn 'Kết nối' để bắt đầu.\n")
+    log_text.see(tk.END)
 
-# Update initial output directory label
-output_dir_label.config(text=f"Thư mục: {output_directory}")
 
-# Update COM ports after combobox is created
-update_com_ports()
+    # --- Main Content Frame (Row 2, Column 0) ---
+    main_content_frame = ttk.Frame(root)
+    main_content_frame.grid(row=2, column=0, sticky="nsew", padx=10, pady=5)
+
+    # Configure Grid for main_content_frame
+    main_content_frame.grid_columnconfigure(0, weight=1) # Left column (Treeview)
+    main_content_frame.grid_columnconfigure(1, weight=2) # Right column (plots) will be twice as wide
+    main_content_frame.grid_rowconfigure(0, weight=1) # Single row, expands
+
+    # Left Column (Treeview)
+    left_column_frame = ttk.Frame(main_content_frame)
+    left_column_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
+    left_column_frame.grid_rowconfigure(0, weight=1)
+    left_column_frame.grid_columnconfigure(0, weight=1)
+
+    # Data Treeview Frame
+    data_frame = ttk.LabelFrame(left_column_frame, text="Dữ liệu Sensor Node")
+    data_frame.grid(row=0, column=0, sticky="nsew", pady=5)
+
+    columns = ("ID", "Trạng thái", "AccX", "AccY", "AccZ", "GyroX", "GyroY", "GyroZ", "Timestamp", "Timestamp_us",
+               "Hz", "Jitter (ms)", "Gaps", "Lệch/Lặp", "Lỗi parse", "B/s", "Lần đạp", "Biên độ max")
+    data_tree = ttk.Treeview(data_frame, columns=columns, show="headings")
+
+    for col in columns:
+        data_tree.heading(col, text=col)
+        data_tree.column(col, width=80, anchor=tk.CENTER)
+
+    data_tree.column("ID", width=70)
+    data_tree.column("Trạng thái", width=90)
+    data_tree.column("AccX", width=55)
+    data_tree.column("AccY", width=55)
+    data_tree.column("AccZ", width=55)
+    data_tree.column("GyroX", width=55)
+    data_tree.column("GyroY", width=55)
+    data_tree.column("GyroZ", width=55)
+    data_tree.column("Timestamp", width=110)
+    data_tree.column("Timestamp_us", width=80)
+    for col in ("Hz", "Jitter (ms)", "Lệch/Lặp", "Lỗi parse", "B/s"):
+        data_tree.column(col, width=55)
+    data_tree.column("Gaps", width=70)
+    data_tree.column("Lần đạp", width=80)
+    data_tree.column("Biên độ max", width=90)
+
+    data_tree.pack(padx=5, pady=5, fill=tk.BOTH, expand=True)
+
+    # Right Column (Plots)
+    right_column_frame = ttk.Frame(main_content_frame)
+    right_column_frame.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
+
+    # Configure Grid for right_column_frame to split 2 plots
+    right_column_frame.grid_rowconfigure(0, weight=1)
+    right_column_frame.grid_rowconfigure(1, weight=1)
+    right_column_frame.grid_columnconfigure(0, weight=1)
+
+    # Setup Matplotlib figures
+    setup_plots()
+
+    # Accelerometer Plot Frame
+    acc_plot_frame = ttk.LabelFrame(right_column_frame, text="Đồ thị Gia tốc (Accelerometer)")
+    acc_plot_frame.grid(row=0, column=0, sticky="nsew", pady=5)
+    fig_acc_canvas = FigureCanvasTkAgg(fig_acc, master=acc_plot_frame)
+    fig_acc_canvas_widget = fig_acc_canvas.get_tk_widget()
+    fig_acc_canvas_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+    # Gyroscope Plot Frame
+    gyro_plot_frame = ttk.LabelFrame(right_column_frame, text="Đồ thị Vận tốc góc (Gyroscope)")
+    gyro_plot_frame.grid(row=1, column=0, sticky="nsew", pady=5)
+    fig_gyro_canvas = FigureCanvasTkAgg(fig_gyro, master=gyro_plot_frame)
+    fig_gyro_canvas_widget = fig_gyro_canvas.get_tk_widget()
+    fig_gyro_canvas_widget.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    setup_plot_panels()
+
+    # --- Initialize GUI Application ---
+    # Load last selected directory, or use current script directory
+    last_dir = load_last_directory()
+    if last_dir and os.path.isdir(last_dir):
+        output_directory = last_dir
+
+    # Create default directory if it doesn't exist
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    # Update initial output directory label
+    output_dir_label.config(text=f"Thư mục: {output_directory}")
+
+    # Update COM ports after combobox is created
+    update_com_ports()
+
+    # Update initial state of recording/save buttons
+    toggle_recording_buttons_state()
+    toggle_save_button_state()
 
-# Update initial state of recording/save buttons
-toggle_recording_buttons_state()
-toggle_save_button_state()
+    # Update node selection combobox initially (it will be empty/disabled)
+    update_node_selection_combobox()
 
-# Update node selection combobox initially (it will be empty/disabled)
-update_node_selection_combobox()
 
-root.protocol("WM_DELETE_WINDOW", on_closing)
-root.mainloop()
\ No newline at end of file
+def main():
+    global engine, DEBUG, TABLE_REFRESH_HZ, RECORD_FORMAT, EXTRA_PORTS, SUPERVISE, LINK_STATS_PATH
+    global RECORD_QUEUE_POLICY, rate_controller, rep_monitor
+    parser = argparse.ArgumentParser(description="ESP32 Sensor Data Reader with Plotting & Recording")
+    parser.add_argument("--debug", action="store_true", help="print node table updates to stdout")
+    parser.add_argument("--port", action="append", default=[], help="extra port to offer, e.g. from serial_simulator.py")
+    parser.add_argument("--table-hz", type=float, default=TABLE_REFRESH_HZ, help="node table refresh rate")
+    parser.add_argument("--record-format", choices=RECORD_FORMATS, default=RECORD_FORMAT, help="recording file format")
+    parser.add_argument("--supervise", action="store_true", help="one reader process per port (several stations)")
+    parser.add_argument("--qualify-nodes", action="store_true", help="with --supervise: name nodes <id>@<station>")
+    parser.add_argument("--repair-timestamps", action="store_true",
+                        help="remove timestamp outliers, re-sync steps and drift while ingesting")
+    parser.add_argument("--resample-hz", type=float,
+                        help="record every node on one uniform grid at this rate instead of the raw samples")
+    parser.add_argument("--link-stats", help="append per-node link statistics to this .csv or .jsonl file")
+    parser.add_argument("--record-queue-policy", choices=QUEUE_POLICIES, default=RECORD_QUEUE_POLICY,
+                        help="what recording does when the disk falls behind")
+    parser.add_argument("--profile", action="store_true", help="start with the sampling profiler on")
+    parser.add_argument("--adaptive-rate", action="store_true",
+                        help="raise/lower each node's freq (CONFIG) to keep the link under capacity")
+    parser.add_argument("--max-freq", type=int, default=MAX_FREQ, help="highest freq --adaptive-rate may set")
+    parser.add_argument("--node-config", type=parse_node_config, metavar="ACCEL:GYRO:SRD",
+                        help="settings resent with CONFIG for nodes whose HELLO was not seen")
+    parser.add_argument("--detect-reps", action="store_true",
+                        help="count leg-press reps per node and set while receiving")
+    parser.add_argument("--rep-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="smoothed |acc| a rep's peak must exceed")
+    parser.add_argument("--rep-distance", type=int, default=DEFAULT_DISTANCE, help="minimum samples between peaks")
+    parser.add_argument("--rep-latency", type=float, default=DEFAULT_LATENCY_S,
+                        help="seconds after which a peak is decided (0 = exact, no limit)")
+    args = parser.parse_args()
+    DEBUG = args.debug
+    EXTRA_PORTS = args.port
+    RECORD_FORMAT = args.record_format
+    TABLE_REFRESH_HZ = max(args.table_hz, 0.1)
+    SUPERVISE = args.supervise
+    LINK_STATS_PATH = args.link_stats
+    RECORD_QUEUE_POLICY = args.record_queue_policy
+
+    if args.profile:
+        profiler.start()
+    import_plotting()
+    build_gui()
+
+    if SUPERVISE:
+        engine = SupervisedEngine(qualify_nodes=args.qualify_nodes, log=on_engine_log,
+                                  repair_timestamps=args.repair_timestamps, resample_hz=args.resample_hz)
+    else:
+        engine = IngestEngine(log=on_engine_log, repair_timestamps=args.repair_timestamps,
+                              resample_hz=args.resample_hz)
+    engine.on_error = on_engine_error
+    engine.subscribe(on_engine_batch)
+    if args.adaptive_rate:
+        rate_controller = RateController(engine, max_freq=args.max_freq, default_config=args.node_config)
+    if args.detect_reps:
+        rep_monitor = RepMonitor(engine, threshold=args.rep_threshold, distance=args.rep_distance,
+                                 max_latency_s=args.rep_latency)
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    root.after(LOG_REFRESH_MS, flush_log_view)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""On-disk memoization of analysis stages, keyed by file content and parameters.
+
+Plot scripts and notebooks parse the same CSV files and recompute the same
+derived series (magnitudes, smoothing, segmentation) on every run.  With an
+``AnalysisCache`` each step is a stage whose key is
+
+    sha1(parent key, stage name, version, parameters)
+
+and the key of the first stage is the SHA-1 of the file's content (plus
+LOADER_VERSION).  A renamed or copied file therefore hits the cache, and
+an edited file misses it.  Changing a late stage's parameters only reruns
+that stage, because its parents' keys are unchanged:
+
+    cache = AnalysisCache()
+    rec = cache.source("../data/0707/Sensor_1_0001_20250707_102106.csv")
+    mag = cache.stage(rec, "magnitude", magnitude)
+    smooth = cache.stage(mag, "smooth", moving_average, window=5)
+
+Results are NumPy arrays (or dicts of arrays) saved as uncompressed
+``.npy``/``.npz`` files: loading one is a read of the raw bytes, with no
+parsing.  The cache directory is bounded to ``max_bytes``.  A hit touches
+the file's mtime, and eviction removes the least recently used files
+first.  Content hashes are memoized by (path, mtime, size) in
+``hashes.json``, so an unchanged file is not read again.
+
+Bump a stage's ``version`` when its code changes.
+
+    python analysis_cache.py bench ../data
+    python analysis_cache.py info
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from recording_loader import iter_recordings, load_recording
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+LOADER_VERSION = 2  # Part of every source key: bump when recording_loader's output changes
+HASHES_FILE = "hashes.json"
+_HASH_CHUNK = 1 << 20
+
+
+class Cached:
+    """A stage result and the key its children are derived from."""
+
+    __slots__ = ("key", "value", "hit")
+
+    def __init__(self, key, value, hit):
+        self.key = key
+        self.value = value
+        self.hit = hit
+
+
+def content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_key(parent_key, name, version, params):
+    text = json.dumps([parent_key, name, version, params], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# --- Common stages ---
+def magnitude(samples):
+    """(n, 2) float32: |acc| and |gyro| of a SAMPLE_DTYPE array."""
+    out = np.empty((len(samples), 2), dtype=np.float32)
+    out[:, 0] = np.sqrt(samples["ax"] ** 2 + samples["ay"] ** 2 + samples["az"] ** 2)
+    out[:, 1] = np.sqrt(samples["gx"] ** 2 + samples["gy"] ** 2 + samples["gz"] ** 2)
+    return out
+
+
+def moving_average(values, window=5):
+    """Centred moving average along axis 0 (same length; the edges average fewer samples)."""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if window <= 1 or n == 0:
+        return values.astype(np.float32)
+    sums = np.concatenate((np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)))
+    starts = np.clip(np.arange(n) - window // 2, 0, n)
+    stops = np.clip(np.arange(n) - window // 2 + window, 0, n)
+    counts = (stops - starts).reshape((n,) + (1,) * (values.ndim - 1))
+    return ((sums[stops] - sums[starts]) / counts).astype(np.float32)
+
+
+class AnalysisCache:
+    """Content-addressed stage results in ``directory``, at most ``max_bytes`` on disk."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._hashes = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    # --- Content hashes ---
+    def _hashes_path(self):
+        return os.path.join(self.directory, HASHES_FILE)
+
+    def file_hash(self, path):
+        """SHA-1 of a file's content; memoized by (absolute path, mtime, size)."""
+        if self._hashes is None:
+            try:
+                with open(self._hashes_path(), encoding="utf-8") as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self._hashes.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        digest = content_hash(path)
+        self._hashes[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        tmp = self._hashes_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._hashes, f)
+        os.replace(tmp, self._hashes_path())
+        return digest
+
+    # --- Stages ---
+    def source(self, path):
+        """The recording at ``path`` as a SAMPLE_DTYPE array (recording_loader.load_recording)."""
+        if os.path.isdir(path):  # .imu directories are already binary
+            return Cached(None, load_recording(path).samples, False)
+        key = stage_key(self.file_hash(path), "source", LOADER_VERSION, {})
+        return self._get_or_compute(key, lambda: load_recording(path).samples)
+
+    def stage(self, parent, name, func, version=1, **params):
+        """``func(parent.value, **params)``, cached under the parent's key, ``name``, ``version`` and ``params``."""
+        if parent.key is None:
+            return Cached(None, func(parent.value, **params), False)
+        key = stage_key(parent.key, name, version, params)
+        return self._get_or_compute(key, lambda: func(parent.value, **params))
+
+    def _get_or_compute(self, key, compute):
+        if self.enabled:
+            value = self._read(key)
+            if value is not None:
+                self.hits += 1
+                return Cached(key, value, True)
+        self.misses += 1
+        value = compute()
+        if self.enabled:
+            self._write(key, value)
+            self.evict()
+        return Cached(key, value, False)
+
+    # --- Storage ---
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def _read(self, key):
+        for ext in (".npy", ".npz"):
+            path = self._path(key, ext)
+            try:
+                if ext == ".npy":
+                    value = np.load(path, allow_pickle=False)
+                else:
+                    with np.load(path, allow_pickle=False) as archive:
+                        value = {name: archive[name] for name in archive.files}
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                return None  # Truncated or foreign file: recompute and overwrite
+            os.utime(path)  # Recently used
+            return value
+        return None
+
+    def _write(self, key, value):
+        is_dict = isinstance(value, dict)
+        path = self._path(key, ".npz" if is_dict else ".npy")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            if is_dict:
+                np.savez(f, **value)
+            else:
+                np.save(f, np.asarray(value), allow_pickle=False)
+        os.replace(tmp, path)
+
+    def entries(self):
+        """[(mtime, size, path)] of the cached results, least recently used first."""
+        result = []
+        for name in os.listdir(self.directory):
+            if name.endswith((".npy", ".npz")):
+                path = os.path.join(self.directory, name)
+                try:
+                    s = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                result.append((s.st_mtime, s.st_size, path))
+        result.sort()
+        return result
+
+    def evict(self):
+        """Remove least recently used results until the cache fits ``max_bytes``; returns bytes freed."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+            self.evicted += 1
+        return freed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        if os.path.exists(self._hashes_path()):
+            os.remove(self._hashes_path())
+        self._hashes = None
+
+    def stats(self):
+        entries = self.entries()
+        return {"directory": self.directory, "files": len(entries), "bytes": sum(s for _, s, _ in entries),
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "evicted": self.evicted}
+
+
+# --- Command line ---
+def _pipeline(cache, path, window):
+    rec = cache.source(path)
+    mag = cache.stage(rec, "magnitude", magnitude)
+    return cache.stage(mag, "smooth", moving_average, window=window)
+
+
+def _cmd_bench(args):
+    cache = AnalysisCache(args.cache, args.max_mb * 1024 * 1024)
+    cache.clear()
+    paths = list(iter_recordings(args.path))
+    runs = [("cold", 5), ("warm", 5), ("new window", 9)]
+    for label, window in runs:
+        cache.hits = cache.misses = 0
+        started = time.perf_counter()
+        for path in paths:
+            _pipeline(cache, path, window)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<11} {elapsed * 1000:8.1f} ms  {cache.hits:>4} hits {cache.misses:>4} misses")
+    s = cache.stats()
+    print(f"{len(paths)} recordings, cache {s['files']} files, {s['bytes'] / 1e6:.1f} MB, {s['evicted']} evicted")
+
+
+def _cmd_info(args):
+    s = AnalysisCache(args.cache).stats()
+    print(f"{s['directory']}: {s['files']} files, {s['bytes'] / 1e6:.1f} MB of {s['max_bytes'] / 1e6:.0f} MB")
+
+
+def _cmd_clear(args):
+    AnalysisCache(args.cache).clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed cache of analysis stages")
+    parser.add_argument("--cache", default=DEFAULT_DIRECTORY, help="cache directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("bench", help="cold, warm and late-stage-change runs over a directory")
+    p.add_argument("path", help="directory of recordings")
+    p.add_argument("--max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    p.set_defaults(func=_cmd_bench)
+    sub.add_parser("info", help="size of the cache").set_defaults(func=_cmd_info)
+    sub.add_parser("clear", help="delete every cached result").set_defaults(func=_cmd_clear)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Microbenchmark and correctness check for the fast sensor line parser.
+
+Builds a corpus of firmware-style lines (JSON samples, DATA: samples,
+handshakes, debug chatter, malformed lines), checks that ``parse_line`` and
+``parse_lines_to_array`` agree with the reference parsers, then times:
+
+  * the original GUI chain (handshake, wifi count, uptime, parse_sensor_data)
+  * parse_line() per line
+  * parse_lines_to_array() on batches
+
+    python bench_parser.py --lines 200000
+"""
+import argparse
+import random
+import time
+
+from sensor_parser import (
+    NodeIndex, LINE_SAMPLE, SAMPLE_FIELDS, is_separator_line, parse_handshake_data,
+    parse_line, parse_lines_to_array, parse_sensor_data, parse_server_uptime,
+    parse_wifi_client_count,
+)
+
+CHATTER = [
+    "Received HELLO from Node ID: Sensor_3",
+    "SUCCESS: Sent WELCOME to Sensor_2 -> WELCOME:Sensor_2:123456",
+    "DEBUG: WiFi SoftAP Connected Clients (WiFi layer): --- 3 clients",
+    "Server Uptime: 812 seconds",
+    "--------------------------------------------------",
+    "Client timeout: Sensor_4",
+    '{"id":"Sensor_1","ts":12,"ax":1.0}',
+    "DATA:Sensor_1:MPU6050:12:bad:0:0:0:0:0:25.00",
+    'Processed UDP from Queue: {"id":"Sensor_2","ts":99,"ax":1,"ay":2,"az":3,"gx":4,"gy":5,"gz":6}',
+    '{"ts":5,"id":"Sensor_2","ax":0.5,"ay":0.5,"az":0.5,"gx":1,"gy":1,"gz":1}',
+]
+
+
+def build_corpus(n, seed=1, data_share=0.22, chatter_share=0.03):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        r = rng.random()
+        node = f"Sensor_{rng.randint(1, 4)}"
+        vals = [rng.uniform(-2, 2) for _ in range(3)] + [rng.uniform(-250, 250) for _ in range(3)]
+        if r < 1.0 - data_share - chatter_share:
+            lines.append('{"id":"%s","ts":%d,"ax":%.3f,"ay":%.3f,"az":%.3f,"gx":%.3f,"gy":%.3f,"gz":%.3f}'
+                         % ((node, 1000 + i * 10) + tuple(vals)))
+        elif r < 1.0 - chatter_share:
+            lines.append("DATA:%s:MPU6050:%d:%.3f:%.3f:%.3f:%.3f:%.3f:%.3f:%.2f"
+                         % ((node, 1000 + i * 10) + tuple(vals) + (25.0,)))
+        else:
+            lines.append(rng.choice(CHATTER))
+    return lines
+
+
+def reference_chain(line):
+    """What process_serial_line_gui did for every line before the fast path."""
+    if is_separator_line(line):
+        return None
+    parse_handshake_data(line)
+    parse_wifi_client_count(line)
+    parse_server_uptime(line)
+    return parse_sensor_data(line)
+
+
+def check(lines):
+    node_index = NodeIndex()
+    expected = []
+    for line in lines:
+        ref = parse_sensor_data(line)
+        kind, value = parse_line(line)
+        if ref is None:
+            assert kind != LINE_SAMPLE, line
+            continue
+        assert kind == LINE_SAMPLE, line
+        assert value == (ref["id"], ref["ts"], ref["ax"], ref["ay"], ref["az"],
+                         ref["gx"], ref["gy"], ref["gz"]), line
+        expected.append(ref)
+        assert (parse_handshake_data(line) is None and parse_wifi_client_count(line) is None
+                and parse_server_uptime(line) is None)
+
+    samples, others = parse_lines_to_array(lines, node_index)
+    assert len(samples) == len(expected)
+    assert len(others) == len(lines) - len(expected)
+    for row, ref in zip(samples, expected):
+        assert node_index.name_of(row["node"]) == ref["id"]
+        assert row["ts_us"] == ref["ts"]
+        for name in SAMPLE_FIELDS:
+            assert row[name] == ref[name]
+
+
+def timeit(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500, help="lines per parse_lines_to_array call")
+    args = parser.parse_args()
+
+    lines = build_corpus(args.lines)
+    check(lines[:20_000] + CHATTER)
+    print(f"Correctness: fast path matches reference on {min(len(lines), 20_000) + len(CHATTER)} lines")
+
+    print("\nMixed stream (75% JSON, 22% DATA:, 3% chatter)")
+    run(lines, args.batch)
+    print("\nFirmware JSON only (esp8266_fixing.ino)")
+    run(build_corpus(args.lines, data_share=0.0, chatter_share=0.0), args.batch)
+
+
+def run(lines, batch):
+    batches = [lines[i:i + batch] for i in range(0, len(lines), batch)]
+    node_index = NodeIndex()
+    results = [
+        ("reference chain (per line)", timeit(lambda: [reference_chain(l) for l in lines])),
+        ("parse_sensor_data only", timeit(lambda: [parse_sensor_data(l) for l in lines])),
+        ("parse_line (per line)", timeit(lambda: [parse_line(l) for l in lines])),
+        (f"parse_lines_to_array ({batch}/batch)",
+         timeit(lambda: [parse_lines_to_array(b, node_index) for b in batches])),
+    ]
+    base = results[0][1]
+    for name, seconds in results:
+        print(f"{name:<36}{len(lines) / seconds:>14,.0f} lines/s  {base / seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
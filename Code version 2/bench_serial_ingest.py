@@ -0,0 +1,117 @@
+"""Throughput benchmark: per-line readline() loop vs. chunked batch reader.
+
+A pseudo-terminal pair stands in for the ESP32 serial port (Linux/macOS
+only): a writer thread pushes firmware-style JSON lines into the master side
+as fast as the tty accepts them, and each reader variant opens the slave side
+with pyserial and counts how many lines it receives in a fixed time window.
+
+    python bench_serial_ingest.py --seconds 3
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+import tty
+
+import serial
+
+from serial_reader import ChunkedLineReader, read_line_batches
+
+SAMPLE_LINE = ('{"id":"Sensor_%d","ts":%d,"ax":0.123,"ay":-0.981,"az":0.045,'
+               '"gx":-12.345,"gy":3.210,"gz":0.500}\n')
+
+
+def _writer(master_fd, stop_event, nodes):
+    # Pre-build a block of lines so the writer itself is never the bottleneck
+    block = "".join(SAMPLE_LINE % (i % nodes + 1, 1000 + i) for i in range(2000)).encode()
+    while not stop_event.is_set():
+        try:
+            os.write(master_fd, block)
+        except OSError:
+            break
+
+
+def _open_pair():
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(master_fd)
+    port = serial.Serial(os.ttyname(slave_fd), 115200, timeout=0.1)
+    return master_fd, slave_fd, port
+
+
+def run_readline_baseline(port, seconds):
+    """The original loop: readline, per-line queue append, 10 ms sleep."""
+    queue = collections.deque()
+    count = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        line = port.readline().decode('utf-8', errors='ignore').strip()
+        if line:
+            queue.append(line)
+            count += 1
+        time.sleep(0.01)
+    return count
+
+
+def run_readline_nosleep(port, seconds):
+    """readline without the sleep, to separate the sleep cap from per-call overhead."""
+    queue = collections.deque()
+    count = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        line = port.readline().decode('utf-8', errors='ignore').strip()
+        if line:
+            queue.append(line)
+            count += 1
+    return count
+
+
+def run_chunked(port, seconds):
+    queue = collections.deque()
+    counter = [0, 0]
+
+    def on_batch(lines):
+        queue.append(lines)
+        counter[0] += len(lines)
+        counter[1] += 1
+
+    end = time.monotonic() + seconds
+    read_line_batches(ChunkedLineReader(port), on_batch, lambda: time.monotonic() < end)
+    return counter[0], counter[1]
+
+
+def bench(name, func, seconds, nodes):
+    master_fd, slave_fd, port = _open_pair()
+    stop_event = threading.Event()
+    writer = threading.Thread(target=_writer, args=(master_fd, stop_event, nodes), daemon=True)
+    writer.start()
+    try:
+        result = func(port, seconds)
+    finally:
+        stop_event.set()
+        port.close()
+        os.close(slave_fd)
+        os.close(master_fd)
+        writer.join(timeout=1.0)
+    lines, batches = result if isinstance(result, tuple) else (result, None)
+    extra = f"  ({batches / seconds:.0f} consumer calls/s)" if batches is not None else \
+        f"  ({lines / seconds:.0f} consumer calls/s)"
+    print(f"{name:<28}{lines / seconds:>12,.0f} lines/s{extra}")
+    return lines / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--nodes", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"Benchmark window: {args.seconds:.1f} s per variant, {args.nodes} nodes")
+    before = bench("readline + sleep(0.01)", run_readline_baseline, args.seconds, args.nodes)
+    bench("readline (no sleep)", run_readline_nosleep, args.seconds, args.nodes)
+    after = bench("chunked batch reader", run_chunked, args.seconds, args.nodes)
+    print(f"Speed-up vs. original loop: {after / max(before, 1e-9):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
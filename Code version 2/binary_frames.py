@@ -0,0 +1,275 @@
+"""Compact binary sample frames, an alternative to the ~110-byte JSON lines.
+
+Frame payload (21 bytes, little endian) followed by a CRC-16:
+
+    offset  size  field
+    0       1     frame type: FRAME_INT16 (raw MPU6050 counts) or FRAME_FLOAT16
+    1       1     node number n, the node ID is NODE_NAME_FORMAT.format(n) ("Sensor_<n>")
+    2       1     ranges: accel range << 4 | gyro range (same 0..3 codes as CONFIG / the firmware)
+    3       2     sequence number (uint16, wraps)
+    5       4     timestamp in server millis (uint32, same value as the JSON "ts")
+    9       12    ax, ay, az, gx, gy, gz as int16 counts or float16 g / dps
+    21      2     CRC-16/CCITT-FALSE of bytes 0..20
+
+On the wire the 23 bytes are COBS encoded (no zero bytes inside, one byte
+of overhead) and wrapped in 0x00 delimiters: ``00 <24 bytes> 00``.  Text
+lines never contain 0x00, so frames can share the port with the bridge's
+text output (handshakes, uptime, JSON samples from older nodes).  The
+splitter resynchronises by itself: ``00 00`` is read as the end of one frame
+and the start of the next, bytes before a frame start that do not end a text
+line are dropped, and a body that fails its checks costs only that frame.
+
+Readers get COBS bodies as ``bytes`` items among the text lines;
+sensor_parser.parse_lines_to_array decodes them in one vectorized pass.
+
+    python binary_frames.py --frames 200000     # decoder bench + 115200 baud comparison
+"""
+import argparse
+import binascii
+import struct
+import time
+
+import numpy as np
+
+FRAME_DELIMITER = b"\x00"
+FRAME_INT16 = 0x01
+FRAME_FLOAT16 = 0x02
+FRAME_TYPES = (FRAME_INT16, FRAME_FLOAT16)
+NODE_NAME_FORMAT = "Sensor_{}"
+MAX_NODE_NUMBER = 255  # One byte in a frame
+
+# LSB per g / per dps for the MPU6050 range codes 0..3 (getAccelScaleFactor / getGyroScaleFactor)
+ACCEL_SCALES = (16384.0, 8192.0, 4096.0, 2048.0)
+GYRO_SCALES = (131.0, 65.5, 32.8, 16.4)
+
+_HEADER = struct.Struct("<BBBHI")
+PAYLOAD_BYTES = _HEADER.size + 12
+FRAME_BYTES = PAYLOAD_BYTES + 2  # Payload + CRC
+ENCODED_BYTES = FRAME_BYTES + 1  # COBS body between the delimiters
+WIRE_BYTES = ENCODED_BYTES + 2
+MAX_BODY_BYTES = 254  # Longer runs between delimiters are a stray 0x00 in text, not a frame
+
+FRAME_DTYPE = np.dtype([
+    ("type", "u1"), ("node", "u1"), ("ranges", "u1"), ("seq", "<u2"), ("ts_ms", "<u4"),
+    ("ch", "<i2", 6), ("crc", "<u2"),
+])
+assert FRAME_DTYPE.itemsize == FRAME_BYTES
+
+_ACCEL_SCALE_LUT = np.array(ACCEL_SCALES * 4, dtype=np.float32)[:16]
+_GYRO_SCALE_LUT = np.array(GYRO_SCALES * 4, dtype=np.float32)[:16]
+
+
+# --- COBS ---
+def cobs_encode(data):
+    out = bytearray()
+    for block in bytes(data).split(b"\x00"):
+        while len(block) >= 254:
+            out.append(0xFF)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobs_decode(data):
+    """Inverse of cobs_encode; raises ValueError on a malformed body."""
+    out = bytearray()
+    i, n = 0, len(data)
+    while i < n:
+        code = data[i]
+        end = i + code
+        if code == 0 or end > n:
+            raise ValueError("malformed COBS block")
+        out += data[i + 1:end]
+        if code < 0xFF and end < n:
+            out.append(0)
+        i = end
+    return bytes(out)
+
+
+# --- Encoding (simulator, tests, reference for firmware) ---
+def node_number(node_id):
+    """Number a frame carries for ``node_id`` ("Sensor_3" -> 3); ValueError if it has none."""
+    text = node_id.rsplit("_", 1)[-1]
+    if not text.isdigit() or int(text) > MAX_NODE_NUMBER:
+        raise ValueError(f"node ID '{node_id}' must end in _<0-{MAX_NODE_NUMBER}> to be sent as binary frames")
+    return int(text)
+
+
+def encode_frame(node, seq, ts_ms, values, frame_type=FRAME_INT16, accel_range=0, gyro_range=0):
+    """One sample as wire bytes (delimiters included); ``values`` in g and dps."""
+    if frame_type == FRAME_INT16:
+        scales = (ACCEL_SCALES[accel_range],) * 3 + (GYRO_SCALES[gyro_range],) * 3
+        counts = [max(-32768, min(32767, int(round(v * s)))) for v, s in zip(values, scales)]
+        channels = struct.pack("<6h", *counts)
+    elif frame_type == FRAME_FLOAT16:
+        channels = struct.pack("<6e", *values)
+    else:
+        raise ValueError(f"unknown frame type {frame_type}")
+    payload = _HEADER.pack(frame_type, node, accel_range << 4 | gyro_range, seq & 0xFFFF,
+                           ts_ms & 0xFFFFFFFF) + channels
+    payload += struct.pack("<H", binascii.crc_hqx(payload, 0xFFFF))
+    return FRAME_DELIMITER + cobs_encode(payload) + FRAME_DELIMITER
+
+
+# --- Stream splitting ---
+def split_stream(data, encoding="utf-8"):
+    """Split raw port bytes holding text lines and frames.
+
+    Returns ``(items, rest, dropped)``: text lines (str, stripped, non-empty)
+    and COBS frame bodies (bytes) in arrival order, the incomplete tail to
+    prepend to the next read, and the number of unterminated text fragments
+    that were cut by a frame start.
+    """
+    items = []
+    dropped = 0
+    pos = 0
+    while True:
+        start = data.find(FRAME_DELIMITER, pos)
+        text = data[pos:] if start < 0 else data[pos:start]
+        if text:
+            complete, sep, tail = text.rpartition(b"\n")
+            if sep:
+                for line in complete.decode(encoding, errors="ignore").split("\n"):
+                    line = line.strip()
+                    if line:
+                        items.append(line)
+            if start < 0:
+                return items, tail, dropped
+            if tail.strip():
+                dropped += 1
+        elif start < 0:
+            return items, b"", dropped
+        end = data.find(FRAME_DELIMITER, start + 1)
+        if (end if end >= 0 else len(data)) - start - 1 > MAX_BODY_BYTES:
+            dropped += 1
+            pos = start + 1  # Line noise: carry on with the text after the stray byte
+            continue
+        if end < 0:
+            return items, data[start:], dropped
+        if end > start + 1:
+            items.append(data[start + 1:end])
+            pos = end + 1
+        else:
+            pos = end  # "00 00": the second delimiter opens the next frame
+
+
+# --- Decoding ---
+def decode_frames(bodies):
+    """Decode COBS bodies in one vectorized pass.
+
+    Returns ``(frames, ok)``: a FRAME_DTYPE array of the frames that passed
+    the length, COBS, type and CRC checks (in input order) and a boolean
+    array telling which of ``bodies`` they are.
+    """
+    ok = np.fromiter((len(body) == ENCODED_BYTES for body in bodies), dtype=bool, count=len(bodies))
+    count = int(np.count_nonzero(ok))
+    if not count:
+        return np.empty(0, dtype=FRAME_DTYPE), ok
+    good = bodies if count == len(bodies) else [body for body in bodies if len(body) == ENCODED_BYTES]
+    encoded = np.frombuffer(b"".join(good), dtype=np.uint8).reshape(count, ENCODED_BYTES)
+    decoded = encoded[:, 1:].copy()
+    # Follow the COBS code chain column by column: every code byte stands for a zero
+    # in the decoded frame.  Frames are shorter than 254 bytes, so there is no 0xFF code.
+    next_code = encoded[:, 0].astype(np.int32)
+    for col in range(1, ENCODED_BYTES):
+        hit = next_code == col
+        if hit.any():
+            decoded[hit, col - 1] = 0
+            next_code[hit] += encoded[hit, col]
+    valid = next_code == ENCODED_BYTES
+    frames = decoded.view(FRAME_DTYPE).reshape(count)
+    valid &= np.isin(frames["type"], FRAME_TYPES)
+    raw = decoded.tobytes()
+    crc = np.fromiter((binascii.crc_hqx(raw[i:i + PAYLOAD_BYTES], 0xFFFF)
+                       for i in range(0, len(raw), FRAME_BYTES)), dtype=np.uint16, count=count)
+    valid &= crc == frames["crc"]
+    if not valid.all():
+        frames = frames[valid]
+        ok[ok] = valid
+    return frames, ok
+
+
+def frame_values(frames):
+    """(n, 6) float32 g / dps for decoded frames of either type."""
+    values = frames["ch"].astype(np.float32)
+    is_float = frames["type"] == FRAME_FLOAT16
+    if is_float.any():
+        values[is_float] = frames["ch"][is_float].view("<f2").astype(np.float32)
+    is_int = ~is_float
+    if is_int.any():
+        ranges = frames["ranges"][is_int]
+        values[is_int, :3] /= _ACCEL_SCALE_LUT[ranges >> 4][:, None]
+        values[is_int, 3:] /= _GYRO_SCALE_LUT[ranges & 0x0F][:, None]
+    return values
+
+
+# --- Benchmark ---
+def _bench(args):
+    from sensor_parser import NodeIndex, parse_lines_to_array, parse_sensor_data
+
+    rng = np.random.default_rng(0)
+    n = args.frames
+    values = np.column_stack([rng.uniform(-2, 2, (n, 3)), rng.uniform(-250, 250, (n, 3))])
+    nodes = rng.integers(1, 5, n)
+    json_lines = ['{"id":"Sensor_%d","ts":%d,"ax":%.3f,"ay":%.3f,"az":%.3f,"gx":%.3f,"gy":%.3f,"gz":%.3f}'
+                  % ((nodes[i], 1000 + i * 10) + tuple(values[i])) for i in range(n)]
+    wire = b"".join(encode_frame(int(nodes[i]), i, 1000 + i * 10, values[i]) for i in range(n))
+    items, _, _ = split_stream(wire)
+    assert len(items) == n and cobs_encode(cobs_decode(items[0])) == items[0]
+
+    def best(func, repeat=3):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    batch = args.batch
+    node_index = NodeIndex()
+    json_batches = [json_lines[i:i + batch] for i in range(0, n, batch)]
+    frame_batches = [items[i:i + batch] for i in range(0, n, batch)]
+    wire_chunks = [wire[i:i + 4096] for i in range(0, len(wire), 4096)]
+
+    frames, ok = decode_frames(items)
+    assert ok.all()
+    decoded = frame_values(frames)
+    err = np.abs(decoded - values.astype(np.float32)).max(axis=0)
+    print(f"{n:,} samples, {args.batch} per batch; int16 (+-2 g, +-250 dps) max error "
+          f"acc {err[:3].max():.5f} g, gyro {err[3:].max():.4f} dps")
+
+    def split_all():
+        rest = b""
+        for chunk in wire_chunks:
+            _, rest, _ = split_stream(rest + chunk)
+
+    results = [
+        ("JSON  json.loads (parse_sensor_data)", best(lambda: [parse_sensor_data(line) for line in json_lines])),
+        ("JSON  parse_lines_to_array", best(lambda: [parse_lines_to_array(b, node_index) for b in json_batches])),
+        ("frame split_stream (4 KiB reads)", best(split_all)),
+        ("frame decode_frames + frame_values", best(lambda: [frame_values(decode_frames(b)[0]) for b in frame_batches])),
+        ("frame parse_lines_to_array", best(lambda: [parse_lines_to_array(b, node_index) for b in frame_batches])),
+    ]
+    for name, seconds in results:
+        print(f"  {name:<38}{n / seconds:>12,.0f} samples/s  {seconds / n * 1e6:6.2f} us/sample")
+
+    json_bytes = sum(len(line) + 2 for line in json_lines) / n  # Serial.println adds \r\n
+    bytes_per_s = args.baud / 10.0  # 8N1
+    print(f"\nUART {args.baud} baud = {bytes_per_s:,.0f} bytes/s")
+    print(f"  JSON line   {json_bytes:6.1f} bytes/sample  -> {bytes_per_s / json_bytes:7.1f} samples/s max")
+    print(f"  binary frame{WIRE_BYTES:6d} bytes/sample  -> {bytes_per_s / WIRE_BYTES:7.1f} samples/s max"
+          f"  ({json_bytes / WIRE_BYTES:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary sample frames: decoder bench and baud comparison")
+    parser.add_argument("--frames", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500, help="frames per decode call (one reader batch)")
+    parser.add_argument("--baud", type=int, default=115200)
+    _bench(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Bounded queue between two ingest stages, with an explicit overflow policy.
+
+The reader thread must never wait on a slow consumer, and no consumer may
+grow memory without limit.  Each queue has a capacity in ``weight`` units
+(rows for sample arrays, 1 per item by default).  An item that does not fit
+is handled by the queue's policy:
+
+* ``drop_oldest``: discard the oldest items until it fits (display path:
+  only the newest data matters);
+* ``drop_newest``: discard the new item;
+* ``block``: wait up to ``block_timeout`` s for the consumer, then drop the
+  new item.  This holds up the producer and everything behind it;
+* ``spill``: append the item to a temporary file.  The consumer gets spilled
+  items back in order once it has caught up with memory, so nothing is lost
+  while the disk has room.  Needs ``encode``/``decode`` (item <-> bytes).
+
+``stats()`` reports depth, high watermark, drops, time spent blocked and
+spilled items/bytes; they are counted per queue, so a slow plot shows up on
+the display queue and never on the recording one.
+"""
+import collections
+import os
+import struct
+import tempfile
+import threading
+import time
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_NEWEST = "drop_newest"
+POLICY_BLOCK = "block"
+POLICY_SPILL = "spill"
+QUEUE_POLICIES = (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_BLOCK, POLICY_SPILL)
+
+BLOCK_TIMEOUT_S = 2.0
+_RECORD_HEADER = struct.Struct("<IQ")  # encoded length, weight
+
+
+def _one(item):
+    return 1
+
+
+class _SpillFile:
+    """FIFO of encoded items in a temporary file; the file is truncated whenever it runs empty."""
+
+    def __init__(self, directory=None, prefix="spill_"):
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix=".bin", dir=directory)
+        self.file = os.fdopen(fd, "w+b")
+        self.read_pos = 0
+        self.write_pos = 0
+        self.items = 0
+        self.weight = 0
+
+    def append(self, data, weight):
+        self.file.seek(self.write_pos)
+        self.file.write(_RECORD_HEADER.pack(len(data), weight))
+        self.file.write(data)
+        self.write_pos = self.file.tell()
+        self.items += 1
+        self.weight += weight
+
+    def pop(self):
+        self.file.flush()
+        self.file.seek(self.read_pos)
+        length, weight = _RECORD_HEADER.unpack(self.file.read(_RECORD_HEADER.size))
+        data = self.file.read(length)
+        self.read_pos = self.file.tell()
+        self.items -= 1
+        self.weight -= weight
+        if not self.items:
+            self.file.seek(0)
+            self.file.truncate()
+            self.read_pos = self.write_pos = 0
+        return data, weight
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class BoundedQueue:
+    """Thread-safe FIFO with a weight capacity and an overflow policy (see the module docstring)."""
+
+    def __init__(self, name, capacity, policy=POLICY_DROP_OLDEST, weight=_one, block_timeout=BLOCK_TIMEOUT_S,
+                 encode=None, decode=None, spill_dir=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy must be one of {QUEUE_POLICIES}, got {policy!r}")
+        if policy == POLICY_SPILL and (encode is None or decode is None):
+            raise ValueError("the spill policy needs encode and decode")
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        self.weight = weight
+        self.block_timeout = block_timeout
+        self.encode = encode
+        self.decode = decode
+        self.spill_dir = spill_dir
+        self._items = collections.deque()  # (item, weight)
+        self._depth = 0
+        self._spill = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.put_items = 0
+        self.got_items = 0
+        self.dropped_items = 0
+        self.dropped_weight = 0
+        self.high_watermark = 0
+        self.blocked_s = 0.0
+        self.spilled_items = 0
+        self.spilled_bytes = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items) + (self._spill.items if self._spill else 0)
+
+    @property
+    def depth(self):
+        """Queued weight, in memory and spilled."""
+        return self._depth + (self._spill.weight if self._spill else 0)
+
+    def put(self, item):
+        """Queue ``item``; returns False if the policy dropped it."""
+        w = self.weight(item)
+        with self._cond:
+            if self._closed:
+                self._drop(w)
+                return False
+            self.put_items += 1
+            if self._spill is not None and self._spill.items:
+                # Keep FIFO order: once spilling, new items go behind the spilled ones
+                try:
+                    self._spill_item(item, w)
+                    return True
+                except OSError:
+                    self._drop(w)
+                    return False
+            if self._depth + w > self.capacity and self._items:
+                if not self._make_room(item, w):
+                    return False
+                if self._spill is not None and self._spill.items:
+                    return True
+            self._items.append((item, w))
+            self._depth += w
+            self.high_watermark = max(self.high_watermark, self.depth)
+            self._cond.notify()
+            return True
+
+    def _make_room(self, item, w):
+        """Apply the policy to an item that does not fit; False if it was dropped."""
+        policy = self.policy
+        if policy == POLICY_DROP_OLDEST:
+            while self._items and self._depth + w > self.capacity:
+                _, old = self._items.popleft()
+                self._depth -= old
+                self._drop(old)
+            return True
+        if policy == POLICY_BLOCK:
+            started = time.monotonic()
+            deadline = started + self.block_timeout
+            while self._items and self._depth + w > self.capacity and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self.blocked_s += time.monotonic() - started
+            if not self._items or self._depth + w <= self.capacity:
+                return True
+        elif policy == POLICY_SPILL:
+            try:
+                self._spill_item(item, w)
+                return True
+            except OSError:
+                pass  # Disk full or gone: drop like drop_newest
+        self._drop(w)
+        return False
+
+    def _spill_item(self, item, w):
+        if self._spill is None:
+            self._spill = _SpillFile(self.spill_dir, prefix=f"{self.name}_")
+        data = self.encode(item)
+        self._spill.append(data, w)
+        self.spilled_items += 1
+        self.spilled_bytes += len(data)
+        self.high_watermark = max(self.high_watermark, self.depth)
+        self._cond.notify()
+
+    def _drop(self, w):
+        self.dropped_items += 1
+        self.dropped_weight += w
+
+    def get_all(self, timeout=None):
+        """Everything queued in memory (waiting up to ``timeout`` s for the first item), oldest first.
+
+        Spilled items come back once memory is empty, at most ``capacity`` per call.
+        """
+        with self._cond:
+            if timeout and not self._items and not (self._spill and self._spill.items) and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items and self._spill is not None and self._spill.items:
+                self._unspill()
+            items = [item for item, _ in self._items]
+            self._items.clear()
+            self._depth = 0
+            self.got_items += len(items)
+            self._cond.notify_all()  # Wake a blocked producer
+            return items
+
+    def _unspill(self):
+        loaded = 0
+        while self._spill.items and (not loaded or loaded + self._peek_weight() <= self.capacity):
+            data, w = self._spill.pop()
+            self._items.append((self.decode(data), w))
+            self._depth += w
+            loaded += w
+
+    def _peek_weight(self):
+        spill = self._spill
+        spill.file.flush()
+        spill.file.seek(spill.read_pos)
+        return _RECORD_HEADER.unpack(spill.file.read(_RECORD_HEADER.size))[1]
+
+    def wait(self, timeout):
+        """Wait until an item is queued or ``timeout`` s pass; True if something is queued."""
+        with self._cond:
+            if not self._items and not (self._spill and self._spill.items) and not self._closed:
+                self._cond.wait(timeout)
+            return bool(self._items) or bool(self._spill and self._spill.items)
+
+    def notify(self):
+        """Wake a consumer waiting in wait()/get_all() without queueing anything."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def clear(self):
+        """Discard everything queued; returns the weight that was discarded (counted as dropped)."""
+        with self._cond:
+            discarded = self.depth
+            self.dropped_items += len(self._items) + (self._spill.items if self._spill else 0)
+            self.dropped_weight += discarded
+            self._items.clear()
+            self._depth = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+            self._cond.notify_all()
+            return discarded
+
+    def close(self):
+        """Refuse further items and release the spill file once it is empty."""
+        with self._cond:
+            self._closed = True
+            if self._spill is not None and not self._spill.items:
+                self._spill.close()
+                self._spill = None
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "name": self.name,
+                "policy": self.policy,
+                "capacity": self.capacity,
+                "depth": self.depth,
+                "items": len(self._items) + (self._spill.items if self._spill else 0),
+                "high_watermark": self.high_watermark,
+                "put": self.put_items,
+                "got": self.got_items,
+                "dropped": self.dropped_items,
+                "dropped_weight": self.dropped_weight,
+                "blocked_s": self.blocked_s,
+                "spilled": self.spilled_items,
+                "spilled_bytes": self.spilled_bytes,
+                "spill_pending": self._spill.items if self._spill else 0,
+            }
+
+
+def format_queue_stats(s):
+    """One line for logs."""
+    line = (f"{s['name']} ({s['policy']}): {s['depth']}/{s['capacity']} queued, max {s['high_watermark']}, "
+            f"{s['dropped']} dropped ({s['dropped_weight']})")
+    if s["blocked_s"]:
+        line += f", blocked {s['blocked_s']:.2f} s"
+    if s["spilled"]:
+        line += f", spilled {s['spilled']} ({s['spilled_bytes'] / 1e6:.1f} MB, {s['spill_pending']} pending)"
+    return line
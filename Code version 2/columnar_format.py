@@ -0,0 +1,305 @@
+"""Binary columnar recording format (``.imu`` directories).
+
+A recording is a directory holding one raw little-endian file per column
+plus ``meta.json``:
+
+    Sensor_1_session_20250705_101500.imu/
+        meta.json       {"format": "imu-columnar", "version": 1, "node_id": ..., "columns": {...}}
+        ts_us.i8        int64 microseconds (same value as the CSV Timestamp_us)
+        ax.f4 ... gz.f4 float32 channels
+
+Rows are appended in chunks, so a file can grow while it is being recorded
+and a crash loses at most the unflushed chunk.  The number of rows is the
+length of the shortest column file, not a value stored in meta.json.  Readers map the
+column files with ``np.memmap``: opening a multi-hour session costs a few
+file opens, not a parse.
+
+    python columnar_format.py convert ../data              # every CSV -> .imu next to it
+    python columnar_format.py info ../data/x.imu
+    python columnar_format.py bench --hours 4
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from sensor_parser import SAMPLE_FIELDS, parse_mmss_us_to_microseconds
+
+FORMAT_NAME = "imu-columnar"
+FORMAT_VERSION = 1
+EXTENSION = ".imu"
+META_FILE = "meta.json"
+COLUMNS = {"ts_us": "<i8", **{name: "<f4" for name in SAMPLE_FIELDS}}
+CHUNK_ROWS = 4096  # Rows buffered in memory before they are appended to the column files
+
+
+def _column_path(path, name):
+    return os.path.join(path, f"{name}.{COLUMNS[name][1:]}")
+
+
+class ColumnarWriter:
+    """Append samples of one node to an ``.imu`` directory."""
+
+    def __init__(self, path, node_id, chunk_rows=CHUNK_ROWS, source=None):
+        self.path = path
+        self.node_id = node_id
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._pending = []
+        self._pending_rows = 0
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "node_id": node_id,
+            "columns": COLUMNS,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if source:
+            meta["source"] = source
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        self._files = {name: open(_column_path(path, name), "ab") for name in COLUMNS}
+
+    def write(self, samples):
+        """Queue a SAMPLE_DTYPE array (or any array with ts_us/ax..gz fields) of this node."""
+        if not len(samples):
+            return
+        self._pending.append(samples)
+        self._pending_rows += len(samples)
+        if self._pending_rows >= self.chunk_rows:
+            self._write_chunk()
+
+    def write_columns(self, ts_us, values):
+        """Append ``ts_us`` (n,) and ``values`` (n, 6) directly."""
+        self._write_chunk()
+        self._files["ts_us"].write(np.ascontiguousarray(ts_us, dtype=COLUMNS["ts_us"]).tobytes())
+        for i, name in enumerate(SAMPLE_FIELDS):
+            self._files[name].write(np.ascontiguousarray(values[:, i], dtype=COLUMNS[name]).tobytes())
+        self.rows += len(ts_us)
+
+    def _write_chunk(self):
+        if not self._pending:
+            return
+        chunk = self._pending[0] if len(self._pending) == 1 else np.concatenate(self._pending)
+        for name, dtype in COLUMNS.items():
+            self._files[name].write(np.ascontiguousarray(chunk[name], dtype=dtype).tobytes())
+        self.rows += len(chunk)
+        self._pending = []
+        self._pending_rows = 0
+
+    def flush(self, fsync=False):
+        self._write_chunk()
+        for f in self._files.values():
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+class ColumnarRecording:
+    """Read-only, memory-mapped view of an ``.imu`` directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not an {FORMAT_NAME} recording")
+        self.node_id = self.meta.get("node_id")
+        sizes = {name: os.path.getsize(_column_path(path, name)) // np.dtype(dtype).itemsize
+                 for name, dtype in self.meta["columns"].items()}
+        # A writer may have been interrupted between columns: use the complete rows only
+        self.rows = min(sizes.values())
+        self.columns = {name: self._map(name, dtype) for name, dtype in self.meta["columns"].items()}
+
+    def _map(self, name, dtype):
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(_column_path(self.path, name), dtype=dtype, mode="r", shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def ts_us(self):
+        return self.columns["ts_us"]
+
+    def values(self, start=0, stop=None):
+        """(n, 6) float32 copy of the channels for rows [start, stop)."""
+        return np.column_stack([self.columns[name][start:stop] for name in SAMPLE_FIELDS])
+
+
+def open_recording(path):
+    return ColumnarRecording(path)
+
+
+# --- CSV conversion ---
+def read_recording_csv(path):
+    """Parse a CSV recording into {node_id: (ts_us int64, values (n, 6) float32)}.
+
+    Reference implementation, one csv.reader row at a time; the tools use
+    the faster recording_loader.read_nodes, which returns the same result.
+
+    Handles the EspServer layout (``ID,Status,AccX,...,Timestamp,Timestamp_us``,
+    optionally space padded) and the older ``Sensor1,ax,...,gz,mm:ss:us`` rows.
+    """
+    rows = {}
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader, [])]
+        has_status = "Status" in header and "Timestamp_us" in header
+        for record in reader:
+            record = [field.strip() for field in record]
+            try:
+                if has_status:
+                    node_id, values, ts_us = record[0], record[2:8], int(record[9])
+                else:
+                    node_id, values = record[0], record[1:7]
+                    ts_us = parse_mmss_us_to_microseconds(record[7])
+                values = [float(v) for v in values]
+            except (ValueError, IndexError):
+                continue
+            if len(values) != 6:
+                continue
+            ts_list, value_list = rows.setdefault(node_id, ([], []))
+            ts_list.append(ts_us)
+            value_list.append(values)
+    return {node_id: (np.array(ts, dtype=np.int64), np.array(values, dtype=np.float32).reshape(-1, 6))
+            for node_id, (ts, values) in rows.items()}
+
+
+def convert_csv(path, out_dir=None):
+    """Convert one CSV into ``.imu`` directories (one per node); returns their paths."""
+    from recording_loader import read_nodes  # Imports this module
+
+    out_dir = out_dir or os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    nodes = read_nodes(path)
+    outputs = []
+    for node_id, (ts_us, values) in nodes.items():
+        name = stem if len(nodes) == 1 else f"{stem}_{node_id}"
+        target = os.path.join(out_dir, name + EXTENSION)
+        if os.path.exists(target):
+            for column in COLUMNS:
+                if os.path.exists(_column_path(target, column)):
+                    os.remove(_column_path(target, column))
+        writer = ColumnarWriter(target, node_id, source=os.path.basename(path))
+        writer.write_columns(ts_us, values)
+        writer.close()
+        outputs.append(target)
+    return outputs
+
+
+def iter_csv_files(path):
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if name.lower().endswith(".csv"):
+                yield os.path.join(root, name)
+
+
+# --- Command line ---
+def _cmd_convert(args):
+    total_rows = 0
+    for path in iter_csv_files(args.path):
+        outputs = convert_csv(path, args.out)
+        rows = sum(len(open_recording(p)) for p in outputs)
+        total_rows += rows
+        print(f"{path}: {rows} rows -> {', '.join(outputs) or '(no data)'}")
+    print(f"Total: {total_rows} rows")
+
+
+def _cmd_info(args):
+    rec = open_recording(args.path)
+    ts = rec.ts_us
+    span = (ts[-1] - ts[0]) / 1e6 if len(rec) else 0.0
+    print(f"{rec.path}: node={rec.node_id} rows={len(rec)} span={span:.1f}s")
+    for name in rec.columns:
+        column = rec[name]
+        if len(column):
+            print(f"  {name:<6} {column.dtype}  min={column.min()}  max={column.max()}")
+
+
+def _cmd_bench(args):
+    import tempfile
+
+    from recorder import CSV_HEADER, format_csv_rows
+    from sensor_parser import SAMPLE_DTYPE
+
+    rows = int(args.hours * 3600 * args.rate)
+    rng = np.random.default_rng(0)
+    samples = np.zeros(rows, dtype=SAMPLE_DTYPE)
+    samples["ts_us"] = np.arange(rows, dtype=np.int64) * int(1e6 / args.rate)
+    for name in SAMPLE_FIELDS:
+        samples[name] = rng.normal(0, 100, rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "session.csv")
+        imu_path = os.path.join(tmp, "session" + EXTENSION)
+
+        start = time.perf_counter()
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(CSV_HEADER)
+            for i in range(0, rows, CHUNK_ROWS):
+                f.write(format_csv_rows("Sensor_1", samples[i:i + CHUNK_ROWS]))
+        csv_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        writer = ColumnarWriter(imu_path, "Sensor_1")
+        for i in range(0, rows, CHUNK_ROWS):
+            writer.write(samples[i:i + CHUNK_ROWS])
+        writer.close()
+        imu_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = read_recording_csv(csv_path)["Sensor_1"]
+        csv_read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rec = open_recording(imu_path)
+        imu_open = time.perf_counter() - start
+        start = time.perf_counter()
+        checksum = float(rec["ax"].sum()) + int(rec.ts_us[-1])
+        imu_scan = time.perf_counter() - start
+
+        assert np.array_equal(rec.ts_us, loaded[0]) and len(rec) == rows
+        print(f"{rows:,} rows ({args.hours} h at {args.rate} Hz), checksum {checksum:.1f}")
+        print(f"  CSV      write {csv_write:7.2f} s   size {os.path.getsize(csv_path) / 1e6:8.1f} MB   parse {csv_read:7.2f} s")
+        size = sum(os.path.getsize(_column_path(imu_path, name)) for name in COLUMNS)
+        print(f"  columnar write {imu_write:7.2f} s   size {size / 1e6:8.1f} MB   open  {imu_open * 1e3:7.2f} ms"
+              f"   full scan of one column {imu_scan * 1e3:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary columnar IMU recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("convert", help="convert CSV recordings (file or directory) to .imu")
+    p.add_argument("path")
+    p.add_argument("--out", help="output directory (default: next to each CSV)")
+    p.set_defaults(func=_cmd_convert)
+    p = sub.add_parser("info", help="summarize an .imu recording")
+    p.add_argument("path")
+    p.set_defaults(func=_cmd_info)
+    p = sub.add_parser("bench", help="compare CSV and columnar write/read on a synthetic session")
+    p.add_argument("--hours", type=float, default=1.0)
+    p.add_argument("--rate", type=float, default=100.0, help="samples per second")
+    p.set_defaults(func=_cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
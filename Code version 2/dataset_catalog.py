@@ -0,0 +1,344 @@
+"""Catalog of the recordings under a data directory, with a persistent index.
+
+Recordings in ``data/`` come in several shapes:
+
+* ``Sensor_1_<label>_<YYYYmmdd>_<HHMMSS>.csv`` from EspServer.py
+  (``ID,Status,AccX,...,Timestamp,Timestamp_us``, schema "v2"), also as
+  ``Senso1_...`` or ``Sensor_...`` when the node ID was set differently;
+* ``sensor_data_log_<YYYYmmdd>_<HHMMSS>.csv`` from Code version 1
+  (``Sensor1, ax, ..., gz, mm:ss:us``, schema "v1");
+* ``.imu`` directories (columnar_format.py, schema "imu");
+* header-only or single-row files left by a start/stop without data.
+
+``Catalog.refresh()`` scans each file once and stores its metadata in
+``catalog.json`` in the data directory.  Entries are keyed by relative path
+and validated by mtime and size, so a refresh only reads new or changed
+files.  Each entry has: schema, node, label, date, start time (from the file
+name), duration and row count (from the node timestamps after
+timestamp_repair), measured rate, a content hash and quality flags (FLAG_*).
+
+    catalog = Catalog("../data")
+    catalog.refresh()
+    catalog.query(label="ohayo", date="0705", min_duration_s=60)
+
+    python dataset_catalog.py ../data query --label ohayo --date 0705 --min-duration 60
+    python dataset_catalog.py ../data latest
+"""
+import argparse
+import datetime
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from columnar_format import EXTENSION as COLUMNAR_EXTENSION, META_FILE
+from recording_loader import SCHEMA_IMU, SCHEMA_UNKNOWN, SCHEMA_V1, SCHEMA_V2, load_recording
+from timestamp_repair import repair_timestamps
+
+INDEX_NAME = "catalog.json"
+INDEX_VERSION = 2  # 2: .imu directories are hashed too
+
+MIN_ROWS = 10  # Fewer rows: a start/stop without a session
+GAP_FACTOR = 2.5  # Same definition as link_stats.py
+GAP_SHARE = 0.01  # Flag "gaps" when more than this share of intervals are gaps
+
+FLAG_EMPTY = "empty"  # No data rows
+FLAG_SHORT = "short"  # Fewer than MIN_ROWS rows
+FLAG_BAD_ROWS = "bad_rows"  # Lines that did not parse
+FLAG_MULTI_NODE = "multi_node"
+FLAG_GAPS = "gaps"  # Missing samples (intervals > GAP_FACTOR periods)
+FLAG_OUTLIERS = "ts_outliers"  # Isolated bad timestamps (repaired)
+FLAG_STEPS = "ts_steps"  # Node clock re-synced during the recording
+FLAG_BREAKS = "ts_breaks"  # Timestamp discontinuities (reboot, wraparound)
+FLAG_DUPLICATE = "duplicate"  # Same content as an earlier file in the catalog
+
+# <prefix>_<YYYYmmdd>_<HHMMSS><suffix>, e.g. Sensor_1_0014_20250707_160137-60rep
+_NAME_RE = re.compile(r"^(?P<prefix>.*?)_?(?P<date>\d{8})_(?P<time>\d{6})(?P<suffix>.*)$")
+_HASH_CHUNK = 1 << 20
+
+
+def _hash_file(path):
+    """SHA-1 of a CSV file, or of an .imu directory's file names and contents."""
+    digest = hashlib.sha1()
+    names = sorted(os.listdir(path)) if os.path.isdir(path) else [None]
+    for name in names:
+        if name is not None:
+            digest.update(name.encode("utf-8") + b"\0")
+        with open(path if name is None else os.path.join(path, name), "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat(path):
+    """(mtime_ns, size) of a CSV file or of an .imu directory's columns."""
+    if os.path.isdir(path):
+        stats = [os.stat(os.path.join(path, name)) for name in os.listdir(path)]
+        return max((s.st_mtime_ns for s in stats), default=0), sum(s.st_size for s in stats)
+    s = os.stat(path)
+    return s.st_mtime_ns, s.st_size
+
+
+def parse_file_name(name, node_id=None):
+    """(label, date YYYYmmdd, start ISO time, suffix) from a recording's file name.
+
+    The node ID (from the file's content) is stripped from the front of the
+    label when known; "sensor_data_log" files have no node in the name.
+    """
+    stem = name[:-len(COLUMNAR_EXTENSION)] if name.endswith(COLUMNAR_EXTENSION) else os.path.splitext(name)[0]
+    match = _NAME_RE.match(stem)
+    if match is None:
+        return stem, None, None, ""
+    prefix = match.group("prefix")
+    if node_id and prefix.startswith(node_id + "_"):
+        prefix = prefix[len(node_id) + 1:]
+    try:
+        started = datetime.datetime.strptime(match.group("date") + match.group("time"), "%Y%m%d%H%M%S").isoformat()
+    except ValueError:
+        started = None
+    return prefix, match.group("date"), started, match.group("suffix")
+
+
+def _timing(ts_us):
+    """Duration (s), nominal period (ms), delivered rate (Hz) and flags from one node's timestamps."""
+    flags = []
+    if len(ts_us) < 2:
+        return 0.0, None, 0.0, flags
+    result = repair_timestamps(ts_us)
+    duration = float(result.ts_us[-1] - result.ts_us[0]) / 1e6
+    dt = np.diff(result.ts_us)
+    gaps = int(np.count_nonzero(dt > GAP_FACTOR * result.period_us))
+    if gaps > GAP_SHARE * len(dt):
+        flags.append(FLAG_GAPS)
+    if result.outliers.any():
+        flags.append(FLAG_OUTLIERS)
+    if result.steps:
+        flags.append(FLAG_STEPS)
+    if result.discontinuities:
+        flags.append(FLAG_BREAKS)
+    rate = (len(ts_us) - 1) / duration if duration > 0 else 0.0
+    return duration, result.period_us / 1000, rate, flags
+
+
+def scan_recording(path):
+    """Metadata of one recording (CSV file or .imu directory); see the module docstring."""
+    rec = load_recording(path)
+    schema = rec.schema
+    if len(rec.node_ids) > 1:
+        nodes = {node_id: rec.samples["ts_us"][rec.samples["node"] == i]
+                 for i, node_id in enumerate(rec.node_ids)}
+    else:
+        nodes = {node_id: rec.samples["ts_us"] for node_id in rec.node_ids}
+    node_ids = sorted(nodes, key=lambda n: -len(nodes[n]))
+    node_id = node_ids[0] if node_ids else None
+    rows = sum(len(ts) for ts in nodes.values())
+    label, date, started, suffix = parse_file_name(os.path.basename(path), node_id)
+    # Timing of the main node; other nodes of a multi-node file only add flags
+    duration, period_ms, rate, flags = _timing(nodes[node_id]) if node_id else (0.0, None, 0.0, [])
+    if not rows:
+        flags.append(FLAG_EMPTY)
+    elif rows < MIN_ROWS:
+        flags.append(FLAG_SHORT)
+    if rec.bad_rows:
+        flags.append(FLAG_BAD_ROWS)
+    if len(node_ids) > 1:
+        flags.append(FLAG_MULTI_NODE)
+    return {
+        "schema": schema,
+        "node": node_id,
+        "nodes": node_ids,
+        "label": label,
+        "suffix": suffix,
+        "date": date,
+        "started": started,
+        "duration_s": round(duration, 3),
+        "rows": rows,
+        "bad_rows": rec.bad_rows,
+        "rate_hz": round(rate, 3),
+        "period_ms": round(period_ms, 3) if period_ms else None,
+        "sha1": _hash_file(path),
+        "flags": flags,
+    }
+
+
+def iter_recordings(root):
+    """CSV files and .imu directories under ``root`` (the index file itself excluded)."""
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in list(dirs):
+            if name.endswith(COLUMNAR_EXTENSION) and os.path.exists(os.path.join(directory, name, META_FILE)):
+                dirs.remove(name)  # A recording, not a folder to descend into
+                yield os.path.join(directory, name)
+        for name in sorted(files):
+            if name.lower().endswith(".csv"):
+                yield os.path.join(directory, name)
+
+
+class Catalog:
+    """Index of the recordings under ``root``, persisted in ``root/catalog.json``."""
+
+    def __init__(self, root, index_path=None):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path or os.path.join(self.root, INDEX_NAME)
+        self.entries = {}  # relative path (with /) -> entry
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        data = {"version": INDEX_VERSION, "root": self.root, "updated": round(time.time(), 3), "entries": self.entries}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def path_of(self, entry):
+        return os.path.join(self.root, *entry["path"].split("/"))
+
+    def refresh(self, save=True):
+        """Scan new and changed recordings, drop removed ones; returns {"added", "updated", "removed", "unchanged"}."""
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        for path in iter_recordings(self.root):
+            key = os.path.relpath(path, self.root).replace(os.sep, "/")
+            seen.add(key)
+            try:
+                mtime_ns, size = _stat(path)
+                old = self.entries.get(key)
+                if old is not None and old["mtime_ns"] == mtime_ns and old["size"] == size:
+                    counts["unchanged"] += 1
+                    continue
+                entry = scan_recording(path)
+            except (OSError, ValueError) as e:
+                print(f"Skipped {key}: {e}")
+                continue
+            entry.update(path=key, folder=os.path.dirname(key), mtime_ns=mtime_ns, size=size)
+            counts["updated" if key in self.entries else "added"] += 1
+            self.entries[key] = entry
+        for key in set(self.entries) - seen:
+            del self.entries[key]
+            counts["removed"] += 1
+        if counts["added"] or counts["updated"] or counts["removed"]:
+            self._mark_duplicates()
+            if save:
+                self.save()
+        return counts
+
+    def _mark_duplicates(self):
+        first = {}
+        for key in sorted(self.entries, key=lambda k: (len(k), k)):  # "x(1).csv" sorts after "x.csv"
+            entry = self.entries[key]
+            flags = [f for f in entry["flags"] if f != FLAG_DUPLICATE]
+            entry.pop("duplicate_of", None)
+            digest = entry.get("sha1")
+            if digest and entry["rows"]:
+                if digest in first:
+                    flags.append(FLAG_DUPLICATE)
+                    entry["duplicate_of"] = first[digest]
+                else:
+                    first[digest] = key
+            entry["flags"] = flags
+
+    def query(self, label=None, node=None, date=None, folder=None, schema=None, min_duration_s=None,
+              max_duration_s=None, min_rows=None, with_flags=(), without_flags=()):
+        """Entries matching every given filter, oldest first.
+
+        ``label`` and ``node`` accept shell wildcards (``"00*"``).  ``date``
+        is YYYYmmdd or mmdd and matches the date in the file name; ``folder``
+        is the sub-directory (``"0705"``).
+        """
+        matches = []
+        for entry in self.entries.values():
+            if label is not None and not fnmatch.fnmatchcase(entry["label"], label):
+                continue
+            if node is not None and not any(fnmatch.fnmatchcase(n, node) for n in entry["nodes"]):
+                continue
+            if date is not None and not (entry["date"] or "").endswith(date):
+                continue
+            if folder is not None and entry["folder"] != folder:
+                continue
+            if schema is not None and entry["schema"] != schema:
+                continue
+            if min_duration_s is not None and entry["duration_s"] < min_duration_s:
+                continue
+            if max_duration_s is not None and entry["duration_s"] > max_duration_s:
+                continue
+            if min_rows is not None and entry["rows"] < min_rows:
+                continue
+            if any(f not in entry["flags"] for f in with_flags) or any(f in entry["flags"] for f in without_flags):
+                continue
+            matches.append(entry)
+        return sorted(matches, key=lambda e: (e["started"] or "", e["path"]))
+
+    def latest(self, **filters):
+        """Newest recording (by start time in the file name) with data, or None."""
+        filters.setdefault("without_flags", (FLAG_EMPTY, FLAG_SHORT, FLAG_DUPLICATE))
+        matches = self.query(**filters)
+        return matches[-1] if matches else None
+
+
+def format_entry(entry):
+    flags = ",".join(entry["flags"]) or "-"
+    return (f"{entry['path']:<58} {entry['schema']:<4} {entry['node'] or '-':<9} {entry['label']:<16} "
+            f"{entry['started'] or '-':<19} {entry['duration_s']:8.1f} s {entry['rows']:>7} rows "
+            f"{entry['rate_hz']:6.2f} Hz  {flags}")
+
+
+def _query_filters(args):
+    return {
+        "label": args.label, "node": args.node, "date": args.date, "folder": args.folder, "schema": args.schema,
+        "min_duration_s": args.min_duration, "max_duration_s": args.max_duration, "min_rows": args.min_rows,
+        "with_flags": args.flag or (), "without_flags": args.exclude or (),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and query the recordings of a data directory")
+    parser.add_argument("root", help="data directory (the index is kept in <root>/catalog.json)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("refresh", help="scan new and changed recordings")
+    for name, text in (("query", "list matching recordings"), ("latest", "newest matching recording with data")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--label", help="label, wildcards allowed (ohayo, 00*)")
+        p.add_argument("--node")
+        p.add_argument("--date", help="YYYYmmdd or mmdd from the file name")
+        p.add_argument("--folder", help="sub-directory, e.g. 0705")
+        p.add_argument("--schema", choices=(SCHEMA_V1, SCHEMA_V2, SCHEMA_IMU, SCHEMA_UNKNOWN))
+        p.add_argument("--min-duration", type=float, help="seconds")
+        p.add_argument("--max-duration", type=float, help="seconds")
+        p.add_argument("--min-rows", type=int)
+        p.add_argument("--flag", action="append", help="require this quality flag")
+        p.add_argument("--exclude", action="append", help="skip recordings with this quality flag")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.root)
+    started = time.perf_counter()
+    counts = catalog.refresh()
+    print(f"{len(catalog.entries)} recordings ({counts['added']} new, {counts['updated']} changed, "
+          f"{counts['removed']} removed) in {(time.perf_counter() - started) * 1000:.0f} ms")
+    if args.command == "refresh":
+        return
+    if args.command == "latest":
+        entry = catalog.latest(**{k: v for k, v in _query_filters(args).items() if v not in (None, ())})
+        print(format_entry(entry) if entry else "No recording matches.")
+        return
+    entries = catalog.query(**_query_filters(args))
+    for entry in entries:
+        print(format_entry(entry))
+    print(f"{len(entries)} recordings, {sum(e['duration_s'] for e in entries):.0f} s, "
+          f"{sum(e['rows'] for e in entries)} rows")
+
+
+if __name__ == "__main__":
+    main()
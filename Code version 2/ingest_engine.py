@@ -0,0 +1,493 @@
+"""Headless acquisition engine for the ESP32 serial bridge.
+
+``IngestEngine`` owns everything that used to live in EspServer.py module
+globals: the serial port, the reader thread, parsing, per-node state,
+recording and counters.  It has no Tk or matplotlib dependency, so it can
+run on a headless lab machine or inside scripts; the GUI subscribes to it.
+
+Besides a serial port, the engine can act as the UDP gateway itself
+(``udp://host:port``, see udp_gateway.py), skipping the ESP32's serial hop.
+
+With ``resample_hz`` the recorder gets every node on one uniform time grid
+(resampler.StreamingResampler) instead of the raw samples.  A grid row is
+recorded once every live node has passed it, so the last fraction of a
+second before stop_recording is not in the files.
+
+Headless usage:
+
+    python ingest_engine.py --port /dev/ttyUSB0 --out ../data --name session_01
+    python ingest_engine.py --port udp://0.0.0.0:1234
+    python ingest_engine.py --port COM8 --repair-timestamps --resample-hz 10 --out ../data
+"""
+import argparse
+import asyncio
+import collections
+import threading
+import time
+
+import serial
+
+from bounded_queue import POLICY_SPILL, QUEUE_POLICIES, format_queue_stats
+from latency import LATENCY, SamplingProfiler, format_latency
+from link_stats import LinkStats, format_link_stats, write_snapshot
+from rate_controller import MAX_FREQ, RateController, parse_node_config
+from rep_detector import DEFAULT_LATENCY_S, RepMonitor, format_reps
+from recorder import FLUSH_MS, FLUSH_ROWS, FSYNC_POLICIES, RECORD_FORMATS, SampleRecorder
+from resampler import StreamingResampler, grid_samples
+from ring_buffer import DEFAULT_CAPACITY, SampleStore
+from sensor_parser import (
+    NodeIndex, LINE_HANDSHAKE, format_microseconds_to_mmss_us, parse_line, parse_lines_to_array,
+)
+from serial_reader import BATCH_INTERVAL_S, ChunkedLineReader, read_line_batches
+from segmentation import DEFAULT_DISTANCE, DEFAULT_THRESHOLD
+from timestamp_repair import StreamingTimestampRepair
+from udp_gateway import UDP_PORT, UdpGateway
+
+BAUD_RATE = 115200
+UDP_SCHEME = "udp://"
+
+# One delivery to subscribers: the raw lines, the decoded samples
+# (SAMPLE_DTYPE array) and (kind, value, line) for every non-sample line
+IngestBatch = collections.namedtuple("IngestBatch", "lines samples events")
+
+
+def _print_log(level, text):
+    print(f"[{level}] {text}")
+
+
+class IngestEngine:
+    """Serial open/read/parse/record/stats without any GUI."""
+
+    def __init__(self, baud_rate=BAUD_RATE, batch_interval=BATCH_INTERVAL_S, log=None,
+                 history=DEFAULT_CAPACITY, repair_timestamps=False, resample_hz=None):
+        self.baud_rate = baud_rate
+        self.batch_interval = batch_interval
+        self.log = log or _print_log
+        self.on_error = None  # Called from the reader thread with a message when reading fails
+        self.ser = None
+        self.port_name = None
+        self.running = False
+        self.node_index = NodeIndex()
+        # Per-node sample history shared by plots/stats/analysis (history=0: none, e.g. in reader processes)
+        self.buffers = SampleStore(history) if history else None
+        self.recorder = None
+        # Removes outliers, re-sync steps and drift from node timestamps before anything sees them
+        self.timestamp_repair = StreamingTimestampRepair() if repair_timestamps else None
+        # Records a uniform grid instead of the raw samples (a new one per session)
+        self.resample_hz = resample_hz
+        self.resampler = self._new_resampler()
+        self.link_stats = LinkStats()
+        self._subscribers = []
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.RLock()  # Reader thread vs. stop_recording/close releasing held rows
+        self._thread = None
+        self._reader = None
+        self.gateway = None  # UdpGateway when reading from udp://
+        self.reset_stats()
+
+    # --- Connection ---
+    def open(self, port):
+        """Open ``port`` (a serial device or ``udp://host:port``) and start reading.
+
+        Raises serial.SerialException for serial ports and OSError for UDP.
+        """
+        if self.running:
+            raise RuntimeError("Engine is already running")
+        if port.startswith(UDP_SCHEME):
+            host, _, udp_port = port[len(UDP_SCHEME):].rpartition(":")
+            self.open_udp(host or "0.0.0.0", int(udp_port or UDP_PORT))
+            return
+        self.ser = serial.Serial(port, self.baud_rate, timeout=0.1)
+        self.port_name = port
+        self.start_reader(self.ser)
+
+    def _reset_session(self):
+        self.running = True
+        self.reset_stats()
+        with self._lock:
+            self._nodes.clear()
+        if self.buffers is not None:
+            self.buffers.clear()
+        if self.timestamp_repair is not None:
+            self.timestamp_repair.reset()
+        self.resampler = self._new_resampler()
+        self.link_stats.reset()
+
+    def start_reader(self, ser):
+        """Start reading from an already open serial-like object."""
+        self.ser = ser
+        self._reset_session()
+        self._reader = ChunkedLineReader(ser)
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def open_udp(self, host="0.0.0.0", port=UDP_PORT, broadcast=None):
+        """Be the UDP gateway on ``host:port`` instead of reading the ESP32 over serial."""
+        if self.running:
+            raise RuntimeError("Engine is already running")
+        self.gateway = UdpGateway(self.feed_lines, batch_interval=self.batch_interval,
+                                  broadcast=broadcast, log=self.log)
+        self.port_name = f"{UDP_SCHEME}{host}:{port}"
+        self._reader = None
+        self._reset_session()
+        ready = threading.Event()
+        errors = []
+        self._thread = threading.Thread(target=self._udp_loop, args=(host, port, ready, errors), daemon=True)
+        self._thread.start()
+        ready.wait(timeout=5.0)
+        if errors or not ready.is_set():
+            self.running = False
+            self.gateway = None
+            raise errors[0] if errors else OSError(f"UDP gateway did not start on {host}:{port}")
+
+    def _udp_loop(self, host, port, ready, errors):
+        try:
+            asyncio.run(self.gateway.serve(host, port, ready))
+        except OSError as e:
+            if not ready.is_set():
+                errors.append(e)
+                ready.set()
+            else:
+                self._fail(f"Lỗi UDP trong khi nhận: {e}")
+        except Exception as e:
+            self._fail(f"Lỗi không xác định trong khi nhận UDP: {e}")
+
+    def send_command(self, command):
+        """Send a bridge command (CONFIG:<node>:<accel>:<gyro>:<srd>:<freq>, LIST_CLIENTS).
+
+        Over serial the ESP32 answers on the port; as UDP gateway the reply
+        lines are fed through the normal path so subscribers see them too,
+        on the gateway thread like the node packets.
+        """
+        if self.gateway is not None:
+            reply = self.gateway.handle_command(command)
+            loop = self.gateway.loop
+            # NodeIndex, link stats and the timestamp repair are only fed from one thread
+            if loop is not None and loop.is_running():
+                loop.call_soon_threadsafe(self.feed_lines, reply.splitlines())
+            else:
+                self.feed_lines(reply.splitlines())
+            return reply
+        if self.ser is None or not self.ser.is_open:
+            raise RuntimeError("Engine is not connected")
+        self.ser.write((command.strip() + "\n").encode("utf-8"))
+        return None
+
+    def close(self):
+        """Stop recording and reading, then close the port."""
+        if self.is_recording:
+            self.stop_recording()
+        self.running = False
+        if self.gateway is not None:
+            self.gateway.stop()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        self.flush_timestamp_repair()
+        if self.gateway is not None:
+            self.gateway = None
+            self.log("INFO", "Đã dừng UDP gateway.")
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+            self.log("INFO", "Đã đóng cổng Serial.")
+        self.ser = None
+
+    def _read_loop(self):
+        try:
+            read_line_batches(self._reader, self.feed_lines,
+                              lambda: self.running and self.ser is not None and self.ser.is_open,
+                              self.batch_interval)
+        except serial.SerialException as e:
+            self._fail(f"Lỗi Serial trong khi đọc: {e}. Vui lòng kiểm tra kết nối.")
+        except Exception as e:
+            self._fail(f"Lỗi không xác định trong khi đọc: {e}")
+
+    def _fail(self, message):
+        self.running = False
+        if self.on_error:
+            self.on_error(message)
+        else:
+            self.log("ERROR", message)
+
+    # --- Subscribers ---
+    def subscribe(self, callback):
+        """Register ``callback(batch)``; it is called on the reader thread for every IngestBatch."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    # --- Processing ---
+    def feed_lines(self, lines):
+        """Parse a batch of lines, update node state, record and notify subscribers."""
+        started = time.perf_counter()
+        samples, other_lines = parse_lines_to_array(lines, self.node_index)
+        events = []
+        for line in other_lines:
+            kind, value = parse_line(line)
+            events.append((kind, value, line))
+        LATENCY.record("parse", time.perf_counter() - started)
+        self.lines_received += len(lines)
+        self.other_lines += len(other_lines)
+        if self._reader is not None:
+            self.bytes_received = self._reader.bytes_read
+        elif self.gateway is not None:
+            self.bytes_received = self.gateway.bytes_received
+        return self.feed_samples(samples, events, lines)
+
+    def feed_samples(self, samples, events=(), lines=()):
+        """Deliver already parsed samples (node indices of ``node_index``) and events."""
+        started = time.perf_counter()
+        with self._deliver_lock:
+            # Link statistics look at the timestamps as sent, before any repair
+            self.link_stats.update(samples, self.node_index.name_of, events, self.bytes_received)
+            if self.timestamp_repair is not None and len(samples):
+                samples = self.timestamp_repair.process(samples)
+            batch = self._deliver(samples, events, lines)
+        LATENCY.record("deliver", time.perf_counter() - started)
+        return batch
+
+    def flush_timestamp_repair(self):
+        """Deliver the rows the timestamp repair still holds back (called on stop_recording and close)."""
+        if self.timestamp_repair is None:
+            return
+        with self._deliver_lock:
+            samples = self.timestamp_repair.flush()
+            if len(samples):
+                self._deliver(samples, (), ())
+
+    def _deliver(self, samples, events, lines):
+        if self.buffers is not None:
+            self.buffers.extend_samples(samples, self.node_index)
+        self._update_nodes(samples, events)
+        self.samples_received += len(samples)
+        self.batches += 1
+
+        batch = IngestBatch(lines, samples, events)
+        if self.resampler is not None:
+            self.resampler.on_batch(batch)  # Records through _record_grid
+        else:
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.submit(samples)
+
+        for callback in list(self._subscribers):
+            callback(batch)
+        return batch
+
+    def _new_resampler(self):
+        return StreamingResampler(self.node_index, self.resample_hz, self._record_grid) if self.resample_hz else None
+
+    def _record_grid(self, grid_ts, values, valid, node_ids):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.submit(grid_samples(grid_ts, values, valid, [self.node_index.index_of(n) for n in node_ids]))
+
+    def _update_nodes(self, samples, events):
+        with self._lock:
+            for kind, value, _ in events:
+                if kind == LINE_HANDSHAKE:
+                    node = self._nodes.get(value)
+                    if node is None:
+                        self._nodes[value] = {
+                            "id": value,
+                            "ax": 0, "ay": 0, "az": 0,
+                            "gx": 0, "gy": 0, "gz": 0,
+                            "ts_us": 0,
+                            "ts_formatted": "00:00:000000",
+                            "status": "Connected (Handshake)",
+                            "samples": 0,
+                        }
+                    else:
+                        node["status"] = "Connected (Handshake)"
+            if not len(samples):
+                return
+            nodes = samples["node"]
+            for idx in set(nodes.tolist()):
+                rows = samples[nodes == idx]
+                _, ts_us, ax, ay, az, gx, gy, gz = rows[-1].tolist()
+                node_id = self.node_index.name_of(idx)
+                previous = self._nodes.get(node_id)
+                self._nodes[node_id] = {
+                    "id": node_id,
+                    "ax": ax, "ay": ay, "az": az,
+                    "gx": gx, "gy": gy, "gz": gz,
+                    "ts_us": ts_us,
+                    "ts_formatted": format_microseconds_to_mmss_us(ts_us),
+                    "status": "Active",
+                    "samples": (previous["samples"] if previous else 0) + len(rows),
+                }
+
+    def nodes_snapshot(self):
+        """Copy of the latest values per node, safe to use from another thread."""
+        with self._lock:
+            return {node_id: dict(data) for node_id, data in self._nodes.items()}
+
+    def node_name(self, idx):
+        return self.node_index.name_of(idx)
+
+    # --- Recording ---
+    @property
+    def is_recording(self):
+        return self.recorder is not None
+
+    def start_recording(self, directory, base_name, **options):
+        """Start recording; ``options`` go to SampleRecorder (record_format, flush_rows, flush_ms, fsync, ...)."""
+        if self.recorder is not None:
+            raise RuntimeError("Recording is already active")
+        recorder = SampleRecorder(directory, base_name, self.node_index, log=self.log, **options)
+        recorder.start()
+        self.recorder = recorder
+        self.log("INFO", "Đã bắt đầu ghi dữ liệu.")
+
+    def stop_recording(self):
+        # The last sample of a node may still be held by the timestamp repair
+        self.flush_timestamp_repair()
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            closed = recorder.stop()
+            s = recorder.stats()
+            self.log("INFO", "Đã dừng ghi dữ liệu. " + ("Tất cả file đã được đóng. " if closed else "")
+                     + f"({s['rows_written']} dòng, {s['rows_dropped']} bị bỏ, {s['flushes']} lần flush, "
+                       f"độ trễ max {s['latency_ms_max']:.0f} ms)")
+
+    # --- Stats ---
+    def reset_stats(self):
+        self.started_at = time.monotonic()
+        self.lines_received = 0
+        self.samples_received = 0
+        self.other_lines = 0
+        self.bytes_received = 0
+        self.batches = 0
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "port": self.port_name,
+            "elapsed_s": elapsed,
+            "lines": self.lines_received,
+            "samples": self.samples_received,
+            "other_lines": self.other_lines,
+            "bytes": self.bytes_received,
+            "batches": self.batches,
+            "samples_per_s": self.samples_received / elapsed,
+            "bytes_per_s": self.bytes_received / elapsed,
+            "recording": self.is_recording,
+            "rows_written": self.recorder.rows_written if self.recorder else 0,
+            "resampled_rows": self.resampler.rows_emitted if self.resampler else None,
+            "recorder": self.recorder.stats() if self.recorder else None,
+            "nodes": {node_id: data["samples"] for node_id, data in self.nodes_snapshot().items()},
+            "timestamps": self.timestamp_stats(),
+            "link": self.link_stats.snapshot(),
+        }
+
+    def timestamp_stats(self):
+        """Per node: period, drift, outliers, steps and discontinuities repaired (None when off)."""
+        if self.timestamp_repair is None:
+            return None
+        return {self.node_index.name_of(idx): s for idx, s in self.timestamp_repair.stats().items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless ESP32 sensor ingest")
+    parser.add_argument("--port", required=True, help="Serial port (COM8, /dev/ttyUSB0) or udp://0.0.0.0:1234")
+    parser.add_argument("--baud", type=int, default=BAUD_RATE)
+    parser.add_argument("--out", help="Directory to record CSV files into (no recording if omitted)")
+    parser.add_argument("--name", default="sensor_data", help="Base file name for recordings")
+    parser.add_argument("--format", choices=RECORD_FORMATS, default="csv", help="recording file format")
+    parser.add_argument("--flush-rows", type=int, default=FLUSH_ROWS, help="flush after N rows (0 = off)")
+    parser.add_argument("--flush-ms", type=float, default=FLUSH_MS, help="flush after T ms (0 = off)")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="stop", help="when flushed data is fsynced")
+    parser.add_argument("--queue-policy", choices=QUEUE_POLICIES, default=POLICY_SPILL,
+                        help="what recording does when the disk falls behind")
+    parser.add_argument("--spill-dir", help="directory for the recording queue's spill file (default: temp)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after N seconds (0 = until Ctrl+C)")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--repair-timestamps", action="store_true",
+                        help="remove timestamp outliers, re-sync steps and drift while ingesting")
+    parser.add_argument("--resample-hz", type=float,
+                        help="record every node on one uniform grid at this rate instead of the raw samples")
+    parser.add_argument("--link-stats", help="append per-node link statistics to this .csv or .jsonl file "
+                                             "every --stats-interval")
+    parser.add_argument("--latency", metavar="PATH",
+                        help="write stage latency histograms (JSON) here every --stats-interval")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run the sampling profiler and write collapsed stacks here every --stats-interval")
+    parser.add_argument("--adaptive-rate", action="store_true",
+                        help="raise/lower each node's freq (CONFIG) to keep the link under capacity")
+    parser.add_argument("--max-freq", type=int, default=MAX_FREQ, help="highest freq --adaptive-rate may set")
+    parser.add_argument("--node-config", type=parse_node_config, metavar="ACCEL:GYRO:SRD",
+                        help="settings resent with CONFIG for nodes whose HELLO was not seen")
+    parser.add_argument("--detect-reps", action="store_true", help="log each leg-press rep as it completes")
+    parser.add_argument("--rep-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="smoothed |acc| a rep's peak must exceed")
+    parser.add_argument("--rep-distance", type=int, default=DEFAULT_DISTANCE, help="minimum samples between peaks")
+    parser.add_argument("--rep-latency", type=float, default=DEFAULT_LATENCY_S,
+                        help="seconds after which a peak is decided (0 = exact, no limit)")
+    args = parser.parse_args()
+
+    engine = IngestEngine(baud_rate=args.baud, repair_timestamps=args.repair_timestamps,
+                          resample_hz=args.resample_hz)
+    engine.open(args.port)
+    if args.port.startswith(UDP_SCHEME):
+        engine.log("INFO", f"Đang nghe UDP {args.port}.")
+    else:
+        engine.log("INFO", f"Đã mở cổng Serial {args.port} với tốc độ {args.baud} bps.")
+    if args.out:
+        engine.start_recording(args.out, args.name, record_format=args.format, flush_rows=args.flush_rows,
+                               flush_ms=args.flush_ms, fsync=args.fsync, queue_policy=args.queue_policy,
+                               spill_dir=args.spill_dir)
+    controller = RateController(engine, max_freq=args.max_freq, default_config=args.node_config) \
+        if args.adaptive_rate else None
+    reps = RepMonitor(engine, threshold=args.rep_threshold, distance=args.rep_distance,
+                      max_latency_s=args.rep_latency) if args.detect_reps else None
+    profiler = SamplingProfiler() if args.profile else None
+    if profiler is not None:
+        profiler.start()
+
+    deadline = time.monotonic() + args.duration if args.duration > 0 else None
+    try:
+        while engine.running and (deadline is None or time.monotonic() < deadline):
+            time.sleep(min(args.stats_interval, max(deadline - time.monotonic(), 0)) if deadline else args.stats_interval)
+            s = engine.stats()
+            engine.log("STATS", f"{s['samples']} samples ({s['samples_per_s']:.1f}/s), "
+                                f"{s['bytes_per_s']:.0f} B/s, nodes={s['nodes']}, rows written={s['rows_written']}")
+            if s["recorder"]:
+                r = s["recorder"]
+                engine.log("STATS", f"recorder: dropped={r['rows_dropped']}, queued={r['queued_rows']}, "
+                                    f"flushes={r['flushes']}, latency last/max={r['latency_ms_last']:.0f}/"
+                                    f"{r['latency_ms_max']:.0f} ms")
+                engine.log("STATS", "queue " + format_queue_stats(r["queue"]))
+            for line in format_link_stats(s["link"]):
+                engine.log("STATS", line)
+            if args.link_stats:
+                write_snapshot(args.link_stats, s["link"], engine.link_stats.unattributed_failures)
+            for node_id, t in (s["timestamps"] or {}).items():
+                engine.log("STATS", f"timestamps {node_id}: outliers={t['outliers']}, steps={t['steps']}, "
+                                    f"breaks={t['discontinuities']}, drift={t['drift_ppm']:.0f} ppm")
+            for line in format_latency(LATENCY.snapshot()):
+                engine.log("STATS", line)
+            if reps is not None:
+                for line in format_reps(reps.snapshot()):
+                    engine.log("STATS", line)
+            if args.latency:
+                LATENCY.dump(args.latency)
+            if profiler is not None:
+                profiler.dump(args.profile)
+            if controller is not None:
+                controller.step()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        if args.latency:
+            LATENCY.dump(args.latency)
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+"""Several gateways at once: one reader process per serial port or UDP endpoint.
+
+Each reader process runs a headless IngestEngine on its port and writes the
+parsed samples into its own SharedSampleRing (shm_ring.py), so parsing runs
+on other cores than Tk and matplotlib, and samples reach the GUI, recorder
+and analytics without pickling.  Other processes can attach to a ring by
+name.  Handshake and chatter lines, log messages and errors are low volume
+and travel over a multiprocessing queue.
+
+The supervisor process reads the rings, maps every ring's node indices onto
+one NodeIndex and restarts readers that die, with backoff.  Stations
+usually reuse node IDs (every station has a Sensor_1).  With
+``qualify_nodes`` the IDs become ``Sensor_1@2`` (node @ station number, the
+port's position in the list).  Without it a repeated ID is reported,
+because the stations' samples would be merged.
+
+``SupervisedEngine`` is an IngestEngine fed from the rings, so EspServer.py
+and the recorder work unchanged:
+
+    python ingest_supervisor.py --port COM8 --port COM9 --port udp://0.0.0.0:1234 --out ../data
+    python EspServer.py --supervise          # then type "COM8, COM9" in the port box
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from bounded_queue import POLICY_SPILL, QUEUE_POLICIES
+from ingest_engine import BAUD_RATE, IngestEngine
+from link_stats import format_link_stats, write_snapshot
+from recorder import FLUSH_MS, FLUSH_ROWS, FSYNC_POLICIES, RECORD_FORMATS
+from rate_controller import MAX_FREQ, RateController, parse_node_config
+from rep_detector import DEFAULT_LATENCY_S, RepMonitor, format_reps
+from segmentation import DEFAULT_DISTANCE, DEFAULT_THRESHOLD
+from sensor_parser import LINE_HANDSHAKE, SAMPLE_DTYPE, NodeIndex
+from serial_reader import BATCH_INTERVAL_S
+from shm_ring import (
+    RING_CAPACITY, STATE_FAILED, STATE_RUNNING, STATE_STARTING, STATE_STOPPED, RingReader, SharedSampleRing,
+)
+
+PORT_SEPARATOR = ","
+START_TIMEOUT_S = 5.0  # How long start() waits for the readers to open their ports
+RESTART_DELAY_S = 1.0  # First restart delay, doubled per restart up to MAX_RESTART_DELAY_S
+MAX_RESTART_DELAY_S = 30.0
+STALE_HEARTBEAT_S = 5.0  # A running reader without heartbeat for this long is reported as stalled
+RATE_WINDOW_S = 1.0
+STATION_SEPARATOR = "@"
+
+
+def split_ports(spec):
+    """``"COM8, COM9"`` -> ``["COM8", "COM9"]``."""
+    return [port.strip() for port in spec.split(PORT_SEPARATOR) if port.strip()]
+
+
+# --- Reader process ---
+def reader_process(port, ring_name, messages, commands, stop, baud_rate, batch_interval):
+    """Body of one reader process: an IngestEngine on ``port`` writing into ring ``ring_name``."""
+    ring = SharedSampleRing.attach(ring_name)
+    ring.set_state(STATE_STARTING, pid=os.getpid())
+
+    def log(level, text):
+        messages.put(("log", port, level, text))
+
+    engine = IngestEngine(baud_rate=baud_rate, batch_interval=batch_interval, log=log, history=0)
+    # After a restart the ring already holds rows with the previous indices: keep them
+    for name in ring.node_names():
+        engine.node_index.index_of(name)
+    ring.publish_names(engine.node_index.names)
+
+    def on_batch(batch):
+        ring.publish_names(engine.node_index.names)
+        ring.write(batch.samples)
+        ring.heartbeat(engine.lines_received, engine.other_lines, engine.bytes_received)
+        if batch.events:
+            messages.put(("events", port, batch.events))
+
+    def on_error(message):
+        ring.count_error()
+        messages.put(("error", port, message))
+
+    engine.on_error = on_error
+    engine.subscribe(on_batch)
+    try:
+        engine.open(port)
+    except Exception as e:
+        messages.put(("error", port, f"Không thể mở cổng {port}: {e}"))
+        ring.count_error()
+        ring.set_state(STATE_FAILED)
+        ring.close()
+        sys.exit(1)
+
+    ring.set_state(STATE_RUNNING)
+    ring.heartbeat(0, 0, 0)
+    failed = False
+    try:
+        while not stop.is_set():
+            if not engine.running:
+                failed = True
+                break
+            try:
+                command = commands.get(timeout=0.2)
+            except queue.Empty:
+                command = None
+            if command:
+                try:
+                    engine.send_command(command)
+                except Exception as e:
+                    log("ERROR", f"Không thể gửi lệnh '{command}': {e}")
+            ring.heartbeat(engine.lines_received, engine.other_lines, engine.bytes_received)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        ring.set_state(STATE_FAILED if failed else STATE_STOPPED)
+        ring.close()
+    sys.exit(1 if failed else 0)
+
+
+# --- Supervisor ---
+class _Reader:
+    """Supervisor-side state of one reader process."""
+
+    def __init__(self, port, ring):
+        self.port = port
+        self.ring = ring
+        self.cursor = RingReader(ring)
+        self.process = None
+        self.commands = None
+        self.restarts = 0
+        self.next_start = 0.0
+        self.exitcode = None
+        self.last_error = None
+        self.lookup = np.zeros(0, dtype=np.uint16)  # Ring node index -> supervisor NodeIndex
+        self.samples_per_s = 0.0
+        self.bytes_per_s = 0.0
+        self._mark = (time.monotonic(), 0, 0)
+
+
+class IngestSupervisor:
+    """Starts, watches and reads one reader process per port."""
+
+    def __init__(self, ports, node_index=None, log=None, baud_rate=BAUD_RATE, batch_interval=BATCH_INTERVAL_S,
+                 capacity=RING_CAPACITY, restart=True, qualify_nodes=False):
+        if not ports:
+            raise ValueError("No ports to read")
+        self.ports = list(ports)
+        self.node_index = node_index if node_index is not None else NodeIndex()
+        self.log = log or (lambda level, text: print(f"[{level}] {text}"))
+        self.baud_rate = baud_rate
+        self.batch_interval = batch_interval
+        self.capacity = capacity
+        self.restart = restart
+        self.qualify_nodes = qualify_nodes
+        self._node_owner = {}  # Node ID -> reader, to route CONFIG and spot IDs used by two stations
+        self._shared_ids = set()
+        # spawn everywhere: Windows has nothing else, and forking a process that runs Tk is unsafe
+        self._ctx = multiprocessing.get_context("spawn")
+        self.readers = []
+        self.messages = None
+        self._stop = None
+        self._pending = []
+        self._stopping = False
+
+    def start(self, timeout=START_TIMEOUT_S):
+        """Start all readers and wait until each has opened its port or failed.
+
+        Raises OSError when no reader could open its port.
+        """
+        self.messages = self._ctx.Queue()
+        self._stop = self._ctx.Event()
+        self._stopping = False
+        for port in self.ports:
+            reader = _Reader(port, SharedSampleRing.create(self.capacity))
+            self.readers.append(reader)
+            self._spawn(reader)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            states = [reader.ring.status()["state"] for reader in self.readers]
+            if "starting" not in states:
+                break
+            time.sleep(0.05)
+        self._pending.extend(self._get_messages())
+        if all(reader.ring.status()["state"] == "failed" for reader in self.readers):
+            errors = "; ".join(reader.last_error or reader.port for reader in self.readers)
+            self.stop()
+            raise OSError(f"Không mở được cổng nào: {errors}")
+
+    def _spawn(self, reader):
+        reader.commands = self._ctx.Queue()
+        reader.ring.set_state(STATE_STARTING)
+        reader.process = self._ctx.Process(
+            target=reader_process, name=f"reader {reader.port}", daemon=True,
+            args=(reader.port, reader.ring.name, self.messages, reader.commands, self._stop,
+                  self.baud_rate, self.batch_interval))
+        reader.process.start()
+
+    def poll(self):
+        """Restart readers that exited; call periodically from the consuming thread."""
+        if self._stopping or not self.restart:
+            return
+        now = time.monotonic()
+        for reader in self.readers:
+            process = reader.process
+            if process is not None and not process.is_alive():
+                process.join(0)
+                reader.exitcode = process.exitcode
+                reader.process = None
+                delay = min(RESTART_DELAY_S * 2 ** reader.restarts, MAX_RESTART_DELAY_S)
+                reader.next_start = now + delay
+                self.log("WARN", f"[{reader.port}] Tiến trình đọc đã dừng (mã {reader.exitcode}), "
+                                 f"khởi động lại sau {delay:.0f} s.")
+            elif process is None and now >= reader.next_start:
+                reader.restarts += 1
+                self._spawn(reader)
+
+    def _get_messages(self):
+        messages = []
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                break
+            if message[0] == "error":
+                for reader in self.readers:
+                    if reader.port == message[1]:
+                        reader.last_error = message[2]
+            messages.append(message)
+        return messages
+
+    def drain_messages(self):
+        """("log", port, level, text), ("events", port, [(kind, value, line)]) and ("error", port, text)."""
+        messages, self._pending = self._pending, []
+        return messages + self._get_messages()
+
+    def read(self):
+        """New samples of all readers as one SAMPLE_DTYPE array, node indices of ``node_index``."""
+        parts = []
+        for reader in self.readers:
+            rows = reader.cursor.read()
+            if not len(rows):
+                continue
+            names = reader.ring.node_names()
+            if len(names) > len(reader.lookup):
+                reader.lookup = np.array([self._global_index(reader, name) for name in names], dtype=np.uint16)
+            rows["node"] = reader.lookup[rows["node"]]
+            parts.append(rows)
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def node_name(self, port, node_id):
+        """Node ID as it appears in ``node_index`` for a node of the reader on ``port``."""
+        if not self.qualify_nodes:
+            return node_id
+        return f"{node_id}{STATION_SEPARATOR}{self.ports.index(port) + 1}"
+
+    def _global_index(self, reader, name):
+        name = self.node_name(reader.port, name)
+        owner = self._node_owner.setdefault(name, reader)
+        if owner is not reader and (name, reader.port) not in self._shared_ids:
+            self._shared_ids.add((name, reader.port))
+            self.log("WARN", f"Node '{name}' xuất hiện trên cả {owner.port} và {reader.port}; dữ liệu sẽ bị gộp "
+                             f"(dùng qualify_nodes / --qualify-nodes để tách theo trạm).")
+        return self.node_index.index_of(name)
+
+    def route(self, node_id):
+        """(port, node ID as the station knows it) for a node ID of ``node_index``."""
+        reader = self._node_owner.get(node_id)
+        if reader is None:
+            return None, None
+        if self.qualify_nodes:
+            node_id = node_id.rpartition(STATION_SEPARATOR)[0]
+        return reader.port, node_id
+
+    def send_command(self, command, port=None):
+        """Queue a bridge command for the reader of ``port`` (all readers if None)."""
+        for reader in self.readers:
+            if (port is None or reader.port == port) and reader.process is not None:
+                reader.commands.put(command)
+
+    def totals(self):
+        """(lines, bytes) received by all readers since they (re)started."""
+        statuses = [reader.ring.status() for reader in self.readers]
+        return sum(s["lines"] for s in statuses), sum(s["bytes"] for s in statuses)
+
+    def health(self):
+        """One dict per reader: process, ring and throughput state."""
+        now = time.monotonic()
+        report = []
+        for reader in self.readers:
+            status = reader.ring.status()
+            mark_time, mark_samples, mark_bytes = reader._mark
+            if now - mark_time >= RATE_WINDOW_S:
+                reader.samples_per_s = (status["samples"] - mark_samples) / (now - mark_time)
+                reader.bytes_per_s = max(status["bytes"] - mark_bytes, 0) / (now - mark_time)
+                reader._mark = (now, status["samples"], status["bytes"])
+            state = status["state"]
+            alive = reader.process is not None and reader.process.is_alive()
+            if state == "running" and not alive:
+                state = "exited"
+            elif state == "running" and (status["heartbeat_age_s"] or 0) > STALE_HEARTBEAT_S:
+                state = "stalled"
+            report.append({
+                "port": reader.port,
+                "pid": status["pid"] if alive else None,
+                "alive": alive,
+                "state": state,
+                "restarts": reader.restarts,
+                "exitcode": reader.exitcode,
+                "samples": status["samples"],
+                "samples_per_s": reader.samples_per_s,
+                "bytes_per_s": reader.bytes_per_s,
+                "lines": status["lines"],
+                "other_lines": status["other_lines"],
+                "errors": status["errors"],
+                "last_error": reader.last_error,
+                "heartbeat_age_s": status["heartbeat_age_s"],
+                "nodes": list(reader.ring.node_names()),
+                "rows_lost": reader.cursor.rows_lost,
+                "ring": reader.ring.name,
+            })
+        return report
+
+    def stop(self, timeout=2.0):
+        self._stopping = True
+        if self._stop is not None:
+            self._stop.set()
+        deadline = time.monotonic() + timeout
+        for reader in self.readers:
+            if reader.process is not None:
+                reader.process.join(max(deadline - time.monotonic(), 0.1))
+                if reader.process.is_alive():
+                    reader.process.terminate()
+                    reader.process.join(1.0)
+                reader.process = None
+        for reader in self.readers:
+            reader.ring.close()
+        self.readers = []
+
+
+def format_health(report):
+    """Health table as text lines (CLI and GUI log)."""
+    lines = [f"{'Port':<24}{'PID':>8}  {'State':<9}{'Samples/s':>10}{'B/s':>9}{'Nodes':>6}"
+             f"{'Restarts':>9}{'Lost':>7}{'Errors':>7}"]
+    for r in report:
+        lines.append(f"{r['port']:<24}{r['pid'] or '-':>8}  {r['state']:<9}{r['samples_per_s']:>10.1f}"
+                     f"{r['bytes_per_s']:>9.0f}{len(r['nodes']):>6}{r['restarts']:>9}{r['rows_lost']:>7}"
+                     f"{r['errors']:>7}")
+    return lines
+
+
+# --- IngestEngine front end ---
+class SupervisedEngine(IngestEngine):
+    """IngestEngine fed by reader processes; ``open("COM8, COM9, udp://0.0.0.0:1234")``."""
+
+    def __init__(self, capacity=RING_CAPACITY, qualify_nodes=False, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self.qualify_nodes = qualify_nodes
+        self.supervisor = None
+
+    def open(self, port):
+        """Start one reader process per port in ``port`` (separated by commas).
+
+        Raises OSError when none of them could be opened.
+        """
+        if self.running:
+            raise RuntimeError("Engine is already running")
+        ports = split_ports(port)
+        supervisor = IngestSupervisor(ports, node_index=self.node_index, log=self.log, baud_rate=self.baud_rate,
+                                      batch_interval=self.batch_interval, capacity=self.capacity,
+                                      qualify_nodes=self.qualify_nodes)
+        supervisor.start()
+        self.supervisor = supervisor
+        self.port_name = ", ".join(ports)
+        self._reader = None
+        self._reset_session()
+        self._thread = threading.Thread(target=self._pump_loop, daemon=True)
+        self._thread.start()
+
+    def _pump_loop(self):
+        try:
+            while self.running:
+                time.sleep(self.batch_interval)
+                self.pump()
+        except Exception as e:
+            self._fail(f"Lỗi không xác định khi đọc từ các tiến trình đọc: {e}")
+
+    def pump(self):
+        """Move everything the readers produced since the last call into the engine."""
+        supervisor = self.supervisor
+        supervisor.poll()
+        events, lines = [], []
+        for message in supervisor.drain_messages():
+            kind, port = message[0], message[1]
+            if kind == "events":
+                for event_kind, value, line in message[2]:
+                    if event_kind == LINE_HANDSHAKE:
+                        value = supervisor.node_name(port, value)
+                    events.append((event_kind, value, line))
+                    lines.append(line)
+            elif kind == "log":
+                self.log(message[2], f"[{port}] {message[3]}")
+            elif kind == "error":
+                self.log("ERROR", f"[{port}] {message[2]}")
+        samples = supervisor.read()
+        self.other_lines += len(events)
+        self.lines_received, self.bytes_received = supervisor.totals()
+        if len(samples) or events:
+            self.feed_samples(samples, events, lines)
+
+    def send_command(self, command):
+        """CONFIG goes to the reader that receives the node, other commands to every reader."""
+        if self.supervisor is None:
+            raise RuntimeError("Engine is not connected")
+        port = None
+        if command.startswith("CONFIG:"):
+            parts = command.strip().split(":")
+            port, parts[1] = self.supervisor.route(parts[1]) if len(parts) > 1 else (None, None)
+            if port is None:
+                self.log("WARN", f"Không tìm thấy cổng của Node trong lệnh '{command.strip()}'.")
+                return None
+            command = ":".join(parts)
+        self.supervisor.send_command(command, port)
+        return None
+
+    def close(self):
+        if self.is_recording:
+            self.stop_recording()
+        self.running = False
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+        self.flush_timestamp_repair()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+            self.log("INFO", "Đã dừng các tiến trình đọc.")
+
+    def stats(self):
+        stats = super().stats()
+        stats["readers"] = self.supervisor.health() if self.supervisor else []
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One reader process per serial port / UDP endpoint")
+    parser.add_argument("--port", action="append", required=True,
+                        help="serial port or udp://host:port; repeat or separate with commas")
+    parser.add_argument("--baud", type=int, default=BAUD_RATE)
+    parser.add_argument("--capacity", type=int, default=RING_CAPACITY, help="rows per shared-memory ring")
+    parser.add_argument("--qualify-nodes", action="store_true", help="name nodes <id>@<station number>")
+    parser.add_argument("--out", help="Directory to record into (no recording if omitted)")
+    parser.add_argument("--name", default="sensor_data")
+    parser.add_argument("--format", choices=RECORD_FORMATS, default="csv", help="recording file format")
+    parser.add_argument("--flush-rows", type=int, default=FLUSH_ROWS)
+    parser.add_argument("--flush-ms", type=float, default=FLUSH_MS)
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="stop")
+    parser.add_argument("--queue-policy", choices=QUEUE_POLICIES, default=POLICY_SPILL,
+                        help="what recording does when the disk falls behind")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after N seconds (0 = until Ctrl+C)")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--repair-timestamps", action="store_true",
+                        help="remove timestamp outliers, re-sync steps and drift while ingesting")
+    parser.add_argument("--resample-hz", type=float,
+                        help="record every node on one uniform grid at this rate instead of the raw samples")
+    parser.add_argument("--link-stats", help="append per-node link statistics to this .csv or .jsonl file")
+    parser.add_argument("--adaptive-rate", action="store_true",
+                        help="raise/lower each node's freq (CONFIG) to keep every link under capacity")
+    parser.add_argument("--max-freq", type=int, default=MAX_FREQ, help="highest freq --adaptive-rate may set")
+    parser.add_argument("--node-config", type=parse_node_config, metavar="ACCEL:GYRO:SRD",
+                        help="settings resent with CONFIG for nodes whose HELLO was not seen")
+    parser.add_argument("--detect-reps", action="store_true", help="log each leg-press rep as it completes")
+    parser.add_argument("--rep-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="smoothed |acc| a rep's peak must exceed")
+    parser.add_argument("--rep-distance", type=int, default=DEFAULT_DISTANCE, help="minimum samples between peaks")
+    parser.add_argument("--rep-latency", type=float, default=DEFAULT_LATENCY_S,
+                        help="seconds after which a peak is decided (0 = exact, no limit)")
+    args = parser.parse_args()
+
+    engine = SupervisedEngine(capacity=args.capacity, qualify_nodes=args.qualify_nodes, baud_rate=args.baud,
+                              repair_timestamps=args.repair_timestamps, resample_hz=args.resample_hz)
+    engine.open(PORT_SEPARATOR.join(args.port))
+    engine.log("INFO", f"Đang đọc {engine.port_name}")
+    if args.out:
+        engine.start_recording(args.out, args.name, record_format=args.format, flush_rows=args.flush_rows,
+                               flush_ms=args.flush_ms, fsync=args.fsync, queue_policy=args.queue_policy)
+    controller = RateController(engine, max_freq=args.max_freq, default_config=args.node_config) \
+        if args.adaptive_rate else None
+    reps = RepMonitor(engine, threshold=args.rep_threshold, distance=args.rep_distance,
+                      max_latency_s=args.rep_latency) if args.detect_reps else None
+    deadline = time.monotonic() + args.duration if args.duration > 0 else None
+    try:
+        while engine.running and (deadline is None or time.monotonic() < deadline):
+            time.sleep(min(args.stats_interval, max(deadline - time.monotonic(), 0)) if deadline else args.stats_interval)
+            s = engine.stats()
+            engine.log("STATS", f"{s['samples']} samples ({s['samples_per_s']:.1f}/s), nodes={s['nodes']}, "
+                                f"rows written={s['rows_written']}")
+            for line in format_health(s["readers"]):
+                print("    " + line)
+            for line in format_link_stats(s["link"]):
+                print("    " + line)
+            if args.link_stats:
+                write_snapshot(args.link_stats, s["link"], engine.link_stats.unattributed_failures)
+            if reps is not None:
+                for line in format_reps(reps.snapshot()):
+                    print("    " + line)
+            if controller is not None:
+                controller.step()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Always-on stage latency histograms and an optional sampling profiler.
+
+The acquisition path is timed per stage.  A batch goes serial port ->
+parse -> display queue -> GUI -> plot, and a row goes recording queue ->
+file write -> flush.  Stages are timed per batch, not per sample, so the cost
+is a few microseconds per batch (about 10 per second).
+
+Each stage has a ``LatencyHistogram`` with fixed memory: BINS_PER_OCTAVE
+log-spaced bins from MIN_S to MAX_S, so p50/p99 are accurate to a few percent
+whatever the run length.  The process-wide registry is ``LATENCY``:
+
+    started = time.perf_counter()
+    ...
+    LATENCY.record("parse", time.perf_counter() - started)
+
+``LATENCY.dump(path)`` writes the histograms as JSON (on demand: GUI button,
+``--latency`` in ingest_engine.py).  ``SamplingProfiler`` samples every
+thread's stack every few ms and writes collapsed stacks, the input format of
+flamegraph.pl and speedscope.  Reader processes of ingest_supervisor.py keep
+their own registry, so their read/parse stages are not in the parent's dump.
+"""
+import collections
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+MIN_S = 1e-6
+MAX_S = 100.0
+BINS_PER_OCTAVE = 8  # Bin width ~9 %
+PERCENTILES = (50, 90, 99)
+PROFILE_INTERVAL_S = 0.01
+MAX_STACKS = 20000  # Distinct stacks kept by the profiler; rarer ones are counted as "(other)"
+MAX_DEPTH = 64
+
+_BIN_COUNT = int(math.ceil(math.log2(MAX_S / MIN_S) * BINS_PER_OCTAVE)) + 2  # + underflow and overflow
+
+
+def bin_edges():
+    """Upper edge in seconds of every bin but the overflow bin."""
+    return [MIN_S * 2 ** (i / BINS_PER_OCTAVE) for i in range(_BIN_COUNT - 1)]
+
+
+class LatencyHistogram:
+    """Counts of durations in log-spaced bins, plus count, sum and max."""
+
+    __slots__ = ("counts", "count", "total", "max", "_lock")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * _BIN_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= MIN_S:
+            i = 0
+        elif seconds >= MAX_S:
+            i = _BIN_COUNT - 1
+        else:
+            i = int(math.log2(seconds / MIN_S) * BINS_PER_OCTAVE) + 1
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, p):
+        """Geometric centre of the bin holding the p-th percentile (never above max), in seconds."""
+        with self._lock:
+            counts, count, largest = list(self.counts), self.count, self.max
+        if not count:
+            return 0.0
+        rank = p / 100.0 * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank and n:
+                if i == 0:
+                    return min(MIN_S, largest)
+                return min(MIN_S * 2 ** ((i - 0.5) / BINS_PER_OCTAVE), largest)
+        return largest
+
+    def summary(self):
+        """Milliseconds: count, mean, p50/p90/p99 and max."""
+        report = {"count": self.count, "mean_ms": self.total / self.count * 1000 if self.count else 0.0}
+        for p in PERCENTILES:
+            report[f"p{p}_ms"] = self.percentile(p) * 1000
+        report["max_ms"] = self.max * 1000
+        return report
+
+
+class LatencyRegistry:
+    """One histogram per stage name, created on first use."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.enabled = True
+
+    def histogram(self, stage):
+        hist = self._stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(stage, LatencyHistogram())
+        return hist
+
+    def record(self, stage, seconds):
+        if self.enabled:
+            self.histogram(stage).record(seconds)
+
+    def reset(self):
+        with self._lock:
+            for hist in self._stages.values():
+                hist.reset()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """{stage: summary} in the order the stages were first seen."""
+        with self._lock:
+            stages = list(self._stages.items())
+        return {stage: hist.summary() for stage, hist in stages}
+
+    def dump(self, path):
+        """Write the summaries and raw bins as JSON; returns the path."""
+        with self._lock:
+            stages = list(self._stages.items())
+        data = {
+            "time": round(time.time(), 3),
+            "since": round(self.started_at, 3),
+            "bin_edges_s": bin_edges(),
+            "stages": {stage: dict(hist.summary(), bins=list(hist.counts)) for stage, hist in stages},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        return path
+
+
+LATENCY = LatencyRegistry()
+
+
+def format_latency(report):
+    """One log line per stage."""
+    return [
+        f"latency {stage}: n={s['count']}, p50 {s['p50_ms']:.2f} ms, p99 {s['p99_ms']:.2f} ms, "
+        f"max {s['max_ms']:.2f} ms"
+        for stage, s in report.items() if s["count"]
+    ]
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every ``interval`` s into collapsed-stack counts.
+
+    Costs one ``sys._current_frames()`` walk per sample, roughly 1 % of a
+    core at the default 10 ms; nothing is traced between samples.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_S, max_stacks=MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            keys = [self._collapse(names.get(ident, str(ident)), frame)
+                    for ident, frame in sys._current_frames().items() if ident != own]
+            with self._lock:
+                for key in keys:
+                    if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+                        key = key.partition(";")[0] + ";(other)"
+                    self.stacks[key] += 1
+                self.samples += 1
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        calls = []
+        while frame is not None and len(calls) < MAX_DEPTH:
+            code = frame.f_code
+            calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        calls.append(thread_name)
+        return ";".join(reversed(calls))
+
+    def dump(self, path):
+        """Write ``<stack> <count>`` lines (flamegraph.pl / speedscope "collapsed" format); returns the path."""
+        with self._lock:
+            stacks = self.stacks.most_common()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,258 @@
+"""Per-node link quality: rate, jitter, gaps, ordering, parse failures, bytes/s.
+
+``LinkStats`` is fed every ingest batch (IngestEngine.feed_samples) and keeps
+cheap running counters per node.  The work is vectorized per node and batch.
+Intervals are taken between the nodes' own timestamps: packets are stamped at
+send time, so a lost or late packet shows up as a gap.  Batching on the host
+(serial bridge, reader thread) does not hide it.
+
+* rate: samples received per second of wall clock, over the last RATE_WINDOW_S;
+* period: running estimate of the node's send period;
+* jitter: RFC 3550 style running mean of |interval - period|, plus a
+  histogram of that deviation (JITTER_BINS_MS edges);
+* gaps: intervals longer than GAP_FACTOR periods (count, total and longest);
+* out of order: a timestamp older than the previous one; duplicate: equal;
+* parse failures: unparsed lines, attributed by the node ID they contain;
+* bytes/s: the link's bytes/s, split between nodes by their share of samples.
+
+``snapshot()`` returns one dict per node; ``write_snapshot`` appends it to a
+JSON-lines or CSV file, so a degrading station can be spotted after the fact:
+
+    python ingest_engine.py --port udp://0.0.0.0:1234 --link-stats ../data/link.csv
+"""
+import collections
+import csv
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from sensor_parser import LINE_OTHER
+
+RATE_WINDOW_S = 5.0
+GAP_FACTOR = 2.5  # An interval this many periods long means at least one packet went missing
+JITTER_BINS_MS = (1, 2, 5, 10, 20, 50)  # Upper edges; the last bin holds everything above
+JITTER_GAIN = 1 / 16  # RFC 3550 interarrival jitter smoothing
+PERIOD_GAIN = 1 / 64
+STALE_S = 3.0  # No sample for this long: the node is shown as stale
+DEGRADED_RATE = 0.8  # Below this share of the expected rate (or any gap in the window): degraded
+
+STATUS_OK = "Active"
+STATUS_DEGRADED = "Degraded"
+STATUS_STALE = "Stale"
+
+_NODE_ID_RE = re.compile(r'"id"\s*:\s*"([^"]+)"|^DATA:([^:,\s]+)')
+_JITTER_EDGES_US = np.array(JITTER_BINS_MS, dtype=np.float64) * 1000
+
+CSV_FIELDS = ("time", "node", "status", "samples", "rate_hz", "period_ms", "jitter_ms", "jitter_hist",
+              "gaps", "gap_s", "max_gap_s", "out_of_order", "duplicates", "parse_failures", "bytes_per_s",
+              "last_seen_s")
+
+
+class _NodeLink:
+    __slots__ = ("samples", "last_ts", "period", "jitter", "hist", "gaps", "gap_us", "max_gap_us",
+                 "out_of_order", "duplicates", "parse_failures", "first_seen", "last_seen", "window", "recent_gaps")
+
+    def __init__(self):
+        self.samples = 0
+        self.last_ts = None
+        self.period = None  # us
+        self.jitter = 0.0  # us
+        self.hist = np.zeros(len(JITTER_BINS_MS) + 1, dtype=np.int64)
+        self.gaps = 0
+        self.gap_us = 0
+        self.max_gap_us = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.parse_failures = 0
+        self.first_seen = None
+        self.last_seen = None  # time.monotonic() of the last sample
+        self.window = collections.deque()  # (arrival time, samples) within RATE_WINDOW_S
+        self.recent_gaps = collections.deque()  # arrival times of gaps within RATE_WINDOW_S
+
+    def update(self, ts_us, now):
+        n = len(ts_us)
+        self.samples += n
+        if self.first_seen is None:
+            self.first_seen = now
+        self.last_seen = now
+        self.window.append((now, n))
+        self.prune(now)
+        if self.last_ts is not None:
+            ts_us = np.concatenate(([self.last_ts], ts_us))
+        self.last_ts = int(ts_us[-1])
+        dt = np.diff(ts_us)
+        if not len(dt):
+            return
+        self.out_of_order += int(np.count_nonzero(dt < 0))
+        self.duplicates += int(np.count_nonzero(dt == 0))
+        forward = dt[dt > 0].astype(np.float64)
+        if not len(forward):
+            return
+        if self.period is None:
+            self.period = float(np.median(forward))
+        gap = forward > GAP_FACTOR * self.period
+        if gap.any():
+            lengths = forward[gap] - self.period
+            self.gaps += int(np.count_nonzero(gap))
+            self.gap_us += int(lengths.sum())
+            self.max_gap_us = max(self.max_gap_us, int(lengths.max()))
+            self.recent_gaps.extend([now] * int(np.count_nonzero(gap)))
+            forward = forward[~gap]
+        if not len(forward):
+            return
+        deviation = np.abs(forward - self.period)
+        self.hist += np.bincount(np.searchsorted(_JITTER_EDGES_US, deviation), minlength=len(self.hist))
+        # Running estimates; a batch moves them as if its intervals had arrived one by one
+        keep = (1 - JITTER_GAIN) ** len(deviation)
+        self.jitter = self.jitter * keep + float(deviation.mean()) * (1 - keep)
+        keep = (1 - PERIOD_GAIN) ** len(forward)
+        self.period = self.period * keep + float(np.median(forward)) * (1 - keep)
+
+    def prune(self, now):
+        while self.window and now - self.window[0][0] > RATE_WINDOW_S:
+            self.window.popleft()
+        while self.recent_gaps and now - self.recent_gaps[0] > RATE_WINDOW_S:
+            self.recent_gaps.popleft()
+
+
+class LinkStats:
+    """Running link statistics per node, keyed by node ID; update and snapshot may run on different threads."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._nodes = collections.defaultdict(_NodeLink)
+        self.unattributed_failures = 0
+        self._bytes = collections.deque()  # (time, link bytes so far) within RATE_WINDOW_S
+        self.started_at = clock()
+
+    def reset(self):
+        with self._lock:
+            self._nodes.clear()
+            self.unattributed_failures = 0
+            self._bytes.clear()
+            self.started_at = self.clock()
+
+    def update(self, samples, node_name, events=(), bytes_total=None):
+        """Account one batch: SAMPLE_DTYPE ``samples`` (``node_name(idx)`` -> ID), its events
+        and the link's running byte count."""
+        now = self.clock()
+        with self._lock:
+            if bytes_total is not None:
+                self._bytes.append((now, bytes_total))
+                self._prune_bytes(now)
+            if len(samples):
+                nodes = samples["node"]
+                unique = np.unique(nodes)
+                if len(unique) == 1:
+                    self._nodes[node_name(int(unique[0]))].update(samples["ts_us"], now)
+                else:
+                    for idx in unique.tolist():
+                        self._nodes[node_name(idx)].update(samples["ts_us"][nodes == idx], now)
+            for kind, _, line in events:
+                if kind == LINE_OTHER:
+                    self._count_parse_failure(line)
+
+    def _count_parse_failure(self, line):
+        match = _NODE_ID_RE.search(line) if line.__class__ is str else None
+        if match is None:
+            self.unattributed_failures += 1
+        else:
+            self._nodes[match.group(1) or match.group(2)].parse_failures += 1
+
+    def _prune_bytes(self, now):
+        history = self._bytes
+        while len(history) > 1 and now - history[0][0] > RATE_WINDOW_S:
+            history.popleft()
+
+    def _bytes_per_s(self, now):
+        history = self._bytes
+        self._prune_bytes(now)
+        if len(history) < 2:
+            return 0.0
+        (t0, b0), (t1, b1) = history[0], history[-1]
+        return (b1 - b0) / max(now - t0, t1 - t0, 1e-3)
+
+    def snapshot(self):
+        """{node ID: metrics}; the link's bytes/s is split between nodes by sample share."""
+        with self._lock:
+            return self._snapshot(self.clock())
+
+    def _snapshot(self, now):
+        bytes_per_s = self._bytes_per_s(now)
+        counts = {}
+        for node_id, node in self._nodes.items():
+            node.prune(now)
+            counts[node_id] = sum(n for _, n in node.window)
+        total = sum(counts.values()) or 1
+        report = {}
+        for node_id, node in self._nodes.items():
+            seen_for = now - node.first_seen if node.first_seen is not None else 0.0
+            rate = counts[node_id] / min(RATE_WINDOW_S, max(seen_for, 1.0))
+            age = now - node.last_seen if node.last_seen is not None else None
+            if age is None or age > STALE_S:
+                status = STATUS_STALE
+            elif node.recent_gaps or (node.period and seen_for >= RATE_WINDOW_S
+                                      and rate < DEGRADED_RATE * 1e6 / node.period):
+                status = STATUS_DEGRADED
+            else:
+                status = STATUS_OK
+            report[node_id] = {
+                "status": status,
+                "samples": node.samples,
+                "rate_hz": rate,
+                "period_ms": node.period / 1000 if node.period else None,
+                "jitter_ms": node.jitter / 1000,
+                "jitter_hist": node.hist.tolist(),
+                "gaps": node.gaps,
+                "gap_s": node.gap_us / 1e6,
+                "max_gap_s": node.max_gap_us / 1e6,
+                "out_of_order": node.out_of_order,
+                "duplicates": node.duplicates,
+                "parse_failures": node.parse_failures,
+                "bytes_per_s": bytes_per_s * counts[node_id] / total,
+                "last_seen_s": age,
+            }
+        return report
+
+
+def format_link_stats(report):
+    """One log line per node."""
+    return [
+        f"link {node_id}: {m['status']}, {m['rate_hz']:.1f} Hz, jitter {m['jitter_ms']:.1f} ms, "
+        f"{m['gaps']} gaps ({m['gap_s']:.1f} s, max {m['max_gap_s']:.1f} s), "
+        f"{m['out_of_order']} out of order, {m['duplicates']} duplicates, "
+        f"{m['parse_failures']} parse failures, {m['bytes_per_s']:.0f} B/s"
+        for node_id, m in report.items()
+    ]
+
+
+def jitter_bin_labels():
+    edges = (0,) + JITTER_BINS_MS
+    return [f"{lo}-{hi} ms" for lo, hi in zip(edges, edges[1:])] + [f">{JITTER_BINS_MS[-1]} ms"]
+
+
+def write_snapshot(path, report, unattributed_failures=0, timestamp=None):
+    """Append ``report`` to ``path``: CSV rows (one per node) for .csv, else one JSON line."""
+    timestamp = time.time() if timestamp is None else timestamp
+    if path.lower().endswith(".csv"):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(CSV_FIELDS)
+            for node_id, m in report.items():
+                writer.writerow([f"{timestamp:.3f}", node_id] + [
+                    "|".join(map(str, m[name])) if name == "jitter_hist"
+                    else "" if m[name] is None
+                    else f"{m[name]:.3f}" if isinstance(m[name], float) else m[name]
+                    for name in CSV_FIELDS[2:]
+                ])
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"time": round(timestamp, 3), "jitter_bins": jitter_bin_labels(),
+                            "unattributed_parse_failures": unattributed_failures, "nodes": report}) + "\n")
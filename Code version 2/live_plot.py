@@ -0,0 +1,150 @@
+"""Blitted live plots of the latest samples of one or more sensor nodes.
+
+A ``SignalPanel`` owns one matplotlib Figure (embedded in Tk) and shows three
+columns of the (n, 6) sample window returned by a ``get_window(node_id)``
+callback, either for one node or as a grid with one subplot per node.
+
+Per frame only the lines are redrawn on top of a cached background
+(blitting).  The full figure is redrawn only when the node layout changes,
+the window is resized, or the data leaves the current y range.  Windows
+wider than the axes are reduced to a min/max envelope of about one point
+per pixel column, so the cost per frame does not grow with the buffer size.
+"""
+import math
+
+import numpy as np
+
+ACC_COLUMNS = [0, 1, 2]
+GYRO_COLUMNS = [3, 4, 5]
+
+
+def decimate_minmax(y, max_points):
+    """Reduce ``y`` (n, k) to at most ``max_points`` rows, keeping the min and
+    max of each bucket so peaks stay visible. Returns (x, y)."""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n), y
+    buckets = max(max_points // 2, 1)
+    step = n // buckets
+    start = n - buckets * step  # Drop the oldest remainder, keep the newest samples
+    blocks = y[start:].reshape(buckets, step, y.shape[1])
+    out = np.empty((buckets * 2, y.shape[1]), dtype=y.dtype)
+    out[0::2] = blocks.min(axis=1)
+    out[1::2] = blocks.max(axis=1)
+    x = start + np.arange(buckets * 2) * (step / 2.0)
+    return x, out
+
+
+class _NodeAxes:
+    __slots__ = ("node_id", "ax", "lines")
+
+    def __init__(self, node_id, ax, lines):
+        self.node_id = node_id
+        self.ax = ax
+        self.lines = lines
+
+
+class SignalPanel:
+    """Three signals of the selected node(s) in one figure, redrawn by blitting."""
+
+    def __init__(self, figure, canvas, title, labels, columns, capacity, default_ylim):
+        self.figure = figure
+        self.canvas = canvas
+        self.title = title
+        self.labels = labels
+        self.columns = columns
+        self.capacity = capacity
+        self.default_ylim = default_ylim
+        self.node_ids = None
+        self.full_redraws = 0
+        self._axes = []
+        self._background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.set_nodes([])
+
+    def set_capacity(self, capacity):
+        self.capacity = capacity
+        for entry in self._axes:
+            entry.ax.set_xlim(0, capacity)
+        self.canvas.draw_idle()
+
+    def set_nodes(self, node_ids):
+        """Show one subplot per node (a placeholder when empty). No-op if unchanged."""
+        node_ids = list(node_ids)
+        if node_ids == self.node_ids:
+            return
+        self.node_ids = node_ids
+        self.figure.clear()
+        self._axes = []
+        single = len(node_ids) <= 1
+        n_cols = max(1, math.ceil(math.sqrt(len(node_ids))))
+        n_rows = max(1, math.ceil(len(node_ids) / n_cols))
+        for i, node_id in enumerate(node_ids or [None]):
+            ax = self.figure.add_subplot(n_rows, n_cols, i + 1)
+            if node_id is None:
+                ax.set_title(f"{self.title} - Waiting for data...")
+            elif single:
+                ax.set_title(f"{self.title} - Node: {node_id}")
+            else:
+                ax.set_title(str(node_id), fontsize=9)
+                ax.tick_params(labelsize=7)
+            if single:
+                ax.set_ylabel("Giá trị")
+                ax.set_xlabel("Thời gian (Điểm)")
+            lines = [ax.plot([], [], label=label, animated=True)[0] for label in self.labels]
+            if single:
+                ax.legend(loc="upper left")
+            ax.set_xlim(0, self.capacity)
+            ax.set_ylim(*self.default_ylim)
+            self._axes.append(_NodeAxes(node_id, ax, lines))
+        self._background = None
+        self.canvas.draw_idle()
+
+    def _on_draw(self, event):
+        # A full draw happened (layout, resize, rescale): cache the static parts
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.full_redraws += 1
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for entry in self._axes:
+            for line in entry.lines:
+                entry.ax.draw_artist(line)
+
+    def update(self, get_window):
+        """Redraw the lines from ``get_window(node_id)``, an (n, 6) array or None."""
+        rescaled = False
+        for entry in self._axes:
+            if entry.node_id is None:
+                continue
+            window = get_window(entry.node_id)
+            if window is None or not len(window):
+                for line in entry.lines:
+                    line.set_data([], [])
+                continue
+            y = window[:, self.columns]
+            width = max(int(entry.ax.bbox.width), 2)
+            x, y = decimate_minmax(y, width)
+            for i, line in enumerate(entry.lines):
+                line.set_data(x, y[:, i])
+            rescaled |= self._rescale(entry.ax, y)
+
+        if rescaled or self._background is None:
+            self.canvas.draw_idle()  # _on_draw recaptures the background
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_lines()
+        self.canvas.blit(self.figure.bbox)
+
+    @staticmethod
+    def _rescale(ax, y):
+        """Change the y range only when the data leaves it or uses a small part of it."""
+        lo = float(y.min())
+        hi = float(y.max())
+        cur_lo, cur_hi = ax.get_ylim()
+        needed = max(hi - lo, 1.0)
+        if lo >= cur_lo and hi <= cur_hi and needed * 4 >= cur_hi - cur_lo:
+            return False
+        padding = needed * 0.25
+        ax.set_ylim(lo - padding, hi + padding)
+        return True
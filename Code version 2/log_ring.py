@@ -0,0 +1,82 @@
+"""Bounded, rate-limited log buffer for the GUI log view.
+
+Producers (the GUI thread, the ingest engine's reader/recorder threads) call
+``append``/``append_many``; the Tk side calls ``drain`` on a timer and inserts
+everything in one go, so the ScrolledText widget is touched at a fixed rate
+no matter how fast lines arrive.
+
+Lines below ``min_level`` are filtered, categories can be sampled (keep 1 of
+N), and when the ring is full the oldest lines are dropped.  Everything that
+was not shown is counted.
+"""
+import collections
+import threading
+
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+
+class LogRing:
+    """Thread-safe ring of formatted log lines with per-category sampling."""
+
+    def __init__(self, capacity=100, min_level="DEBUG", sample_every=None):
+        self.capacity = capacity
+        self.min_level = min_level
+        self.sample_every = dict(sample_every or {})  # category -> keep 1 of N
+        self.suppressed = collections.Counter()  # category -> lines skipped by sampling or level
+        self.overflowed = 0  # lines pushed out of the ring before they were drained
+        self._seen = collections.Counter()  # category -> lines offered so far (sampling phase)
+        self._lines = collections.deque()
+        self._lock = threading.Lock()
+
+    def set_sampling(self, category, every):
+        """Show only 1 of ``every`` lines of ``category`` (1 or None shows all)."""
+        with self._lock:
+            if every and every > 1:
+                self.sample_every[category] = int(every)
+            else:
+                self.sample_every.pop(category, None)
+
+    def append(self, level, line, category=None):
+        """Queue one line; returns True if it will be shown."""
+        return self.append_many(level, (line,), category) == 1
+
+    def append_many(self, level, lines, category=None):
+        """Queue several lines of the same level/category; returns how many are kept."""
+        category = category or level
+        if LOG_LEVELS.get(level, 0) < LOG_LEVELS.get(self.min_level, 0):
+            with self._lock:
+                self.suppressed[category] += len(lines)
+            return 0
+        with self._lock:
+            every = self.sample_every.get(category)
+            if every:
+                seen = self._seen[category]
+                self._seen[category] = seen + len(lines)
+                kept = lines[(-seen) % every::every]
+                self.suppressed[category] += len(lines) - len(kept)
+            else:
+                kept = lines
+            self._lines.extend(kept)
+            overflow = len(self._lines) - self.capacity
+            for _ in range(max(overflow, 0)):
+                self._lines.popleft()
+            if overflow > 0:
+                self.overflowed += overflow
+            return len(kept)
+
+    def drain(self):
+        """Return and clear everything queued since the last drain."""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+    def take_suppressed(self):
+        """Return the suppressed counters and reset them (for periodic summaries)."""
+        with self._lock:
+            counts = dict(self.suppressed)
+            if self.overflowed:
+                counts["overflow"] = self.overflowed
+            self.suppressed.clear()
+            self.overflowed = 0
+        return counts
@@ -0,0 +1,280 @@
+"""Host-side control of each node's send rate through the CONFIG command.
+
+``CONFIG:<node>:<accel>:<gyro>:<srd>:<freq>`` reaches a node through the
+ESP32 bridge (serial), the UDP gateway or a SupervisedEngine reader.  The
+node saves the settings and restarts, so every change costs a few seconds of
+data.  The controller therefore changes rates rarely, and only by margins
+worth a restart.
+
+Every ``step()`` (CONTROL_INTERVAL_S apart):
+
+1. A link's budget is its capacity (serial: baud / 10 bytes/s, UDP:
+   UDP_CAPACITY_BYTES_S) x TARGET_UTILIZATION, divided by the measured bytes
+   per sample.
+2. Each node's ceiling: a node that delivers less than LOSS_RATIO of its
+   configured rate gets a ceiling just under what it delivered (its Wi-Fi
+   cannot carry more).  The ceiling relaxes by STEP_UP every RELAX_S without
+   loss.
+3. The budget is water-filled over the nodes of the link, each capped by
+   its ceiling, ``max_freq`` and any manual pin.
+4. A node whose target differs from its rate by more than CHANGE_RATIO gets a
+   CONFIG.  Increases are limited to STEP_UP per change.  After a change a
+   node is left alone for HOLD_OFF_S.
+
+Accel/gyro/SRD must be resent unchanged with every CONFIG.  They come from
+the node's HELLO packet (the bridge echoes it to serial; the UDP gateway
+keeps it), from ``set_node_config`` or from ``default_config``.  A node whose
+settings are unknown is never changed automatically: a wrong guess would
+change its measuring range in the middle of a session.  The SRD is lowered
+when the MPU would sample slower than the new rate.
+
+Manual API: ``set_rate`` (pins a node), ``release``, ``set_node_config``,
+``plan`` (dry run).
+
+    python ingest_engine.py --port COM8 --adaptive-rate --max-freq 50
+"""
+import argparse
+import re
+import time
+
+from link_stats import STATUS_STALE
+from sensor_parser import LINE_HANDSHAKE
+
+CONTROL_INTERVAL_S = 10.0
+TARGET_UTILIZATION = 0.75  # Share of the link's capacity the nodes may use together
+UDP_CAPACITY_BYTES_S = 100_000  # Conservative for an ESP softAP with several nodes
+DEFAULT_BYTES_PER_SAMPLE = 110  # JSON sample line with newline; binary frames are 26
+LOSS_RATIO = 0.9  # Delivered / configured below this: the node's link is saturated
+CHANGE_RATIO = 0.2  # Smaller changes are not worth a node restart
+STEP_UP = 1.5  # Largest increase per change, and ceiling relaxation per RELAX_S
+HOLD_OFF_S = 60.0  # A node is left alone this long after a CONFIG (restart and settling)
+RELAX_S = 120.0
+MIN_FREQ = 1
+MAX_FREQ = 100  # Firmware accepts 1..255; version 3 caps at 100
+MPU_BASE_RATE_HZ = 1000  # MPU6050 with DLPF: sample rate = 1000 / (1 + SRD)
+
+# The bridge prints node packets as received: HELLO:<id>:<type>:<accel>:<gyro>:<srd>[:<freq>]
+_HELLO_RE = re.compile(r"HELLO:([^:\s]+):[^:\s]*:(\d+):(\d+):(\d+)(?::(\d+))?")
+
+
+def max_srd_for(freq):
+    """Largest SRD whose MPU sample rate still keeps up with ``freq`` Hz (firmware needs SRD >= 1)."""
+    return max(MPU_BASE_RATE_HZ // max(freq, 1) - 1, 1)
+
+
+def parse_node_config(text):
+    """``"accel:gyro:srd"`` -> (accel, gyro, srd); for argparse ``type=``."""
+    try:
+        accel, gyro, srd = (int(p) for p in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected ACCEL:GYRO:SRD, got {text!r}") from None
+    if not (0 <= accel <= 3 and 0 <= gyro <= 3 and 1 <= srd <= 255):
+        raise argparse.ArgumentTypeError("accel and gyro are 0-3, srd is 1-255")
+    return accel, gyro, srd
+
+
+def water_fill(budget, caps):
+    """Split ``budget`` over {key: cap} as evenly as the caps allow; returns {key: share}."""
+    shares = {}
+    remaining = dict(caps)
+    while remaining:
+        fair = budget / len(remaining)
+        capped = {key: cap for key, cap in remaining.items() if cap <= fair}
+        if not capped:
+            shares.update((key, fair) for key in remaining)
+            break
+        for key, cap in capped.items():
+            shares[key] = cap
+            budget -= cap
+            del remaining[key]
+    return shares
+
+
+class _NodeControl:
+    __slots__ = ("freq", "config", "ceiling", "ceiling_since", "changed_at", "pinned", "changes")
+
+    def __init__(self):
+        self.freq = None  # Configured rate as far as we know (Hz)
+        self.config = None  # (accel, gyro, srd)
+        self.ceiling = None
+        self.ceiling_since = 0.0
+        self.changed_at = None
+        self.pinned = None
+        self.changes = 0
+
+
+class RateController:
+    """Adaptive per-node rate control for one IngestEngine (see the module docstring)."""
+
+    def __init__(self, engine, max_freq=MAX_FREQ, min_freq=MIN_FREQ, capacity_bytes_s=None,
+                 target_utilization=TARGET_UTILIZATION, default_config=None, log=None,
+                 clock=time.monotonic):
+        self.engine = engine
+        self.max_freq = max_freq
+        self.min_freq = min_freq
+        self.capacity_bytes_s = capacity_bytes_s  # None: from each link's type
+        self.target_utilization = target_utilization
+        self.default_config = default_config  # (accel, gyro, srd) for nodes that never sent a HELLO
+        self.log = log or engine.log
+        self.clock = clock
+        self.enabled = True
+        self._nodes = {}
+        self._last_step = None
+        self._warned = set()
+        engine.subscribe(self.on_batch)
+
+    def close(self):
+        self.engine.unsubscribe(self.on_batch)
+
+    def _node(self, node_id):
+        node = self._nodes.get(node_id)
+        if node is None:
+            node = self._nodes[node_id] = _NodeControl()
+        return node
+
+    # --- Learning node configs ---
+    def on_batch(self, batch):
+        """Engine subscriber: picks up node configs from echoed HELLO packets."""
+        for kind, value, line in batch.events:
+            if line.__class__ is not str or "HELLO:" not in line:
+                continue
+            match = _HELLO_RE.search(line)
+            if match is None:
+                continue
+            node_id = value if kind == LINE_HANDSHAKE and value else match.group(1)
+            node = self._node(node_id)
+            node.config = tuple(int(g) for g in match.group(2, 3, 4))
+            if match.group(5):
+                node.freq = int(match.group(5))
+
+    def _config_of(self, node_id, node):
+        gateway = getattr(self.engine, "gateway", None)
+        client = gateway.clients.get(node_id) if gateway is not None else None
+        if client is not None and client.srd:
+            return client.accel, client.gyro, client.srd
+        return node.config or self.default_config
+
+    # --- Manual API ---
+    def set_node_config(self, node_id, accel, gyro, srd):
+        """Tell the controller a node's MPU settings (resent unchanged with every CONFIG)."""
+        self._node(node_id).config = (accel, gyro, srd)
+
+    def set_rate(self, node_id, freq):
+        """Send ``freq`` to a node now and keep it there (the node still counts against the budget).
+
+        Raises ValueError if the node's accel/gyro/SRD are unknown.
+        """
+        node = self._node(node_id)
+        if self._config_of(node_id, node) is None:
+            raise ValueError(f"accel/gyro/SRD of {node_id} are unknown; call set_node_config first")
+        node.pinned = freq
+        return self._send(node_id, node, freq)
+
+    def release(self, node_id):
+        """Let the controller manage a pinned node again."""
+        self._node(node_id).pinned = None
+
+    # --- Control loop ---
+    def _link_of(self, node_id):
+        supervisor = getattr(self.engine, "supervisor", None)
+        if supervisor is not None:
+            return supervisor.route(node_id)[0] or self.engine.port_name
+        return self.engine.port_name
+
+    def _capacity(self, link):
+        if self.capacity_bytes_s:
+            return self.capacity_bytes_s
+        if link and link.startswith("udp://"):
+            return UDP_CAPACITY_BYTES_S
+        return self.engine.baud_rate / 10  # 8N1: 10 bits per byte
+
+    def plan(self, report=None):
+        """{node ID: (current Hz, target Hz, reason)} for the nodes that should change; sends nothing."""
+        now = self.clock()
+        report = self.engine.link_stats.snapshot() if report is None else report
+        live = {node_id: m for node_id, m in report.items() if m["status"] != STATUS_STALE and m["period_ms"]}
+        total_rate = sum(m["rate_hz"] for m in live.values())
+        total_bytes = sum(m["bytes_per_s"] for m in live.values())
+        bytes_per_sample = total_bytes / total_rate if total_rate and total_bytes else DEFAULT_BYTES_PER_SAMPLE
+
+        links = {}
+        for node_id, m in live.items():
+            node = self._node(node_id)
+            if node.freq is None or node.changed_at is None:
+                node.freq = max(round(1000.0 / m["period_ms"]), 1)  # What it sends now
+            settling = node.changed_at is not None and now - node.changed_at < HOLD_OFF_S
+            if not settling and m["rate_hz"] < LOSS_RATIO * node.freq:
+                node.ceiling = max(self.min_freq, int(m["rate_hz"] * LOSS_RATIO))
+                node.ceiling_since = now
+            elif node.ceiling is not None and now - node.ceiling_since >= RELAX_S:
+                node.ceiling = int(node.ceiling * STEP_UP) + 1
+                node.ceiling_since = now
+                if node.ceiling >= self.max_freq:
+                    node.ceiling = None
+            links.setdefault(self._link_of(node_id), []).append(node_id)
+
+        decisions = {}
+        for link, node_ids in links.items():
+            budget = self._capacity(link) * self.target_utilization / bytes_per_sample
+            # Pinned nodes and nodes the controller cannot configure keep their rate
+            fixed = {}
+            for n in node_ids:
+                node = self._nodes[n]
+                if node.pinned is not None:
+                    fixed[n] = node.pinned
+                elif self._config_of(n, node) is None:
+                    fixed[n] = node.freq
+            budget -= sum(fixed.values())
+            caps = {n: min(self.max_freq, self._nodes[n].ceiling or self.max_freq)
+                    for n in node_ids if n not in fixed}
+            for node_id, share in water_fill(max(budget, 0.0), caps).items():
+                node = self._nodes[node_id]
+                current = node.freq
+                target = max(self.min_freq, int(share))
+                target = min(target, int(current * STEP_UP) or 1) if target > current else target
+                if node.changed_at is not None and now - node.changed_at < HOLD_OFF_S:
+                    continue
+                if abs(target - current) < CHANGE_RATIO * current:
+                    continue
+                if target < current:
+                    reason = "loss" if node.ceiling is not None and target <= node.ceiling else "link budget"
+                else:
+                    reason = "headroom"
+                decisions[node_id] = (current, target, reason)
+        return decisions
+
+    def step(self, force=False):
+        """Run one control iteration (at most every CONTROL_INTERVAL_S); returns the decisions sent."""
+        now = self.clock()
+        if not self.enabled or (not force and self._last_step is not None
+                                and now - self._last_step < CONTROL_INTERVAL_S):
+            return {}
+        self._last_step = now
+        decisions = self.plan()
+        for node_id, node in self._nodes.items():
+            if node_id not in self._warned and self._config_of(node_id, node) is None:
+                self._warned.add(node_id)
+                self.log("WARN", f"Chưa biết cấu hình accel/gyro/SRD của {node_id}, không tự điều chỉnh tần số.")
+        for node_id, (current, target, reason) in decisions.items():
+            self.log("INFO", f"Điều chỉnh tần số {node_id}: {current} -> {target} Hz ({reason})")
+            self._send(node_id, self._nodes[node_id], target)
+        return decisions
+
+    def _send(self, node_id, node, freq):
+        freq = int(min(max(freq, self.min_freq), 255))
+        accel, gyro, srd = self._config_of(node_id, node)
+        srd = min(srd, max_srd_for(freq))
+        node.config = (accel, gyro, srd)
+        command = f"CONFIG:{node_id}:{accel}:{gyro}:{srd}:{freq}"
+        reply = self.engine.send_command(command)
+        node.freq = freq
+        node.changed_at = self.clock()
+        node.changes += 1
+        return reply
+
+    def stats(self):
+        return {
+            node_id: {"freq": n.freq, "ceiling": n.ceiling, "pinned": n.pinned, "changes": n.changes,
+                      "config": n.config}
+            for node_id, n in self._nodes.items()
+        }
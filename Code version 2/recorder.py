@@ -0,0 +1,307 @@
+"""Recording of parsed samples, one file per sensor node.
+
+The recorder runs on its own thread and receives SAMPLE_DTYPE arrays from the
+ingest engine.  ``record_format="csv"`` writes rows in the same layout
+EspServer.py always used (``ID,Status,AccX,...,Timestamp,Timestamp_us``);
+``record_format="columnar"`` writes typed ``.imu`` column files instead
+(see columnar_format.py).
+
+Writes are group-committed: every batch is formatted in one go into buffered
+files, and the files are flushed when ``flush_rows`` rows are pending, when
+the oldest pending row is ``flush_ms`` old, and on stop.  ``fsync`` chooses
+whether flushes also reach the disk ("flush"), only the final one does
+("stop"), or never ("never").
+
+Batches wait in a BoundedQueue of ``max_queue_rows`` rows.  If the disk
+falls behind, ``queue_policy`` decides what happens.  "spill" (default)
+parks batches in a temporary file and writes them later, in order.  "block"
+holds up the reader thread, and the display with it, for up to
+BLOCK_TIMEOUT_S.  The drop policies discard rows and count them.
+"""
+import datetime
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from bounded_queue import POLICY_SPILL, BoundedQueue
+from columnar_format import EXTENSION as COLUMNAR_EXTENSION, ColumnarWriter
+from latency import LATENCY
+from sensor_parser import SAMPLE_DTYPE, format_microseconds_to_mmss_us
+
+CSV_HEADER = "ID,Status,AccX,AccY,AccZ,GyroX,GyroY,GyroZ,Timestamp,Timestamp_us\n"
+
+FLUSH_ROWS = 2000  # Flush when this many rows are waiting (0 = no row limit)
+FLUSH_MS = 500  # Flush when the oldest waiting row is this old (0 = no time limit)
+FSYNC_POLICIES = ("never", "flush", "stop")
+MAX_QUEUE_ROWS = 200_000  # In-memory backlog (~7 MB); beyond it the queue policy applies
+FILE_BUFFER_BYTES = 1 << 16
+RECORD_FORMATS = ("csv", "columnar")
+_ENQUEUED_AT = struct.Struct("<d")
+
+
+def get_output_filename(directory, sensor_id, base_name, extension=".csv"):
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{sensor_id}_{base_name}_{timestamp}{extension}"
+    return os.path.join(directory, filename)
+
+
+def format_csv_row(node_id, row, status="Active"):
+    _, ts_us, ax, ay, az, gx, gy, gz = row
+    return (
+        f"{node_id},{status},"
+        f"{ax:.2f},{ay:.2f},{az:.2f},"
+        f"{gx:.2f},{gy:.2f},{gz:.2f},"
+        f"{format_microseconds_to_mmss_us(ts_us)},{ts_us}\n"
+    )
+
+
+def format_csv_rows(node_id, samples, status="Active"):
+    """Format a SAMPLE_DTYPE array of one node; same text as format_csv_row per row."""
+    ts_us = samples["ts_us"]
+    if len(ts_us) and ts_us.min() < 0:
+        # "Invalid_TS" rows are rare enough for the per-row path
+        return "".join(format_csv_row(node_id, row, status) for row in samples.tolist())
+    total_seconds = ts_us // 1_000_000
+    row_format = f"{node_id},{status},%.2f,%.2f,%.2f,%.2f,%.2f,%.2f,%02d:%02d:%06d,%d\n"
+    columns = zip(
+        samples["ax"].tolist(), samples["ay"].tolist(), samples["az"].tolist(),
+        samples["gx"].tolist(), samples["gy"].tolist(), samples["gz"].tolist(),
+        ((total_seconds // 60) % 60).tolist(), (total_seconds % 60).tolist(),
+        (ts_us % 1_000_000).tolist(), ts_us.tolist(),
+    )
+    return "".join([row_format % row for row in columns])
+
+
+class CsvWriter:
+    """Buffered CSV file of one node, same interface as ColumnarWriter."""
+
+    def __init__(self, path, node_id):
+        self.node_id = node_id
+        self.file = open(path, 'a', encoding='utf-8', buffering=FILE_BUFFER_BYTES)
+        if os.path.getsize(path) == 0:
+            self.file.write(CSV_HEADER)
+
+    def write(self, samples):
+        self.file.write(format_csv_rows(self.node_id, samples))
+
+    def flush(self, fsync=False):
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def _encode_batch(item):
+    enqueued_at, samples = item
+    return _ENQUEUED_AT.pack(enqueued_at) + samples.tobytes()
+
+
+def _decode_batch(data):
+    return _ENQUEUED_AT.unpack_from(data)[0], np.frombuffer(data, dtype=SAMPLE_DTYPE, offset=_ENQUEUED_AT.size)
+
+
+def _batch_rows(item):
+    return len(item[1])
+
+
+class SampleRecorder:
+    """Writes every sample it is given to ``<node>_<base_name>_<time>.csv`` (or ``.imu``) files."""
+
+    def __init__(self, directory, base_name, node_index, log=None, record_format="csv",
+                 flush_rows=FLUSH_ROWS, flush_ms=FLUSH_MS, fsync="stop", max_queue_rows=MAX_QUEUE_ROWS,
+                 queue_policy=POLICY_SPILL, spill_dir=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f"record_format must be one of {RECORD_FORMATS}, got {record_format!r}")
+        # Parameters are captured once, the worker never touches the GUI
+        self.directory = directory
+        self.base_name = base_name
+        self.node_index = node_index
+        self.log = log or (lambda level, text: print(f"[{level}] {text}"))
+        self.record_format = record_format
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.fsync = fsync
+        self.file_handles = {}
+        # (enqueue time, samples); spills next to the system temp files unless spill_dir is given
+        self.queue = BoundedQueue("recording", max_queue_rows, queue_policy, weight=_batch_rows,
+                                  encode=_encode_batch, decode=_decode_batch, spill_dir=spill_dir)
+        self._stopping = False
+        self._thread = None
+        # Rows written but not flushed yet, and when the oldest of them was submitted
+        self._pending_rows = 0
+        self._pending_since = None
+        # Counters
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.latency_ms_last = 0.0
+        self.latency_ms_max = 0.0
+        self._latency_ms_sum = 0.0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, samples):
+        if len(samples):
+            self.queue.put((time.perf_counter(), samples))
+
+    def stop(self, timeout=5):
+        """Refuse new samples and let the worker write the queue, then close the files.
+
+        The worker closes the files itself when the queue is empty.  If it is
+        still draining a spill backlog after ``timeout`` seconds (None: wait),
+        stop returns and the worker finishes in the background.  Returns True
+        when the files are closed.
+        """
+        self._stopping = True
+        self.queue.close()
+        thread, self._thread = self._thread, None
+        if thread is None:
+            self._close_files()
+            return True
+        thread.join(timeout=timeout)
+        if thread.is_alive():
+            self.log("WARN", "Thread ghi vẫn đang ghi dữ liệu còn lại; file sẽ được đóng khi ghi xong.")
+            return False
+        return True
+
+    def _close_files(self):
+        for node_id, file_handle in list(self.file_handles.items()):
+            try:
+                file_handle.close()
+                self.log("INFO", f"Đã đóng file ghi dữ liệu cho Node '{node_id}'.")
+            except Exception as e:
+                self.log("ERROR", f"Lỗi khi đóng file cho Node '{node_id}': {e}")
+            finally:
+                del self.file_handles[node_id]
+        self.queue.clear()  # Releases the spill file
+
+    def stats(self):
+        flushes = max(self.flushes, 1)
+        queue = self.queue.stats()
+        return {
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped + queue["dropped_weight"],
+            "queued_rows": queue["depth"],
+            "queue": queue,
+            "batches": self.batches,
+            "flushes": self.flushes,
+            "fsyncs": self.fsyncs,
+            "latency_ms_last": self.latency_ms_last,
+            "latency_ms_max": self.latency_ms_max,
+            "latency_ms_mean": self._latency_ms_sum / flushes if self.flushes else 0.0,
+        }
+
+    def _time_to_flush(self):
+        if not self._pending_rows or not self.flush_ms:
+            return None
+        return self._pending_since + self.flush_ms / 1000.0 - time.perf_counter()
+
+    def _worker(self):
+        try:
+            self._drain()
+        finally:
+            self._close_files()  # Only this thread writes to the files
+
+    def _drain(self):
+        while True:
+            stopping = self._stopping
+            timeout = self._time_to_flush()
+            if not stopping and (timeout is None or timeout > 0):
+                self.queue.wait(timeout)
+            items = self.queue.get_all()
+            for enqueued_at, samples in items:
+                started = time.perf_counter()
+                LATENCY.record("record_queue", started - enqueued_at)
+                try:
+                    self._write_samples(samples, enqueued_at)
+                except Exception as e:
+                    self.rows_dropped += len(samples)
+                    self.log("ERROR", f"Thread ghi file lỗi: {e}")
+                LATENCY.record("write", time.perf_counter() - started)
+                self._maybe_flush()
+            if not items:
+                if stopping:
+                    self._flush(fsync=self.fsync != "never")
+                    return
+                self._maybe_flush()
+
+    def _maybe_flush(self):
+        timeout = self._time_to_flush()
+        if (self.flush_rows and self._pending_rows >= self.flush_rows) or (timeout is not None and timeout <= 0):
+            self._flush(fsync=self.fsync == "flush")
+
+    def _open_file(self, node_id):
+        try:
+            if self.record_format == "columnar":
+                output_path = get_output_filename(self.directory, node_id, self.base_name, COLUMNAR_EXTENSION)
+                file_handle = ColumnarWriter(output_path, node_id)
+            else:
+                output_path = get_output_filename(self.directory, node_id, self.base_name)
+                file_handle = CsvWriter(output_path, node_id)
+        except IOError as e:
+            self.log("ERROR", f"Không thể mở file để ghi cho Node '{node_id}': {e}")
+            return None
+        self.file_handles[node_id] = file_handle
+        self.log("INFO", f"Đã tạo file ghi dữ liệu cho Node '{node_id}': {output_path}")
+        return file_handle
+
+    def _write_samples(self, samples, enqueued_at):
+        self.batches += 1
+        nodes = samples["node"]
+        for idx in np.unique(nodes).tolist():
+            rows = samples[nodes == idx]
+            node_id = self.node_index.name_of(idx)
+            file_handle = self.file_handles.get(node_id) or self._open_file(node_id)
+            if file_handle is None:
+                self.rows_dropped += len(rows)
+                continue
+            try:
+                file_handle.write(rows)
+            except Exception as e:
+                self.rows_dropped += len(rows)
+                self.log("ERROR", f"Ghi dữ liệu vào file lỗi cho Node '{node_id}': {e}")
+                try:
+                    file_handle.close()
+                except Exception as close_error:
+                    self.log("ERROR", f"Không thể đóng file lỗi: {close_error}")
+                self.file_handles.pop(node_id, None)
+                continue
+            self.rows_written += len(rows)
+            if not self._pending_rows:
+                self._pending_since = enqueued_at
+            self._pending_rows += len(rows)
+
+    def _flush(self, fsync=False):
+        if not self._pending_rows:
+            return
+        started = time.perf_counter()
+        for node_id, file_handle in list(self.file_handles.items()):
+            try:
+                file_handle.flush(fsync)
+            except Exception as e:
+                self.log("ERROR", f"Không thể flush file cho Node '{node_id}': {e}")
+        now = time.perf_counter()
+        LATENCY.record("fsync" if fsync else "flush", now - started)
+        LATENCY.record("to_disk", now - self._pending_since)
+        latency_ms = (now - self._pending_since) * 1000.0
+        self.latency_ms_last = latency_ms
+        self.latency_ms_max = max(self.latency_ms_max, latency_ms)
+        self._latency_ms_sum += latency_ms
+        self.flushes += 1
+        if fsync:
+            self.fsyncs += 1
+        self._pending_rows = 0
+        self._pending_since = None
@@ -0,0 +1,331 @@
+"""One loader for every recording layout, vectorized and parallel.
+
+Layouts (``detect_schema``):
+
+* "v2": EspServer.py CSV, ``ID,Status,AccX,...,GyroZ,Timestamp,Timestamp_us``
+  (older files pad the header with spaces).  Timestamps come from the
+  ``Timestamp_us`` column.
+* "v1": Code version 1 log.  The header ``Timestamp_Local, NodeID, ax, ...,
+  Timestamp_Node`` is one column off: rows are ``node, ax..gz, mm:ss:us``.
+  The minutes wrap at 60, so a recording longer than an hour jumps back by
+  3600 s.  ``unwrap_hours`` adds the lost hours back.
+* "imu": columnar_format.py directories.
+
+A CSV is parsed by NumPy's C tokenizer (``np.loadtxt``) in one call; v1
+timestamps become three numeric columns by reading ``:`` as a separator.
+There is no per-row Python ``float()``/``int()``.  A file with a malformed
+line falls back to one regex ``findall`` over the whole file, which keeps
+the good rows and counts the others in ``bad_rows``.
+The result is a ``Recording`` holding a SAMPLE_DTYPE array (the ingest
+engine's layout).  ``load_many`` reads files in worker processes and maps
+node IDs into one NodeIndex.  ``read_nodes`` returns the
+{node_id: (ts_us, values)} shape of ``columnar_format.read_recording_csv``,
+which stays as the reference implementation.
+
+    python recording_loader.py bench ../data
+"""
+import argparse
+import collections
+import concurrent.futures
+import io
+import os
+import re
+import time
+
+import numpy as np
+
+from columnar_format import EXTENSION as COLUMNAR_EXTENSION, iter_csv_files, open_recording
+from sensor_parser import SAMPLE_DTYPE, SAMPLE_FIELDS, NodeIndex
+
+SCHEMA_V1 = "v1"
+SCHEMA_V2 = "v2"
+SCHEMA_IMU = "imu"
+SCHEMA_UNKNOWN = "unknown"
+
+HOUR_US = 3_600_000_000
+WRAP_TOLERANCE_US = 60_000_000  # A backward jump within this of one hour is a minute-counter wrap
+PARALLEL_MIN_FILES = 4  # Fewer files are read in the calling process
+
+# path, schema, samples (SAMPLE_DTYPE, node = index into node_ids), node_ids, bad_rows, hour wraps repaired
+Recording = collections.namedtuple("Recording", "path schema samples node_ids bad_rows wraps")
+
+_NUMBER = r"[ \t]*(-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)[ \t]*"
+_NODE = r"^[ \t]*([^,\n]*?)[ \t]*"
+_V2_RE = re.compile(
+    _NODE + r",[^,\n]*," + ",".join([_NUMBER] * 6) + r",[^,\n]*,[ \t]*(-?\d+)[ \t]*\r?$" + r"|^(.*)$",
+    re.MULTILINE,
+)
+_NODE_COLUMN_RE = re.compile(r"^([^,\n]*),", re.MULTILINE)
+_V1_RE = re.compile(
+    _NODE + "," + ",".join([_NUMBER] * 6) + r",[ \t]*(\d+):(\d+):(\d+)[ \t]*(?:,[^\n]*)?\r?$" + r"|^(.*)$",
+    re.MULTILINE,
+)
+
+
+def detect_schema(path, header=None):
+    """SCHEMA_* of a CSV file (from its header line) or .imu directory."""
+    if os.path.isdir(path):
+        return SCHEMA_IMU if path.endswith(COLUMNAR_EXTENSION) else SCHEMA_UNKNOWN
+    if header is None:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            header = f.readline()
+    fields = [h.strip() for h in header.split(",")]
+    if "Timestamp_us" in fields:
+        return SCHEMA_V2
+    if "Timestamp_Node" in fields or "NodeID" in fields:
+        return SCHEMA_V1
+    return SCHEMA_UNKNOWN
+
+
+def unwrap_hours(ts_us):
+    """Add back the hours lost by an ``mm:ss:us`` clock; returns (ts_us, number of wraps)."""
+    if len(ts_us) < 2:
+        return ts_us, 0
+    dt = np.diff(ts_us)
+    wrapped = np.abs(dt + HOUR_US) <= WRAP_TOLERANCE_US
+    wraps = int(np.count_nonzero(wrapped))
+    if not wraps:
+        return ts_us, 0
+    offset = np.concatenate(([0], np.cumsum(wrapped))) * HOUR_US
+    return ts_us + offset, wraps
+
+
+def _columns(rows, first_ts_group):
+    """Matched rows (catch-all group empty) as column tuples, and the count of other non-blank lines."""
+    good = [row for row in rows if row[first_ts_group]]
+    bad = sum(1 for row in rows if not row[first_ts_group] and row[-1].strip())
+    return (list(zip(*good)) if good else None), bad
+
+
+def _to_array(node_column, values, ts_us, node_index):
+    out = np.empty(len(ts_us), dtype=SAMPLE_DTYPE)
+    if node_column.__class__ is str:  # The same node on every row
+        out["node"] = node_index.index_of(node_column.strip())
+    else:
+        # Node IDs may be space padded (v1); strip once per distinct value, not per row
+        lookup = {name: node_index.index_of(name.strip()) for name in set(node_column)}
+        out["node"] = np.fromiter(map(lookup.__getitem__, node_column), dtype=np.uint16, count=len(ts_us))
+    out["ts_us"] = ts_us
+    for name, column in zip(SAMPLE_FIELDS, values):
+        out[name] = column
+    return out
+
+
+def _parse_fast(text, schema, node_index):
+    """SAMPLE_DTYPE array of a well-formed CSV body, or None if any line is malformed."""
+    if schema == SCHEMA_V1:
+        text = text.replace(":", ",")  # mm:ss:us -> three columns
+        usecols = range(1, 10)
+    else:
+        usecols = (2, 3, 4, 5, 6, 7, 9)
+    try:
+        table = np.loadtxt(io.StringIO(text), delimiter=",", usecols=usecols, comments=None, ndmin=2)
+    except ValueError:
+        return None
+    # Recordings hold one node: check that every line starts with the first line's ID
+    first = text.lstrip("\n")
+    node_column = first[:first.find(",")]
+    if ("\n" + text).count("\n" + node_column + ",") != len(table):
+        node_column = _NODE_COLUMN_RE.findall(text)
+        if len(node_column) != len(table):
+            return None
+    if schema == SCHEMA_V1:
+        minutes, seconds, micros = table[:, 6].astype(np.int64), table[:, 7].astype(np.int64), table[:, 8]
+        ts_us = (minutes * 60 + seconds) * 1_000_000 + micros.astype(np.int64)
+    else:
+        ts_us = table[:, 6].astype(np.int64)  # Exact below 2**53 us
+    return _to_array(node_column, table[:, :6].T, ts_us, node_index)
+
+
+def _parse_regex(text, schema, node_index):
+    """(samples, bad_rows) of a CSV body with malformed lines."""
+    if schema == SCHEMA_V1:
+        columns, bad = _columns(_V1_RE.findall(text), 7)
+        if columns is None:
+            return np.empty(0, dtype=SAMPLE_DTYPE), bad
+        minutes, seconds, micros = (np.array(c, dtype=np.int64) for c in columns[7:10])
+        ts_us = (minutes * 60 + seconds) * 1_000_000 + micros
+    else:
+        columns, bad = _columns(_V2_RE.findall(text), 7)
+        if columns is None:
+            return np.empty(0, dtype=SAMPLE_DTYPE), bad
+        ts_us = np.array(columns[7], dtype=np.int64)
+    values = [np.array(column, dtype=np.float64) for column in columns[1:7]]
+    return _to_array(columns[0], values, ts_us, node_index), bad
+
+
+def _parse_csv(text, schema, node_index):
+    """(samples, bad_rows, wraps) of a CSV body (header removed)."""
+    samples = _parse_fast(text, schema, node_index) if text.strip() else np.empty(0, dtype=SAMPLE_DTYPE)
+    bad = 0
+    if samples is None:
+        samples, bad = _parse_regex(text, schema, node_index)
+    wraps = 0
+    if schema == SCHEMA_V1:
+        nodes = samples["node"]
+        for idx in np.unique(nodes).tolist():
+            mask = nodes == idx
+            samples["ts_us"][mask], node_wraps = unwrap_hours(samples["ts_us"][mask])
+            wraps += node_wraps
+    return samples, bad, wraps
+
+
+def load_recording(path, node_index=None):
+    """Load one CSV file or .imu directory into a Recording.
+
+    Node numbers refer to ``node_index`` (a new NodeIndex if None); the
+    Recording's ``node_ids`` lists the IDs present, in node-number order.
+    """
+    node_index = NodeIndex() if node_index is None else node_index
+    schema = detect_schema(path)
+    if schema == SCHEMA_IMU:
+        rec = open_recording(path)
+        samples = np.empty(len(rec), dtype=SAMPLE_DTYPE)
+        samples["node"] = node_index.index_of(rec.node_id)
+        samples["ts_us"] = rec.ts_us
+        for name in SAMPLE_FIELDS:
+            samples[name] = rec[name]
+        bad, wraps = 0, 0
+    else:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            header = f.readline()
+            text = f.read()
+        schema = detect_schema(path, header)
+        # Unknown headers: try the current layout, then the old one
+        samples, bad, wraps = _parse_csv(text, SCHEMA_V1 if schema == SCHEMA_V1 else SCHEMA_V2, node_index)
+        if schema == SCHEMA_UNKNOWN and not len(samples):
+            samples, bad, wraps = _parse_csv(text, SCHEMA_V1, node_index)
+    present = np.unique(samples["node"]).tolist()
+    return Recording(path, schema, samples, [node_index.name_of(i) for i in present], bad, wraps)
+
+
+def read_nodes(path):
+    """{node_id: (ts_us int64, values (n, 6) float32)}, like columnar_format.read_recording_csv."""
+    node_index = NodeIndex()
+    rec = load_recording(path, node_index)
+    nodes = {}
+    for node_id in rec.node_ids:
+        rows = rec.samples[rec.samples["node"] == node_index.index_of(node_id)] if len(rec.node_ids) > 1 \
+            else rec.samples
+        values = np.column_stack([rows[name] for name in SAMPLE_FIELDS]).astype(np.float32)
+        nodes[node_id] = (rows["ts_us"].copy(), values)
+    return nodes
+
+
+def _load_local(path):
+    rec = load_recording(path)
+    node_index = NodeIndex()
+    for node_id in rec.node_ids:
+        node_index.index_of(node_id)
+    return rec, node_index.names
+
+
+def load_many(paths, node_index=None, workers=None):
+    """Load many recordings, in worker processes when there are enough of them.
+
+    Returns Recordings in the order of ``paths``, all numbered with one
+    ``node_index`` (a new NodeIndex if None).
+    """
+    node_index = NodeIndex() if node_index is None else node_index
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < PARALLEL_MIN_FILES:
+        return [load_recording(path, node_index) for path in paths]
+    chunksize = max(len(paths) // (workers * 4), 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        loaded = list(pool.map(_load_local, paths, chunksize=chunksize))
+    recordings = []
+    for rec, names in loaded:
+        samples = rec.samples
+        if len(samples):
+            # Renumber from the worker's own index to the shared one
+            lookup = np.array([node_index.index_of(name) for name in names], dtype=np.uint16)
+            samples["node"] = lookup[samples["node"]]
+        else:
+            for name in names:
+                node_index.index_of(name)
+        recordings.append(rec._replace(samples=samples))
+    return recordings
+
+
+def iter_recordings(path):
+    """CSV files and .imu directories under ``path`` (or ``path`` itself)."""
+    if os.path.isdir(path) and not path.endswith(COLUMNAR_EXTENSION):
+        for directory, dirs, _ in os.walk(path):
+            dirs.sort()
+            for name in list(dirs):
+                if name.endswith(COLUMNAR_EXTENSION):
+                    dirs.remove(name)
+                    yield os.path.join(directory, name)
+        yield from iter_csv_files(path)
+    else:
+        yield path
+
+
+# --- Command line ---
+def _cmd_bench(args):
+    from columnar_format import read_recording_csv
+
+    paths = [p for p in iter_csv_files(args.path)]
+    size = sum(os.path.getsize(p) for p in paths)
+
+    def best_of(fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    reference_s, reference = best_of(lambda: [read_recording_csv(p) for p in paths])
+    serial_s, serial = best_of(lambda: load_many(paths, workers=1))
+    parallel_s, parallel = best_of(lambda: load_many(paths, workers=args.workers))
+
+    rows = sum(len(r.samples) for r in serial)
+    mismatches = 0
+    for path, ref, rec in zip(paths, reference, serial):
+        nodes = read_nodes(path)
+        for node_id, (ts, values) in ref.items():
+            got_ts, got_values = nodes.get(node_id, (None, None))
+            if got_ts is None or not np.array_equal(values, got_values) or (
+                    not rec.wraps and not np.array_equal(ts, got_ts)):
+                mismatches += 1
+                print(f"  differs from the reference: {path}:{node_id}")
+    assert all(len(a.samples) == len(b.samples) for a, b in zip(serial, parallel))
+    schemas = collections.Counter(r.schema for r in serial)
+    print(f"{len(paths)} files, {size / 1e6:.1f} MB, {rows:,} rows "
+          f"({', '.join(f'{n} {s}' for s, n in sorted(schemas.items()))}), "
+          f"{sum(r.bad_rows for r in serial)} bad rows, {sum(r.wraps for r in serial)} hour wraps")
+    print(f"  reference csv.reader   {reference_s * 1000:8.1f} ms")
+    print(f"  loader, 1 process      {serial_s * 1000:8.1f} ms  ({reference_s / serial_s:.1f}x)")
+    print(f"  loader, {args.workers or os.cpu_count()} processes    {parallel_s * 1000:8.1f} ms  "
+          f"({reference_s / parallel_s:.1f}x)")
+    print(f"  {mismatches} node(s) differ from the reference")
+
+
+def _cmd_info(args):
+    for rec in load_many(list(iter_recordings(args.path)), workers=args.workers):
+        ts = rec.samples["ts_us"]
+        span = (ts.max() - ts.min()) / 1e6 if len(ts) else 0.0
+        print(f"{rec.path}: {rec.schema}, nodes={','.join(rec.node_ids) or '-'}, rows={len(rec.samples)}, "
+              f"bad={rec.bad_rows}, wraps={rec.wraps}, span={span:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unified loader for v1/v2 CSV and .imu recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="schema, nodes, rows, bad rows and hour wraps per recording")
+    p.add_argument("path", help="file or directory")
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=_cmd_info)
+    p = sub.add_parser("bench", help="compare with columnar_format.read_recording_csv on a directory")
+    p.add_argument("path", help="directory of CSV recordings")
+    p.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=_cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
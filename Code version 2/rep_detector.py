@@ -0,0 +1,319 @@
+"""Online leg-press rep detection on the live per-node stream.
+
+``OnlineRepDetector`` applies the rules of segmentation.py (moving average,
+peaks above ``threshold`` at least ``distance`` samples apart, reps bounded
+by valleys) to one node's samples as they arrive:
+
+* The centred moving average of a sample is known ``ceil(window / 2) - 1``
+  samples later.  Only the new samples of a batch are smoothed, using the
+  last ``window`` raw values.
+* Candidate peaks (strict local maxima above the threshold) wait until
+  their fate is certain, and the greedy suppression of
+  ``segmentation.find_peaks`` is re-run over the waiting ones each batch.
+  A candidate is decided once every candidate that could suppress it
+  (higher, within ``distance``) is known and decided itself.  The same
+  holds for the peaks that decide those.  It is also decided, as things
+  stand, once ``max_latency_s`` has passed since it (smoothing delay
+  included).  Decisions are made in sample order, and each accepted peak
+  emits a rep right away.
+* A rep starts where the previous one ended, or at the valley within
+  ``distance`` samples before its peak.  It ends at the valley within
+  ``min(distance, latency)`` samples after the peak.
+
+Without a latency limit the peaks are those of ``segmentation.find_peaks``
+(except at the end of the stream).  With a limit, a long chain of
+ever-higher peaks may be decided before its end is seen.
+
+Memory per node is bounded: the last HISTORY_SAMPLES smoothed values and
+samples.  A rep longer than that is cut at the start.
+
+``RepMonitor`` subscribes to an IngestEngine and runs one detector per
+node.  Reps go to its subscribers as ``Rep`` tuples (with the rep's
+SAMPLE_DTYPE slice).  It counts reps per set (a pause of more than
+SET_GAP_S starts a new set) and keeps the largest-amplitude rep of each
+set.
+
+    python ingest_engine.py --port COM8 --detect-reps
+"""
+import collections
+import math
+import threading
+
+import numpy as np
+
+from segmentation import DEFAULT_DISTANCE, DEFAULT_SIGNAL, DEFAULT_THRESHOLD, DEFAULT_WINDOW, select_signal
+
+DEFAULT_LATENCY_S = 10.0  # Candidate peak -> decided, smoothing included
+HISTORY_SAMPLES = 4096  # Per node; longer reps are cut at the start
+SET_GAP_S = 20.0  # No rep for this long: the next rep starts a new set
+MAX_SETS = 50  # Finished sets kept per node (best rep each)
+PERIOD_GAIN = 1 / 16
+
+# node ID, set number, rep number in the set, start/peak/end timestamps (us),
+# amplitude (smoothed peak - lower of the two valleys), samples (SAMPLE_DTYPE, start..end)
+Rep = collections.namedtuple("Rep", "node set rep start_us peak_us end_us amplitude samples")
+
+
+class _History:
+    """The newest values of a stream, addressed by absolute sample number (at most 2 x ``capacity``)."""
+
+    def __init__(self, capacity, dtype):
+        self.capacity = capacity
+        self.data = np.empty(2 * capacity, dtype=dtype)
+        self.start = 0  # Sample number of data[0]
+        self.length = 0
+
+    @property
+    def end(self):
+        return self.start + self.length
+
+    def append(self, values):
+        n = len(values)
+        if n > self.capacity:
+            self.start += self.length + n - self.capacity
+            self.length = 0
+            values, n = values[-self.capacity:], self.capacity
+        if self.length + n > len(self.data):
+            keep = self.capacity - n
+            self.data[:keep] = self.data[self.length - keep:self.length]
+            self.start += self.length - keep
+            self.length = keep
+        self.data[self.length:self.length + n] = values
+        self.length += n
+
+    def view(self, first, stop):
+        """Values of samples [first, stop) still held, and the number of the first one."""
+        first = max(first, self.start)
+        return self.data[first - self.start:max(stop, first) - self.start], first
+
+
+class OnlineRepDetector:
+    """Incremental rep segmentation of one node (see the module docstring)."""
+
+    def __init__(self, node_id, signal=DEFAULT_SIGNAL, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD,
+                 distance=DEFAULT_DISTANCE, max_latency_s=DEFAULT_LATENCY_S, history=HISTORY_SAMPLES):
+        self.node_id = node_id
+        self.signal = signal
+        self.window = max(int(window), 1)
+        self.threshold = threshold
+        self.distance = max(int(distance), 1)
+        self.max_latency_s = max_latency_s
+        self._smoothed = _History(history, np.float64)
+        self._samples = None  # _History of SAMPLE_DTYPE, created with the first batch
+        self._raw_tail = np.empty(0)  # Raw values from sample (next smoothed - window // 2) on
+        self._received = 0
+        self._checked = 1  # Candidates below this sample number are all known
+        self._candidates = []  # [sample number, smoothed value] not decided yet, in sample order
+        self._peaks = collections.deque(maxlen=3)  # Last accepted peaks (they always suppress)
+        self._last_end = None
+        self._last_peak_us = None
+        self.period_us = None
+        self.set = 0
+        self.rep = 0
+
+    def latency_samples(self):
+        """Samples after a candidate by which it is decided, whatever is still unknown."""
+        if not self.max_latency_s or not self.period_us:
+            return self._smoothed.capacity // 2
+        delay = math.ceil(self.window / 2) - 1
+        return max(int(self.max_latency_s * 1e6 / self.period_us) - delay, 1)
+
+    def feed(self, samples):
+        """Add samples (SAMPLE_DTYPE rows of this node, in order); returns the reps completed."""
+        if not len(samples):
+            return []
+        if self._samples is None:
+            self._samples = _History(self._smoothed.capacity, samples.dtype)
+        self._update_period(samples["ts_us"])
+        self._samples.append(samples)
+        self._smooth(select_signal(samples, self.signal).astype(np.float64))
+        self._find_candidates()
+        return self._settle()
+
+    def _update_period(self, ts_us):
+        dt = np.diff(ts_us)
+        dt = dt[dt > 0]
+        if len(dt):
+            period = float(np.median(dt))
+            self.period_us = period if self.period_us is None else \
+                self.period_us + PERIOD_GAIN * (period - self.period_us)
+
+    def _smooth(self, raw):
+        """Append the moving average (segmentation's centred window) of every sample now complete."""
+        half, after = self.window // 2, math.ceil(self.window / 2)
+        values = np.concatenate((self._raw_tail, raw))
+        offset = self._received + len(raw) - len(values)  # Sample number of values[0]
+        self._received += len(raw)
+        first, stop = self._smoothed.end, self._received - after + 1
+        if stop > first:
+            sums = np.concatenate(([0.0], np.cumsum(values)))
+            idx = np.arange(first, stop)
+            lo = np.maximum(idx - half, 0) - offset
+            hi = idx + after - offset
+            self._smoothed.append((sums[hi] - sums[lo]) / (hi - lo))
+        keep_from = max(self._smoothed.end - half, 0) - offset
+        self._raw_tail = values[keep_from:]
+
+    def _find_candidates(self):
+        """Strict local maxima above the threshold, among the samples whose neighbours are now known."""
+        x, base = self._smoothed.view(self._checked - 1, self._smoothed.end)
+        if len(x) < 3:
+            return
+        inner = x[1:-1]
+        found = np.flatnonzero((inner > self.threshold) & (inner > x[:-2]) & (inner > x[2:])) + 1
+        self._candidates.extend([c + base, v] for c, v in zip(found.tolist(), x[found].tolist()))
+        self._checked = self._smoothed.end - 1
+
+    def _settle(self):
+        """Greedy suppression over the undecided candidates; returns the reps of the peaks now certain.
+
+        A candidate's fate is final once every candidate that could suppress
+        it (higher, within ``distance``) is known and final itself, or once
+        its latency budget has run out.
+        """
+        d = self.distance
+        known = self._checked
+        deadline = known - self.latency_samples()
+        accepted = [(p, True) for p in self._peaks]  # (sample number, final)
+        fate = {}  # sample number -> (accepted, final)
+        for c, _ in sorted(self._candidates, key=lambda cand: -cand[1]):  # Stable: ties in sample order
+            higher = [fate[h] for h in fate if c - d < h <= c + d]
+            blockers = [final for p, final in accepted if c - d < p <= c + d]
+            if blockers:
+                final = any(blockers)  # Suppressed for good once a blocker is certain
+                fate[c] = (False, final or c <= deadline)
+            else:
+                final = c + d < known and all(f for _, f in higher)
+                fate[c] = (True, final or c <= deadline)
+                accepted.append((c, fate[c][1]))
+        # Decide in sample order, so reps come out in order and each starts where the last one ended
+        reps = []
+        while self._candidates:
+            c, value = self._candidates[0]
+            is_peak, final = fate[c]
+            if not final:
+                break
+            self._candidates.pop(0)
+            if is_peak:
+                self._peaks.append(c)
+                reps.append(self._rep(c, value))
+        return reps
+
+    def _rep(self, peak, peak_value):
+        horizon = min(self.distance, self.latency_samples())
+        after, base = self._smoothed.view(peak + 1, peak + horizon + 1)
+        rep_end = base + int(np.argmin(after)) if len(after) else peak
+        lo = peak - self.distance if self._last_end is None else max(self._last_end, peak - self.distance)
+        before, base = self._smoothed.view(lo, peak + 1)
+        rep_start = base + int(np.argmin(before))
+        smoothed, first = self._smoothed.data, self._smoothed.start
+        amplitude = peak_value - min(smoothed[rep_start - first], smoothed[rep_end - first])
+        rows, _ = self._samples.view(rep_start, rep_end + 1)
+        rows = rows.copy()
+        peak_us = int(self._samples.data[peak - self._samples.start]["ts_us"])
+        if self._last_peak_us is None or not 0 <= peak_us - self._last_peak_us <= SET_GAP_S * 1e6:
+            self.set += 1
+            self.rep = 0
+        self.rep += 1
+        self._last_end, self._last_peak_us = rep_end, peak_us
+        return Rep(self.node_id, self.set, self.rep, int(rows["ts_us"][0]), peak_us, int(rows["ts_us"][-1]),
+                   float(amplitude), rows)
+
+
+class _NodeReps:
+    __slots__ = ("detector", "total", "set", "reps", "best", "sets")
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.total = 0
+        self.set = 0
+        self.reps = 0  # Reps in the current set
+        self.best = None  # Largest-amplitude Rep of the current set
+        self.sets = collections.deque(maxlen=MAX_SETS)  # (set, reps, best Rep) of finished sets
+
+
+class RepMonitor:
+    """Runs an OnlineRepDetector per node of an IngestEngine; see the module docstring."""
+
+    def __init__(self, engine, log=None, **options):
+        self.engine = engine
+        self.log = log or engine.log
+        self.options = options  # OnlineRepDetector keyword arguments
+        self._nodes = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        engine.subscribe(self.on_batch)
+
+    def close(self):
+        self.engine.unsubscribe(self.on_batch)
+
+    def subscribe(self, callback):
+        """Register ``callback(rep)``; it is called on the engine's reader thread for every completed rep."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def on_batch(self, batch):
+        """Engine subscriber: feeds each node's samples to its detector."""
+        samples = batch.samples
+        if not len(samples):
+            return
+        nodes = samples["node"]
+        for idx in np.unique(nodes).tolist():
+            node_id = self.engine.node_name(idx)
+            state = self._nodes.get(node_id)
+            if state is None:
+                state = self._nodes[node_id] = _NodeReps(OnlineRepDetector(node_id, **self.options))
+            for rep in state.detector.feed(samples[nodes == idx]):
+                self._add(state, rep)
+
+    def _add(self, state, rep):
+        finished = None
+        with self._lock:
+            if rep.set != state.set:
+                if state.best is not None:
+                    finished = (state.set, state.reps, state.best)
+                    state.sets.append(finished)
+                state.set, state.reps, state.best = rep.set, 0, None
+            state.total += 1
+            state.reps = rep.rep
+            if state.best is None or rep.amplitude > state.best.amplitude:
+                state.best = rep
+        if finished is not None:
+            set_number, reps, best = finished
+            self.log("INFO", f"{rep.node}: xong hiệp {set_number}, {reps} lần đạp, "
+                             f"lớn nhất là lần {best.rep} (biên độ {best.amplitude:.2f})")
+        self.log("INFO", f"{rep.node}: lần đạp {rep.rep} (hiệp {rep.set}), biên độ {rep.amplitude:.2f}, "
+                         f"{(rep.end_us - rep.start_us) / 1e6:.1f} s")
+        for callback in list(self._subscribers):
+            callback(rep)
+
+    def best_reps(self, node_id):
+        """[(set, reps, largest-amplitude Rep)] of a node, oldest set first, the current set last."""
+        with self._lock:
+            state = self._nodes.get(node_id)
+            if state is None:
+                return []
+            current = [(state.set, state.reps, state.best)] if state.best is not None else []
+            return list(state.sets) + current
+
+    def snapshot(self):
+        """{node ID: {"set", "reps", "total", "best_rep", "best_amplitude"}} for the current sets."""
+        with self._lock:
+            return {
+                node_id: {"set": s.set, "reps": s.reps, "total": s.total,
+                          "best_rep": s.best.rep if s.best else None,
+                          "best_amplitude": s.best.amplitude if s.best else None}
+                for node_id, s in self._nodes.items()
+            }
+
+
+def format_reps(report):
+    """One log line per node."""
+    return [
+        f"reps {node_id}: set {r['set']}, {r['reps']} reps ({r['total']} total), "
+        f"largest #{r['best_rep']} amplitude {r['best_amplitude']:.2f}"
+        for node_id, r in report.items() if r["best_rep"] is not None
+    ]
@@ -0,0 +1,164 @@
+"""Resample segmented reps to one length: a (reps, length, 6) float32 tensor.
+
+Reps differ in length (a slow press has more samples), while PCA and the
+models need one row size.  ``normalize_reps`` brings every rep to
+``length`` samples of ax..gz in one vectorized pass over all reps:
+
+* "linear": the rep is sampled at ``length`` evenly spaced positions from
+  its first to its last sample, interpolating between neighbours
+  (the same as np.interp per rep and channel);
+* "mean": the rep is cut into ``length`` equal bins, and each value is the
+  mean of the samples in its bin (from cumulative sums).  When a rep is
+  shorter than ``length``, a bin holds the nearest sample.
+
+``load_reps`` segments every recording (segmentation.segment_recording,
+through the analysis cache) and concatenates the samples.  ``sweep``
+then produces several lengths from that one load, so comparing sizes
+(128, 1024, ...) does not reload or re-segment the CSV files.
+
+    python rep_normalize.py ../data --lengths 40 128 1024 --method mean --out ../data/reps
+"""
+import argparse
+import collections
+import os
+import time
+
+import numpy as np
+
+from analysis_cache import AnalysisCache
+from recording_loader import iter_recordings
+from segmentation import DEFAULT_DISTANCE, DEFAULT_SIGNAL, DEFAULT_THRESHOLD, DEFAULT_WINDOW, segment_recording
+from sensor_parser import SAMPLE_FIELDS
+
+METHODS = ("linear", "mean")
+DEFAULT_LENGTHS = (40, 128, 1024)  # Sizes named in note1807.txt
+MIN_REP_SAMPLES = 3
+
+# One row per rep of a RepSet
+INDEX_DTYPE = np.dtype([("file", np.int32), ("rep", np.int32), ("start_us", np.int64), ("end_us", np.int64),
+                        ("samples", np.int32)])
+
+# values: (n, 6) float32 of all recordings; starts/ends: rep bounds in values (end inclusive);
+# index: INDEX_DTYPE per rep; paths: recording of index["file"]
+RepSet = collections.namedtuple("RepSet", "values starts ends index paths")
+
+
+def normalize_reps(values, starts, ends, length, method="linear"):
+    """(reps, length, channels) float32: rows ``starts[i]..ends[i]`` (inclusive) of ``values`` resampled."""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    values = np.asarray(values)
+    starts = np.asarray(starts, dtype=np.int64)[:, None]
+    ends = np.asarray(ends, dtype=np.int64)[:, None]
+    sizes = ends - starts + 1
+    if method == "linear":
+        steps = np.arange(length) / max(length - 1, 1)
+        pos = starts + steps[None, :] * (sizes - 1)  # (reps, length)
+        left = np.minimum(np.floor(pos).astype(np.int64), ends)
+        right = np.minimum(left + 1, ends)
+        frac = (pos - left).astype(np.float32)[..., None]
+        lower = values[left].astype(np.float32, copy=False)
+        return lower + frac * (values[right] - lower)
+    # Bin k covers [start + k * size / length, start + (k + 1) * size / length)
+    edges = starts + np.floor(np.arange(length + 1)[None, :] * sizes / length).astype(np.int64)
+    lo = np.minimum(edges[:, :-1], ends)
+    hi = np.maximum(edges[:, 1:], lo + 1)
+    sums = np.concatenate((np.zeros((1, values.shape[1])), np.cumsum(values, axis=0, dtype=np.float64)))
+    return ((sums[hi] - sums[lo]) / (hi - lo)[..., None]).astype(np.float32)
+
+
+def load_reps(paths, cache=None, min_samples=MIN_REP_SAMPLES, **segmentation):
+    """Segment every recording (cached) and gather its reps into one RepSet."""
+    cache = cache or AnalysisCache()
+    chunks, starts, ends, index, kept = [], [], [], [], []
+    offset = 0
+    for path in paths:
+        samples, _, reps = segment_recording(path, cache, **segmentation)
+        size = reps["end"] - reps["start"] + 1
+        keep = size >= min_samples
+        if not keep.any():
+            continue
+        file_number = len(kept)
+        kept.append(path)
+        chunks.append(np.column_stack([samples[name] for name in SAMPLE_FIELDS]).astype(np.float32))
+        starts.append(reps["start"][keep] + offset)
+        ends.append(reps["end"][keep] + offset)
+        rows = np.empty(int(keep.sum()), dtype=INDEX_DTYPE)
+        rows["file"] = file_number
+        rows["rep"] = np.flatnonzero(keep) + 1
+        rows["start_us"] = samples["ts_us"][reps["start"][keep]]
+        rows["end_us"] = samples["ts_us"][reps["end"][keep]]
+        rows["samples"] = size[keep]
+        index.append(rows)
+        offset += len(samples)
+    if not kept:
+        empty = np.empty(0, dtype=np.int64)
+        return RepSet(np.empty((0, len(SAMPLE_FIELDS)), dtype=np.float32), empty, empty,
+                      np.empty(0, dtype=INDEX_DTYPE), [])
+    return RepSet(np.concatenate(chunks), np.concatenate(starts), np.concatenate(ends), np.concatenate(index), kept)
+
+
+def sweep(rep_set, lengths=DEFAULT_LENGTHS, method="linear"):
+    """{length: (reps, length, 6) float32} from one RepSet."""
+    return {length: normalize_reps(rep_set.values, rep_set.starts, rep_set.ends, length, method)
+            for length in lengths}
+
+
+def save_tensor(path, tensor, rep_set):
+    """Tensor, rep index and recording paths in one .npz file."""
+    np.savez(path, tensor=tensor, index=rep_set.index, paths=np.array(rep_set.paths))
+
+
+def _reference(rep_set, length):
+    """np.interp per rep and channel, to check the "linear" method."""
+    out = np.empty((len(rep_set.starts), length, rep_set.values.shape[1]), dtype=np.float32)
+    for r, (start, end) in enumerate(zip(rep_set.starts.tolist(), rep_set.ends.tolist())):
+        rows = rep_set.values[start:end + 1]
+        pos = np.linspace(0, len(rows) - 1, length)
+        for c in range(rows.shape[1]):
+            out[r, :, c] = np.interp(pos, np.arange(len(rows)), rows[:, c])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample segmented reps to fixed-length tensors")
+    parser.add_argument("path", help="recording or directory of recordings")
+    parser.add_argument("--lengths", type=int, nargs="+", default=list(DEFAULT_LENGTHS))
+    parser.add_argument("--method", choices=METHODS, default="linear")
+    parser.add_argument("--out", help="directory for reps_<length>_<method>.npz files")
+    parser.add_argument("--cache", default=None, help="analysis cache directory (default: data/.cache)")
+    parser.add_argument("--signal", default=DEFAULT_SIGNAL)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE)
+    parser.add_argument("--check", action="store_true", help="compare linear with np.interp per rep")
+    args = parser.parse_args()
+
+    cache = AnalysisCache(args.cache) if args.cache else AnalysisCache()
+    started = time.perf_counter()
+    rep_set = load_reps(list(iter_recordings(args.path)), cache, signal=args.signal, window=args.window,
+                        threshold=args.threshold, distance=args.distance)
+    loaded = time.perf_counter() - started
+    sizes = rep_set.index["samples"]
+    print(f"{len(rep_set.starts)} reps from {len(rep_set.paths)} recordings in {loaded * 1000:.0f} ms "
+          f"({cache.hits} cache hits, {cache.misses} misses)"
+          + (f", {sizes.min()}-{sizes.max()} samples (median {int(np.median(sizes))})" if len(sizes) else ""))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    for length in args.lengths:
+        started = time.perf_counter()
+        tensor = sweep(rep_set, [length], args.method)[length]
+        elapsed = time.perf_counter() - started
+        line = f"  {args.method} {length:>5}: {tensor.shape} {tensor.nbytes / 1e6:7.1f} MB in {elapsed * 1000:7.1f} ms"
+        if args.check and args.method == "linear":
+            started = time.perf_counter()
+            reference = _reference(rep_set, length)
+            line += (f", np.interp loop {(time.perf_counter() - started) * 1000:7.1f} ms, "
+                     f"max diff {float(np.abs(reference - tensor).max()) if len(tensor) else 0.0:.2g}")
+        if args.out:
+            save_tensor(os.path.join(args.out, f"reps_{length}_{args.method}.npz"), tensor, rep_set)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Incremental PCA of the normalized reps, persisted next to the catalog.
+
+Each rep is resampled to ``length`` samples of ax..gz (rep_normalize.py)
+and flattened into a row of ``length * 6`` values.  Recordings are in g
+and dps, so the gyro channels vary one to two orders of magnitude more
+than the accelerometer channels, and unscaled PCA would mostly follow the
+gyro: each channel is divided by its standard deviation (``scale``).  The
+scale is taken from the first batch and then frozen, so every later batch
+is in the same units; ``--refit`` recomputes it and ``--raw`` turns it off.
+``RepPCA.partial_fit`` merges one mini-batch of rows into the model with
+the incremental SVD of Ross et al. (the method of scikit-learn's
+IncrementalPCA): it stacks the current components scaled by their singular
+values, the centred batch and a mean-correction row, then keeps the top
+``n_components`` of that small matrix's SVD.  The model is therefore
+``n_components`` rows plus the running mean and variance, whatever the
+number of reps.
+
+``update`` streams the recordings of a ``dataset_catalog.Catalog`` one at a
+time (segmentation through the analysis cache) and fits only those whose
+content hash is not already in the model.  Adding a session updates the
+model, and memory stays at one recording plus one batch.  The model is
+saved as ``pca_<length>_<method>.npz`` next to ``catalog.json``, with
+its components, explained variance and the hashes of the recordings it
+contains.
+
+The model files are ignored by git (like catalog.json).  PCA cannot
+remove data: a recording that was deleted or edited stays in the model
+(``stale`` in the report) until a ``--refit``.
+
+    python rep_pca.py ../data update --length 128 --components 16
+    python rep_pca.py ../data info --length 128
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from analysis_cache import AnalysisCache
+from dataset_catalog import FLAG_DUPLICATE, FLAG_EMPTY, FLAG_SHORT, Catalog
+from rep_normalize import METHODS, load_reps, normalize_reps
+from segmentation import DEFAULT_DISTANCE, DEFAULT_SIGNAL, DEFAULT_THRESHOLD, DEFAULT_WINDOW
+from sensor_parser import SAMPLE_FIELDS
+
+MODEL_VERSION = 2
+DEFAULT_LENGTH = 128
+DEFAULT_COMPONENTS = 16
+DEFAULT_BATCH = 256  # Reps per partial_fit
+SKIP_FLAGS = (FLAG_EMPTY, FLAG_SHORT, FLAG_DUPLICATE)
+
+
+def model_path(root, length=DEFAULT_LENGTH, method="linear"):
+    return os.path.join(os.path.abspath(root), f"pca_{length}_{method}.npz")
+
+
+class RepPCA:
+    """PCA of flattened (length, 6) reps, fitted one batch at a time."""
+
+    def __init__(self, length=DEFAULT_LENGTH, method="linear", n_components=DEFAULT_COMPONENTS, signal=DEFAULT_SIGNAL,
+                 window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, distance=DEFAULT_DISTANCE, standardize=True):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+        self.config = {"version": MODEL_VERSION, "length": length, "method": method, "n_components": n_components,
+                       "signal": signal, "window": window, "threshold": threshold, "distance": distance,
+                       "standardize": standardize}
+        features = length * len(SAMPLE_FIELDS)
+        self.scale = np.ones(len(SAMPLE_FIELDS))  # Per channel, fixed by the first batch when standardizing
+        self.n_samples = 0
+        self.mean = np.zeros(features)
+        self.var = np.zeros(features)
+        self.components = np.zeros((0, features))
+        self.singular_values = np.zeros(0)
+        self.sources = []  # Content hashes of the fitted recordings
+
+    @property
+    def segmentation(self):
+        return {name: self.config[name] for name in ("signal", "window", "threshold", "distance")}
+
+    @property
+    def explained_variance(self):
+        return self.singular_values ** 2 / max(self.n_samples - 1, 1)
+
+    @property
+    def explained_variance_ratio(self):
+        total = self.var.sum() * self.n_samples
+        return self.singular_values ** 2 / total if total > 0 else np.zeros_like(self.singular_values)
+
+    def _scaled(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        channels = rows.reshape(len(rows), -1, len(SAMPLE_FIELDS))
+        return (channels / self.scale).reshape(len(rows), -1)
+
+    def partial_fit(self, rows):
+        """Merge ``rows`` (n, length * 6, raw units) into the model."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if not len(rows):
+            return self
+        if self.config["standardize"] and not self.n_samples:
+            std = rows.reshape(-1, len(SAMPLE_FIELDS)).std(axis=0)
+            self.scale = np.where(std > 0, std, 1.0)
+        rows = self._scaled(rows)
+        n_old, n_batch = self.n_samples, len(rows)
+        n_new = n_old + n_batch
+        batch_mean = rows.mean(axis=0)
+        centred = rows - batch_mean
+        if n_old:
+            delta = batch_mean - self.mean
+            mean = self.mean + delta * (n_batch / n_new)
+            var = (self.var * n_old + (centred ** 2).sum(axis=0) + delta ** 2 * (n_old * n_batch / n_new)) / n_new
+            centred = np.vstack((self.singular_values[:, None] * self.components, centred,
+                                 np.sqrt(n_old * n_batch / n_new) * -delta))
+        else:
+            mean, var = batch_mean, centred.var(axis=0)
+        _, singular, vt = np.linalg.svd(centred, full_matrices=False)
+        k = self.config["n_components"]
+        vt = vt[:k]
+        # Deterministic signs: the largest loading of each component is positive
+        signs = np.sign(vt[np.arange(len(vt)), np.abs(vt).argmax(axis=1)])
+        self.components = vt * np.where(signs == 0, 1, signs)[:, None]
+        self.singular_values = singular[:k]
+        self.mean, self.var, self.n_samples = mean, var, n_new
+        return self
+
+    def transform(self, rows):
+        """(n, n_components) scores of flattened reps (raw units)."""
+        return (self._scaled(rows) - self.mean) @ self.components.T
+
+    def rows(self, tensor):
+        return tensor.reshape(len(tensor), -1)
+
+    # --- Persistence ---
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, config=json.dumps(self.config), n_samples=self.n_samples, scale=self.scale,
+                 mean=self.mean, var=self.var, components=self.components, singular_values=self.singular_values,
+                 explained_variance=self.explained_variance, explained_variance_ratio=self.explained_variance_ratio,
+                 sources=np.array(self.sources, dtype=str))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            if config.get("version") != MODEL_VERSION:
+                raise ValueError(f"{path}: model version {config.get('version')}, expected {MODEL_VERSION}")
+            del config["version"]
+            model = cls(**config)
+            model.n_samples = int(data["n_samples"])
+            model.scale = data["scale"]
+            model.mean, model.var = data["mean"], data["var"]
+            model.components, model.singular_values = data["components"], data["singular_values"]
+            model.sources = data["sources"].tolist()
+        return model
+
+
+def update(model, catalog, cache=None, batch_size=DEFAULT_BATCH, refresh=True):
+    """Fit the catalog's recordings that are not in ``model`` yet; returns counts."""
+    cache = cache or AnalysisCache()
+    if refresh:
+        catalog.refresh()
+    counts = {"added": 0, "reps": 0, "known": 0, "stale": 0}
+    known = set(model.sources)
+    entries = catalog.query(without_flags=SKIP_FLAGS)
+    counts["stale"] = len(known - {entry["sha1"] for entry in entries})
+    batch, pending = [], 0
+    for entry in entries:
+        if entry["sha1"] is None:  # Catalog without content hashes: cannot tell whether it is fitted
+            continue
+        if entry["sha1"] in known:
+            counts["known"] += 1
+            continue
+        rep_set = load_reps([catalog.path_of(entry)], cache, **model.segmentation)
+        if len(rep_set.starts):
+            tensor = normalize_reps(rep_set.values, rep_set.starts, rep_set.ends, model.config["length"],
+                                    model.config["method"])
+            batch.append(model.rows(tensor))
+            pending += len(tensor)
+            counts["reps"] += len(tensor)
+        model.sources.append(entry["sha1"])
+        known.add(entry["sha1"])
+        counts["added"] += 1
+        if pending >= batch_size:
+            model.partial_fit(np.concatenate(batch))
+            batch, pending = [], 0
+    if batch:
+        model.partial_fit(np.concatenate(batch))
+    return counts
+
+
+# --- Command line ---
+def _print_model(model, path):
+    ratio = model.explained_variance_ratio
+    print(f"{path}: {model.n_samples} reps from {len(model.sources)} recordings, "
+          f"{model.components.shape[1]} features, {len(ratio)} components")
+    if model.config["standardize"]:
+        print("  channel scale " + " ".join(f"{name}={v:.4g}" for name, v in zip(SAMPLE_FIELDS, model.scale.tolist())))
+    cumulative = np.cumsum(ratio)
+    for i, (r, c) in enumerate(zip(ratio.tolist(), cumulative.tolist())):
+        print(f"  PC{i + 1:<3} {r * 100:6.2f} %  (cumulative {c * 100:6.2f} %)")
+
+
+def _cmd_update(args):
+    path = model_path(args.root, args.length, args.method)
+    model = None
+    if os.path.exists(path) and not args.refit:
+        try:
+            model = RepPCA.load(path)
+        except (KeyError, ValueError) as e:
+            print(f"Saved model not usable ({e}): refitting")
+        if model is not None and (
+                model.config["n_components"] != args.components or model.config["standardize"] == args.raw
+                or model.segmentation != {"signal": args.signal, "window": args.window, "threshold": args.threshold,
+                                          "distance": args.distance}):
+            print("Saved model has other settings: refitting")
+            model = None
+    if model is None:
+        model = RepPCA(args.length, args.method, args.components, args.signal, args.window, args.threshold,
+                       args.distance, standardize=not args.raw)
+    cache = AnalysisCache(args.cache) if args.cache else AnalysisCache()
+    tracemalloc.start()
+    started = time.perf_counter()
+    counts = update(model, Catalog(args.root), cache, args.batch)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{counts['added']} new recordings ({counts['reps']} reps), {counts['known']} already fitted, "
+          f"{counts['stale']} stale in {elapsed * 1000:.0f} ms, peak {peak / 1e6:.1f} MB")
+    if counts["stale"]:
+        print("Recordings were removed or changed since they were fitted: use --refit to drop them")
+    if counts["added"]:
+        model.save(path)
+    _print_model(model, path)
+
+
+def _cmd_info(args):
+    path = model_path(args.root, args.length, args.method)
+    if not os.path.exists(path):
+        print(f"No model at {path}")
+        return
+    _print_model(RepPCA.load(path), path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental PCA of the normalized reps of a data directory")
+    parser.add_argument("root", help="data directory (the model is kept next to <root>/catalog.json)")
+    parser.add_argument("--length", type=int, default=DEFAULT_LENGTH, help="samples per rep")
+    parser.add_argument("--method", choices=METHODS, default="linear")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("update", help="fit the recordings that are not in the model yet")
+    p.add_argument("--components", type=int, default=DEFAULT_COMPONENTS)
+    p.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="reps per partial fit")
+    p.add_argument("--refit", action="store_true", help="start from an empty model")
+    p.add_argument("--raw", action="store_true", help="do not scale each channel to unit variance")
+    p.add_argument("--cache", default=None, help="analysis cache directory (default: data/.cache)")
+    p.add_argument("--signal", default=DEFAULT_SIGNAL)
+    p.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    p.add_argument("--distance", type=int, default=DEFAULT_DISTANCE)
+    p.set_defaults(func=_cmd_update)
+    sub.add_parser("info", help="explained variance of the saved model").set_defaults(func=_cmd_info)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Resampling of several nodes onto one uniform time grid.
+
+Nodes send independently, so their samples never line up.  Analysis that
+combines nodes (joint angles, PCA over all channels) needs one row per
+instant.  Grid points fall on multiples of the grid period.  A node's value at a grid point
+comes from its two surrounding samples, by linear interpolation or the nearest
+of the two.  It is only valid if the samples are at most ``max_gap_us`` apart.
+Gaps are never filled, and ``valid`` marks them.
+
+``resample_uniform`` does a whole recording.  ``StreamingResampler``
+subscribes to an IngestEngine and emits the grid rows that every live node has
+passed; with ``IngestEngine(resample_hz=...)`` (``--resample-hz``) the engine
+runs one and records the grid (``grid_samples``) instead of the raw samples.
+Timestamps should be repaired first (timestamp_repair.py), or a
+stepping clock would show up as a stretched or squeezed signal.
+"""
+import collections
+
+import numpy as np
+
+from sensor_parser import SAMPLE_DTYPE, SAMPLE_FIELDS
+
+DEFAULT_MAX_GAP_US = 350_000  # Over three missed samples at 10 Hz: leave a hole
+STALE_NODE_US = 2_000_000  # A node silent this long no longer holds the stream back
+
+Grid = collections.namedtuple("Grid", "ts_us values valid node_ids")
+
+
+def grid_points(start_us, stop_us, rate_hz):
+    """Multiples of the grid period in [start_us, stop_us]."""
+    period = 1e6 / rate_hz
+    first = np.ceil(start_us / period)
+    last = np.floor(stop_us / period)
+    if last < first:
+        return np.empty(0, dtype=np.int64)
+    return np.rint(np.arange(first, last + 1) * period).astype(np.int64)
+
+
+def interpolate(ts_us, values, grid_ts, method="linear", max_gap_us=DEFAULT_MAX_GAP_US):
+    """Values of one node at ``grid_ts``: ((m, 6) float32, (m,) valid mask)."""
+    out = np.zeros((len(grid_ts), values.shape[1]), dtype=np.float32)
+    valid = np.zeros(len(grid_ts), dtype=bool)
+    if len(ts_us) < 2 or not len(grid_ts):
+        return out, valid
+    order = np.argsort(ts_us, kind="stable")
+    ts = ts_us[order]
+    vals = values[order]
+    right = np.searchsorted(ts, grid_ts, side="left")
+    exact = (right < len(ts)) & (ts[np.minimum(right, len(ts) - 1)] == grid_ts)
+    right = np.clip(right, 1, len(ts) - 1)
+    left = right - 1
+    t0, t1 = ts[left], ts[right]
+    valid = ((grid_ts >= t0) & (grid_ts <= t1) & (t1 - t0 <= max_gap_us)) | exact
+    if method == "nearest":
+        pick = np.where(grid_ts - t0 <= t1 - grid_ts, left, right)
+        out[:] = vals[pick]
+    else:
+        span = np.maximum(t1 - t0, 1)
+        w = ((grid_ts - t0) / span).astype(np.float32)[:, None]
+        out[:] = vals[left] * (1 - w) + vals[right] * w
+    out[exact] = vals[np.searchsorted(ts, grid_ts[exact])]
+    out[~valid] = 0
+    return out, valid
+
+
+def resample_uniform(nodes, rate_hz, method="linear", max_gap_us=DEFAULT_MAX_GAP_US, start_us=None, stop_us=None):
+    """Put {node_id: (ts_us, values (n, 6))} on one grid.
+
+    The grid spans the union of the nodes unless ``start_us``/``stop_us`` are
+    given.  Returns a Grid: ts_us (m,), values (m, nodes, 6) float32 and valid
+    (m, nodes).
+    """
+    node_ids = list(nodes)
+    spans = [(ts.min(), ts.max()) for ts, _ in nodes.values() if len(ts)]
+    if not spans:
+        return Grid(np.empty(0, dtype=np.int64), np.zeros((0, len(node_ids), 6), dtype=np.float32),
+                    np.zeros((0, len(node_ids)), dtype=bool), node_ids)
+    start = min(s for s, _ in spans) if start_us is None else start_us
+    stop = max(e for _, e in spans) if stop_us is None else stop_us
+    grid_ts = grid_points(start, stop, rate_hz)
+    values = np.zeros((len(grid_ts), len(node_ids), 6), dtype=np.float32)
+    valid = np.zeros((len(grid_ts), len(node_ids)), dtype=bool)
+    for j, node_id in enumerate(node_ids):
+        ts, vals = nodes[node_id]
+        values[:, j], valid[:, j] = interpolate(np.asarray(ts, dtype=np.int64), np.asarray(vals, dtype=np.float32),
+                                                grid_ts, method, max_gap_us)
+    return Grid(grid_ts, values, valid, node_ids)
+
+
+def grid_samples(grid_ts, values, valid, node_indices):
+    """SAMPLE_DTYPE rows of the valid grid points, in time order (node indices per grid column)."""
+    rows, cols = np.nonzero(valid)
+    out = np.empty(len(rows), dtype=SAMPLE_DTYPE)
+    out["node"] = np.asarray(node_indices, dtype=np.uint16)[cols]
+    out["ts_us"] = np.asarray(grid_ts)[rows]
+    for i, name in enumerate(SAMPLE_FIELDS):
+        out[name] = values[rows, cols, i]
+    return out
+
+
+def write_grid_csv(path, grid):
+    """One row per grid point: Timestamp_us, then <node>_<channel> columns (empty where invalid)."""
+    header = ["Timestamp_us"] + [f"{node_id}_{name}" for node_id in grid.node_ids for name in SAMPLE_FIELDS]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(header) + "\n")
+        for ts, row, ok in zip(grid.ts_us.tolist(), grid.values, grid.valid):
+            cells = [str(ts)]
+            for values, node_ok in zip(row.tolist(), ok.tolist()):
+                cells.extend(f"{v:.3f}" for v in values) if node_ok else cells.extend([""] * len(values))
+            f.write(",".join(cells) + "\n")
+
+
+class StreamingResampler:
+    """Engine subscriber that emits grid rows once every live node has passed them.
+
+        resampler = StreamingResampler(engine.node_index, 50, on_frames)
+        engine.subscribe(resampler.on_batch)
+
+    ``on_frames(grid_ts, values, valid, node_ids)`` gets blocks of grid rows
+    with the same shapes as a Grid.  The watermark is the oldest latest
+    timestamp among live nodes.  A node that is STALE_NODE_US behind the
+    newest one stops holding the grid back, and its rows are marked invalid.
+    Subscribers run on the reader thread, so ``on_frames`` should be quick.
+    """
+
+    def __init__(self, node_index, rate_hz, on_frames, method="linear", max_gap_us=DEFAULT_MAX_GAP_US):
+        self.node_index = node_index
+        self.rate_hz = rate_hz
+        self.period_us = 1e6 / rate_hz
+        self.on_frames = on_frames
+        self.method = method
+        self.max_gap_us = max_gap_us
+        self._pending = {}  # node index -> (ts_us, values) not yet fully used
+        self._next_us = None  # First grid point not emitted yet
+        self.rows_emitted = 0
+
+    def on_batch(self, batch):
+        samples = batch.samples
+        if not len(samples):
+            return
+        nodes = samples["node"]
+        for idx in np.unique(nodes).tolist():
+            rows = samples[nodes == idx]
+            values = np.column_stack([rows[name] for name in SAMPLE_FIELDS])
+            ts = rows["ts_us"].astype(np.int64)
+            if idx in self._pending:
+                old_ts, old_values = self._pending[idx]
+                ts, values = np.concatenate((old_ts, ts)), np.concatenate((old_values, values))
+            self._pending[idx] = (ts, values)
+        self._emit()
+
+    def _emit(self):
+        latest = {idx: ts[-1] for idx, (ts, _) in self._pending.items() if len(ts)}
+        if not latest:
+            return
+        newest = max(latest.values())
+        live = [idx for idx, last in latest.items() if newest - last <= STALE_NODE_US]
+        watermark = min(latest[idx] for idx in live)
+        if self._next_us is None:
+            self._next_us = min(ts[0] for ts, _ in self._pending.values() if len(ts))
+        grid_ts = grid_points(self._next_us, watermark, self.rate_hz)
+        if not len(grid_ts):
+            return
+        order = sorted(self._pending)
+        values = np.zeros((len(grid_ts), len(order), 6), dtype=np.float32)
+        valid = np.zeros((len(grid_ts), len(order)), dtype=bool)
+        for j, idx in enumerate(order):
+            ts, vals = self._pending[idx]
+            values[:, j], valid[:, j] = interpolate(ts, vals, grid_ts, self.method, self.max_gap_us)
+            # Keep the last sample at or before the watermark for the next interpolation
+            keep_from = max(int(np.searchsorted(ts, grid_ts[-1], side="right")) - 1, 0)
+            self._pending[idx] = (ts[keep_from:], vals[keep_from:])
+        self._next_us = grid_ts[-1] + self.period_us
+        self.rows_emitted += len(grid_ts)
+        self.on_frames(grid_ts, values, valid, [self.node_index.name_of(idx) for idx in order])
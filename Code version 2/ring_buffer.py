@@ -0,0 +1,140 @@
+"""Preallocated per-node sample history.
+
+``SampleRingBuffer`` keeps the newest ``capacity`` samples of one node as a
+float32 (ax..gz) block plus an int64 timestamp column.  Every row is written
+twice, at ``pos`` and ``pos + capacity`` of arrays sized ``2 * capacity``,
+so the newest N samples in arrival order are always one contiguous slice:
+``last(n)`` returns views, never copies, and append stays O(1).
+
+``SampleStore`` holds one buffer per node and appends parsed SAMPLE_DTYPE
+batches.  The ingest engine fills it on the reader thread; plots, stats and
+live analysis read views from it.  Readers are not locked out, so a view of
+nearly the whole capacity can see its oldest rows overwritten while it is
+in use; windows well below the capacity are not affected.
+"""
+import threading
+
+import numpy as np
+
+from sensor_parser import SAMPLE_FIELDS
+
+CHANNELS = len(SAMPLE_FIELDS)
+DEFAULT_CAPACITY = 30000  # 5 min at 100 Hz, ~1.9 MB per node
+
+
+class SampleRingBuffer:
+    """Newest ``capacity`` samples of one node: ts_us (int64) and (n, 6) float32."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, channels=CHANNELS):
+        self.capacity = int(capacity)
+        self.values = np.zeros((2 * self.capacity, channels), dtype=np.float32)
+        self.timestamps = np.zeros(2 * self.capacity, dtype=np.int64)
+        self.pos = 0  # Next row to write (0 <= pos < capacity)
+        self.count = 0  # Valid rows (<= capacity)
+        self.total = 0  # Rows appended since the last clear
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.timestamps.nbytes
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+        self.total = 0
+
+    def append(self, ts_us, values):
+        pos, cap = self.pos, self.capacity
+        self.values[pos] = values
+        self.values[pos + cap] = values
+        self.timestamps[pos] = ts_us
+        self.timestamps[pos + cap] = ts_us
+        self.pos = (pos + 1) % cap
+        self.count = min(self.count + 1, cap)
+        self.total += 1
+
+    def extend(self, ts_us, values):
+        """Append k rows: ``ts_us`` (k,) and ``values`` (k, channels)."""
+        k = len(values)
+        if not k:
+            return
+        cap = self.capacity
+        self.total += k
+        if k > cap:
+            ts_us, values = ts_us[-cap:], values[-cap:]
+            k = cap
+        pos = self.pos
+        first = min(k, cap - pos)
+        rest = k - first
+        for arr, block in ((self.values, values), (self.timestamps, ts_us)):
+            arr[pos:pos + first] = block[:first]
+            arr[pos + cap:pos + cap + first] = block[:first]
+            if rest:
+                arr[:rest] = block[first:]
+                arr[cap:cap + rest] = block[first:]
+        self.pos = (pos + k) % cap
+        self.count = min(self.count + k, cap)
+
+    def last(self, n=None):
+        """Views of the newest ``n`` (default: all valid) rows, oldest first: (ts_us, values)."""
+        n = self.count if n is None else min(n, self.count)
+        end = self.pos + self.capacity
+        return self.timestamps[end - n:end], self.values[end - n:end]
+
+    def last_values(self, n=None):
+        return self.last(n)[1]
+
+
+class SampleStore:
+    """One SampleRingBuffer per node ID, filled from SAMPLE_DTYPE batches."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()  # Guards the dict, not the buffers' contents
+
+    def __contains__(self, node_id):
+        return node_id in self._buffers
+
+    def get(self, node_id):
+        return self._buffers.get(node_id)
+
+    def buffer_for(self, node_id):
+        buffer = self._buffers.get(node_id)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.setdefault(node_id, SampleRingBuffer(self.capacity))
+        return buffer
+
+    def node_ids(self):
+        with self._lock:
+            return list(self._buffers)
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def last_values(self, node_id, n=None):
+        """Newest ``n`` (n, 6) rows of ``node_id`` as a view, or None if the node is unknown."""
+        buffer = self._buffers.get(node_id)
+        if buffer is None or not buffer.count:
+            return None
+        return buffer.last_values(n)
+
+    def extend_samples(self, samples, node_index):
+        """Append a SAMPLE_DTYPE array (any mix of nodes) to the per-node buffers."""
+        if not len(samples):
+            return
+        values = np.column_stack([samples[name] for name in SAMPLE_FIELDS])
+        nodes = samples["node"]
+        ts_us = samples["ts_us"]
+        for idx in np.unique(nodes).tolist():
+            mask = nodes == idx
+            self.buffer_for(node_index.name_of(idx)).extend(ts_us[mask], values[mask])
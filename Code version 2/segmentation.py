@@ -0,0 +1,309 @@
+"""Leg-press rep segmentation, with the peak rules of Visualization/script.js.
+
+``findPeaks`` in the web viewer works on a smoothed signal (moving average,
+``movingAverage``).  A candidate is a strict local maximum above
+``threshold``.  Candidates are taken from the highest down; each accepted
+peak suppresses the indices ``[peak - distance, peak + distance)``, and a
+suppressed candidate is skipped.
+
+``find_peaks`` returns the same indices.  Candidates are found with one
+vectorized comparison, and the ordering is one stable argsort (ties keep
+index order, as in JS).  Suppression runs in rounds over the remaining
+candidates.  A candidate that outranks every candidate that could
+suppress it is accepted, whatever happens to the others: it is the same
+peak the greedy loop would accept.  A sparse-table range minimum over the
+ranks finds all such candidates at once, and the candidates they suppress
+are dropped.  Each round costs O(k log k) for k candidates.  A few rounds
+settle real signals.  After MAX_ROUNDS (long chains of ever-lower peaks),
+the rest goes through the greedy loop.  That loop keeps accepted peaks in
+``distance``-wide buckets: accepted peaks are at least ``distance`` apart,
+so a candidate is checked against three buckets.  The viewer instead marks
+``2 * distance`` entries of a suppressed array per peak.
+``find_peaks_reference`` is a line-by-line port of the JS, kept for the
+benchmark.
+
+A rep runs from the valley (minimum of the smoothed signal) before its
+peak to the valley after it, so consecutive reps share a boundary.  Before
+the first peak and after the last, the valley is searched within
+``distance`` samples.
+
+Nodes are segmented separately: in a recording with several nodes, their
+samples are interleaved and one node's rep would otherwise cut through the
+others.  ``segment_recording`` then returns the samples grouped by node
+(each node's rows in file order), so every rep's ``start..end`` is a run
+of one node's rows, and ``reps["node"]`` tells which.
+
+    python segmentation.py run ../data --out reps.csv
+    python segmentation.py bench ../data
+"""
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from analysis_cache import AnalysisCache, magnitude, moving_average
+from recording_loader import iter_recordings
+
+# Viewer defaults (Visualization/index.html)
+DEFAULT_SIGNAL = "AccMagnitude"
+DEFAULT_WINDOW = 11
+DEFAULT_THRESHOLD = 1.0
+DEFAULT_DISTANCE = 50
+
+# Signal names of the viewer's selector -> SAMPLE_DTYPE field (or magnitude column)
+SIGNALS = {
+    "AccMagnitude": 0, "GyroMagnitude": 1,
+    "AccX": "ax", "AccY": "ay", "AccZ": "az", "GyroX": "gx", "GyroY": "gy", "GyroZ": "gz",
+}
+SEGMENTATION_VERSION = 1  # Part of the cache key of the "segment" stage
+MAX_ROUNDS = 16  # Vectorized suppression rounds before the rest goes through the bucket loop
+
+
+def _range_min(values, lo, hi):
+    """min(values[lo[i]:hi[i]]) for every i (all ranges non-empty), from a sparse table."""
+    table = [values]
+    while 2 ** len(table) <= len(values):
+        prev, span = table[-1], 2 ** (len(table) - 1)
+        table.append(np.minimum(prev[:-span], prev[span:]))
+    levels = np.log2(hi - lo).astype(np.int64)
+    out = np.empty(len(lo), dtype=values.dtype)
+    for level in np.unique(levels).tolist():
+        mask = levels == level
+        row = table[level]
+        out[mask] = np.minimum(row[lo[mask]], row[hi[mask] - 2 ** level])
+    return out
+
+
+def _suppress_greedy(pos, rank, distance, size, accepted):
+    """The JS loop over candidates ``pos`` in ``rank`` order, after the peaks already ``accepted`` ({pos: rank})."""
+    # Accepted peaks are at least ``distance`` apart, so bucket b holds at most one:
+    # the accepted peak in [(b - 1) * distance, b * distance), if any
+    buckets = [-1] * (size // distance + 3)
+    for p in accepted:
+        buckets[p // distance + 1] = p
+    for j, r in sorted(zip(pos, rank), key=lambda c: c[1]):
+        b = j // distance + 1
+        # j is suppressed by a higher-ranked accepted p with p - distance <= j < p + distance
+        if any(p >= 0 and j - distance < p <= j + distance and accepted[p] < r
+               for p in (buckets[b - 1], buckets[b], buckets[b + 1])):
+            continue
+        buckets[b] = j
+        accepted[j] = r
+
+
+def find_peaks(signal, threshold=DEFAULT_THRESHOLD, distance=DEFAULT_DISTANCE):
+    """Indices of the peaks findPeaks (script.js) would return, ascending."""
+    x = np.asarray(signal, dtype=np.float64)
+    if len(x) < 3:
+        return np.empty(0, dtype=np.int64)
+    inner = x[1:-1]
+    pos = np.flatnonzero((inner > threshold) & (inner > x[:-2]) & (inner > x[2:])) + 1
+    if distance <= 0 or len(pos) < 2:
+        return pos  # The JS suppresses nothing when distance <= 0
+    rank = np.empty(len(pos), dtype=np.int64)
+    rank[np.argsort(-x[pos], kind="stable")] = np.arange(len(pos))
+    accepted = {}  # Peak index -> rank
+    for _ in range(MAX_ROUNDS):
+        # Accept every candidate that outranks all others that could suppress it...
+        lo = np.searchsorted(pos, pos - distance, side="right")
+        hi = np.searchsorted(pos, pos + distance, side="right")
+        won = rank == _range_min(rank, lo, hi)
+        winners, winner_ranks = pos[won], rank[won]
+        accepted.update(zip(winners.tolist(), winner_ranks.tolist()))
+        # ...then drop the candidates suppressed by a higher-ranked winner (a lower-ranked winner
+        # exactly ``distance`` after a candidate does not suppress it: the range is half-open)
+        lo = np.searchsorted(winners, pos - distance, side="right")
+        hi = np.searchsorted(winners, pos + distance, side="right")
+        near = hi > lo
+        suppressed = np.zeros(len(pos), dtype=bool)
+        suppressed[near] = _range_min(winner_ranks, lo[near], hi[near]) < rank[near]
+        keep = ~(won | suppressed)
+        pos, rank = pos[keep], rank[keep]
+        if not len(pos):
+            break
+    else:
+        _suppress_greedy(pos.tolist(), rank.tolist(), distance, len(x), accepted)
+    return np.array(sorted(accepted), dtype=np.int64)
+
+
+def find_peaks_reference(data, threshold=DEFAULT_THRESHOLD, distance=DEFAULT_DISTANCE):
+    """Port of findPeaks in Visualization/script.js (plain lists, O(peaks x distance))."""
+    peaks = []
+    for i in range(1, len(data) - 1):
+        if data[i] > threshold and data[i] > data[i - 1] and data[i] > data[i + 1]:
+            peaks.append((i, data[i]))
+    if not peaks:
+        return []
+    peaks.sort(key=lambda peak: -peak[1])
+    final_peaks = []
+    suppressed = [False] * len(data)
+    for index, _ in peaks:
+        if not suppressed[index]:
+            final_peaks.append(index)
+            for i in range(max(0, index - distance), min(len(data), index + distance)):
+                suppressed[i] = True
+    final_peaks.sort()
+    return final_peaks
+
+
+def rep_bounds(signal, peaks, distance=DEFAULT_DISTANCE):
+    """(starts, ends): the valley before and after each peak."""
+    x = np.asarray(signal)
+    peaks = np.asarray(peaks, dtype=np.int64)
+    if not len(peaks):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    edges = np.concatenate(([max(peaks[0] - distance, 0)], peaks, [min(peaks[-1] + distance, len(x) - 1)]))
+    valleys = np.array([lo + int(np.argmin(x[lo:hi + 1])) for lo, hi in zip(edges[:-1].tolist(), edges[1:].tolist())],
+                       dtype=np.int64)
+    return valleys[:-1], valleys[1:]
+
+
+def select_signal(samples, signal=DEFAULT_SIGNAL):
+    """The raw ``signal`` (a SIGNALS key) of a SAMPLE_DTYPE array, float32."""
+    column = SIGNALS[signal]
+    if isinstance(column, int):
+        return np.ascontiguousarray(magnitude(samples)[:, column])
+    return samples[column].astype(np.float32)
+
+
+def segment_signal(smoothed, threshold=DEFAULT_THRESHOLD, distance=DEFAULT_DISTANCE):
+    """{"start", "peak", "end"}: int64 sample indices, one entry per rep."""
+    peaks = find_peaks(smoothed, threshold, distance)
+    starts, ends = rep_bounds(smoothed, peaks, distance)
+    return {"start": starts, "peak": peaks, "end": ends}
+
+
+def node_rows(samples, node):
+    """The rows of one node (a node index) of a SAMPLE_DTYPE array."""
+    return samples[samples["node"] == node]
+
+
+def _segment_stages(cache, source, signal, window, threshold, distance):
+    raw = cache.stage(source, "signal", select_signal, signal=signal)
+    smoothed = cache.stage(raw, "smooth", moving_average, window=window)
+    reps = cache.stage(smoothed, "segment", segment_signal, version=SEGMENTATION_VERSION,
+                       threshold=threshold, distance=distance)
+    return smoothed.value, reps.value
+
+
+def segment_recording(path, cache=None, signal=DEFAULT_SIGNAL, window=DEFAULT_WINDOW,
+                      threshold=DEFAULT_THRESHOLD, distance=DEFAULT_DISTANCE):
+    """(samples grouped by node, smoothed signal, reps) of one recording, each stage through ``cache``.
+
+    ``reps`` has "start", "peak", "end" (indices into the returned samples) and "node".
+    """
+    cache = cache or AnalysisCache()
+    rec = cache.source(path)
+    params = (signal, window, threshold, distance)
+    nodes = np.unique(rec.value["node"]).tolist()
+    if len(nodes) <= 1:
+        smoothed, reps = _segment_stages(cache, rec, *params)
+        return rec.value, smoothed, dict(reps, node=np.full(len(reps["peak"]), nodes[0] if nodes else 0))
+    parts, smoothed, reps = [], [], []
+    offset = 0
+    for idx in nodes:
+        part = cache.stage(rec, "node", node_rows, node=idx)
+        node_smoothed, node_reps = _segment_stages(cache, part, *params)
+        parts.append(part.value)
+        smoothed.append(node_smoothed)
+        reps.append({name: node_reps[name] + offset for name in ("start", "peak", "end")})
+        reps[-1]["node"] = np.full(len(node_reps["peak"]), idx)
+        offset += len(part.value)
+    return (np.concatenate(parts), np.concatenate(smoothed),
+            {name: np.concatenate([r[name] for r in reps]).astype(np.int64) for name in ("start", "peak", "end", "node")})
+
+
+# --- Command line ---
+def _params(args):
+    return {"signal": args.signal, "window": args.window, "threshold": args.threshold, "distance": args.distance}
+
+
+def _cmd_run(args):
+    cache = AnalysisCache(args.cache) if args.cache else AnalysisCache()
+    rows = []
+    total = 0
+    started = time.perf_counter()
+    for path in iter_recordings(args.path):
+        samples, _, reps = segment_recording(path, cache, **_params(args))
+        ts_us = samples["ts_us"]
+        n = len(reps["peak"])
+        total += n
+        print(f"{os.path.relpath(path, args.path):<60}{len(samples):>7} rows {n:>4} reps")
+        for i, (node, start, peak, end) in enumerate(zip(reps["node"].tolist(), reps["start"].tolist(),
+                                                         reps["peak"].tolist(), reps["end"].tolist())):
+            rows.append((os.path.relpath(path, args.path).replace(os.sep, "/"), i + 1, node, start, peak, end,
+                         int(ts_us[start]), int(ts_us[peak]), int(ts_us[end])))
+    print(f"{total} reps in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({cache.hits} cache hits, {cache.misses} misses)")
+    if args.out:
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "rep", "node", "start", "peak", "end", "start_us", "peak_us", "end_us"])
+            writer.writerows(rows)
+
+
+def _best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def _cmd_bench(args):
+    cache = AnalysisCache(args.cache) if args.cache else AnalysisCache()
+    signals = []
+    for path in iter_recordings(args.path):
+        _, smoothed, _ = segment_recording(path, cache, **_params(args))
+        signals.append(smoothed)
+    lists = [s.tolist() for s in signals]
+    samples = sum(len(s) for s in signals)
+
+    ref_s, ref = _best_of(args.repeat, lambda: [find_peaks_reference(s, args.threshold, args.distance) for s in lists])
+    fast_s, fast = _best_of(args.repeat, lambda: [find_peaks(s, args.threshold, args.distance) for s in signals])
+    differ = sum(a != b.tolist() for a, b in zip(ref, fast))
+    print(f"data: {len(signals)} signals, {samples:,} samples, {sum(len(p) for p in ref)} peaks, "
+          f"threshold {args.threshold}, distance {args.distance}")
+    print(f"  JS-equivalent reference {ref_s * 1000:8.1f} ms")
+    print(f"  find_peaks              {fast_s * 1000:8.1f} ms  ({ref_s / fast_s:.1f}x), {differ} signal(s) differ")
+
+    # Long noisy signal: many candidates, wide suppression
+    rng = np.random.default_rng(0)
+    n = args.synthetic
+    t = np.arange(n)
+    long_signal = moving_average(1.0 + np.sin(2 * np.pi * t / 400) + rng.normal(0, 0.3, n), 5)
+    for distance in (50, 500, 5000):
+        data = long_signal.tolist()
+        ref_s, ref = _best_of(1, lambda: find_peaks_reference(data, 1.0, distance))
+        fast_s, fast = _best_of(args.repeat, lambda: find_peaks(long_signal, 1.0, distance))
+        print(f"synthetic {n:,} samples, distance {distance:>5}: reference {ref_s * 1000:8.1f} ms, "
+              f"find_peaks {fast_s * 1000:7.1f} ms ({ref_s / fast_s:.0f}x), {len(fast)} peaks, "
+              f"{'same' if ref == fast.tolist() else 'DIFFERENT'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leg-press rep segmentation (findPeaks of the web viewer)")
+    parser.add_argument("--cache", default=None, help="analysis cache directory (default: data/.cache)")
+    parser.add_argument("--signal", choices=sorted(SIGNALS), default=DEFAULT_SIGNAL)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="moving average window")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--distance", type=int, default=DEFAULT_DISTANCE, help="minimum samples between peaks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run", help="segment every recording under a path")
+    p.add_argument("path")
+    p.add_argument("--out", help="CSV of reps (path, rep, start/peak/end index and timestamp)")
+    p.set_defaults(func=_cmd_run)
+    p = sub.add_parser("bench", help="compare with the JS-equivalent reference")
+    p.add_argument("path")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--synthetic", type=int, default=1_000_000, help="samples of the synthetic signal")
+    p.set_defaults(func=_cmd_bench)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
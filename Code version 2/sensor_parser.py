@@ -0,0 +1,379 @@
+"""Parsers for the lines printed by the ESP32 bridge.
+
+The first half of the module holds the timestamp helpers and the original
+per-line parsers used by EspServer.py; the parsers are kept unchanged as the
+reference implementation.  The second half is the fast path: ``parse_line``
+classifies a line once and decodes the fixed firmware shapes
+(``{"id","ts","ax".."gz"}`` JSON and ``DATA:`` text) with one precompiled
+regex instead of ``json.loads``, and ``parse_lines_to_array`` decodes a whole
+batch into a NumPy structured array.  Anything the fast path does not
+recognise falls back to the reference code, so both always agree.
+
+Binary frames (binary_frames.py) arrive from the reader as ``bytes`` items
+among the text lines and are decoded by ``parse_lines_to_array`` as well.
+"""
+import json
+import re
+
+import numpy as np
+
+from binary_frames import NODE_NAME_FORMAT, decode_frames, frame_values
+
+# --- Timestamp Conversion Function ---
+def format_microseconds_to_mmss_us(microseconds):
+    if not isinstance(microseconds, (int, float)) or microseconds < 0:
+        return "Invalid_TS"
+
+    total_seconds = int(microseconds // 1_000_000)
+    us_part = int(microseconds % 1_000_000)
+    minutes = (total_seconds // 60) % 60
+    seconds = total_seconds % 60
+
+    return f"{minutes:02}:{seconds:02}:{us_part:06}"
+
+# This function is no longer used directly but can be useful for re-parsing
+def parse_mmss_us_to_microseconds(timestamp_str):
+    try:
+        parts = timestamp_str.split(':')
+        if len(parts) == 3:
+            minutes = int(parts[0])
+            seconds = int(parts[1])
+            microseconds_part = int(parts[2])
+            total_microseconds = (minutes * 60 * 1_000_000) + (seconds * 1_000_000) + microseconds_part
+            return total_microseconds
+    except ValueError:
+        pass
+    return 0
+
+# --- Reference parsers (original implementation) ---
+def parse_sensor_data(line):
+    # --- Case 1: Dữ liệu dạng JSON (cũ)
+    json_str_start_idx = line.find("Processed UDP from Queue: ")
+    if json_str_start_idx != -1:
+        json_candidate = line[json_str_start_idx + len("Processed UDP from Queue: "):].strip()
+    else:
+        json_candidate = line.strip()
+
+    if json_candidate.startswith("{") and json_candidate.endswith("}"):
+        try:
+            data = json.loads(json_candidate)
+            required_keys = ["id", "ax", "ay", "az", "gx", "gy", "gz", "ts"]
+            if all(k in data for k in required_keys):
+                return {
+                    "id": data["id"],
+                    "ax": float(data["ax"]),
+                    "ay": float(data["ay"]),
+                    "az": float(data["az"]),
+                    "gx": float(data["gx"]),
+                    "gy": float(data["gy"]),
+                    "gz": float(data["gz"]),
+                    "ts": int(data["ts"]) * 1000  # milliseconds -> microseconds
+                }
+        except (json.JSONDecodeError, ValueError, TypeError):
+            return None
+
+    # --- Case 2: Dữ liệu dạng text phân tách bằng `:`
+    if line.startswith("DATA:"):
+        try:
+            parts = line.strip().split(":")
+            if len(parts) >= 10:
+                return {
+                    "id": parts[1],
+                    "ts": int(parts[3]) * 1000,  # convert ms -> µs
+                    "ax": float(parts[4]),
+                    "ay": float(parts[5]),
+                    "az": float(parts[6]),
+                    "gx": float(parts[7]),
+                    "gy": float(parts[8]),
+                    "gz": float(parts[9])
+                }
+        except (ValueError, IndexError):
+            return None
+
+    return None
+
+
+def parse_server_uptime(line):
+    if "Server Uptime:" in line and "seconds" in line:
+        try:
+            match = re.search(r'Server Uptime: (\d+) seconds', line)
+            if match:
+                return int(match.group(1))
+        except ValueError:
+            pass
+    return None
+
+def is_separator_line(line):
+    return line.strip() == "--------------------------------------------------" or \
+           line.strip() == "-------------------------------------------------"
+
+
+def parse_handshake_data(line):
+    """
+    Trích xuất node_id từ các thông điệp bắt tay (handshake).
+    Có thể là:
+    - "Received HELLO from Node ID: Sensor_1"
+    - "Sent WELCOME to IP:192.168.4.2 -> WELCOME:Sensor_1:..."
+    """
+    if "Received HELLO from Node ID:" in line:
+        try:
+            return line.split("Received HELLO from Node ID:")[1].strip()
+        except IndexError:
+            return None
+
+    elif "WELCOME:" in line:
+        try:
+            parts = line.split("WELCOME:")[1].split(":")
+            if parts:
+                return parts[0].strip()  # Node ID ở đầu
+        except IndexError:
+            return None
+
+    return None
+
+
+def parse_wifi_client_count(line):
+    """
+    Trích xuất số lượng client WiFi từ chuỗi debug ESP32.
+    Ví dụ chuỗi: "DEBUG: WiFi SoftAP Connected Clients (WiFi layer): --- 3 clients"
+    """
+    keyword = "DEBUG: WiFi SoftAP Connected Clients"
+    if keyword in line:
+        try:
+            # Lấy phần sau dấu ":" cuối cùng, tách lấy số đầu tiên
+            tail = line.split(":")[-1]
+            count_str = tail.strip().split()[0]
+            return int(count_str)
+        except (ValueError, IndexError):
+            return None
+    return None
+
+
+# --- Fast path ---
+# Line kinds returned by parse_line()
+LINE_SAMPLE = 0
+LINE_HANDSHAKE = 1
+LINE_WIFI_CLIENTS = 2
+LINE_UPTIME = 3
+LINE_SEPARATOR = 4
+LINE_OTHER = 5
+
+SAMPLE_FIELDS = ("ax", "ay", "az", "gx", "gy", "gz")
+
+# One row per sample; node IDs are mapped to small integers by a NodeIndex.
+# Channels are float64 so the recorder's "%.2f" gives the same text as
+# formatting the parsed Python floats (float32 rounds e.g. 1234.565 down).
+SAMPLE_DTYPE = np.dtype([
+    ("node", np.uint16),
+    ("ts_us", np.int64),
+    ("ax", np.float64), ("ay", np.float64), ("az", np.float64),
+    ("gx", np.float64), ("gy", np.float64), ("gz", np.float64),
+])
+
+# The firmware prints every channel with "%.3f" and the timestamp as an
+# unsigned long.  The regexes only accept exactly that layout (a strict subset
+# of what json.loads / float() accept); anything else uses the reference path.
+_FIXED_FLOAT = r"(-?(?:0|[1-9]\d*)\.\d+)"
+_JSON_SAMPLE_RE = re.compile(
+    r'^\{"id":"([^"\\\x00-\x1f]*)","ts":(0|[1-9]\d*)'
+    + "".join(f',"{name}":{_FIXED_FLOAT}' for name in SAMPLE_FIELDS)
+    + r"\}$",
+    re.MULTILINE,
+)
+# DATA:<NodeID>:<NodeType>:<Timestamp_ms>:<AccX>:<AccY>:<AccZ>:<GyroX>:<GyroY>:<GyroZ>[:<TempC>...]
+_DATA_SAMPLE_RE = re.compile(
+    r"^DATA:([^:\n]*):[^:\n]*:(\d+)"
+    + "".join(f":{_FIXED_FLOAT}" for _ in SAMPLE_FIELDS)
+    + r"(?::[^\n]*)?$",
+    re.MULTILINE,
+)
+
+
+class NodeIndex:
+    """Maps node ID strings to the small integers stored in sample arrays."""
+
+    def __init__(self):
+        self._index = {}
+        self.names = []
+
+    def index_of(self, node_id):
+        idx = self._index.get(node_id)
+        if idx is None:
+            idx = len(self.names)
+            self._index[node_id] = idx
+            self.names.append(node_id)
+        return idx
+
+    def name_of(self, idx):
+        return self.names[idx]
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _sample_from_groups(groups):
+    node_id, ts, ax, ay, az, gx, gy, gz = groups
+    return (node_id, int(ts) * 1000, float(ax), float(ay), float(az), float(gx), float(gy), float(gz))
+
+
+def _sample_from_dict(data):
+    return (data["id"], data["ts"], data["ax"], data["ay"], data["az"], data["gx"], data["gy"], data["gz"])
+
+
+def parse_sample(line):
+    """Decode a sample line into ``(id, ts_us, ax, ay, az, gx, gy, gz)`` or return None.
+
+    Same results as ``parse_sensor_data`` without building a dict; lines
+    that are not in the exact firmware layout go through the reference parser.
+    """
+    first = line[:1]
+    if first == "{":
+        match = _JSON_SAMPLE_RE.match(line)
+    elif first == "D":
+        match = _DATA_SAMPLE_RE.match(line)
+    else:
+        match = None
+    if match is not None:
+        return _sample_from_groups(match.groups())
+    data = parse_sensor_data(line)
+    return _sample_from_dict(data) if data else None
+
+
+def parse_line(line):
+    """Classify ``line`` once and decode it.
+
+    Returns ``(kind, value)``: a sample tuple for LINE_SAMPLE, the node ID for
+    LINE_HANDSHAKE, an int for LINE_WIFI_CLIENTS / LINE_UPTIME, None otherwise.
+    """
+    first = line[:1]
+    if first == "{":
+        match = _JSON_SAMPLE_RE.match(line)
+        if match is not None:
+            return LINE_SAMPLE, _sample_from_groups(match.groups())
+    elif first == "D":
+        match = _DATA_SAMPLE_RE.match(line)
+        if match is not None:
+            return LINE_SAMPLE, _sample_from_groups(match.groups())
+    elif first == "-" and is_separator_line(line):
+        return LINE_SEPARATOR, None
+
+    # Rare lines: handshake and debug chatter, or samples in a non-canonical layout
+    node_id = parse_handshake_data(line)
+    if node_id:
+        return LINE_HANDSHAKE, node_id
+    count = parse_wifi_client_count(line)
+    if count is not None:
+        return LINE_WIFI_CLIENTS, count
+    uptime = parse_server_uptime(line)
+    if uptime is not None:
+        return LINE_UPTIME, uptime
+    data = parse_sensor_data(line)
+    if data:
+        return LINE_SAMPLE, _sample_from_dict(data)
+    return LINE_OTHER, None
+
+
+# Batch variants: a trailing catch-all group captures lines that are not in
+# the canonical layout, so one findall() call yields exactly one row per line
+_JSON_BATCH_RE = re.compile(_JSON_SAMPLE_RE.pattern + r"|^(.*)$", re.MULTILINE)
+_DATA_BATCH_RE = re.compile(_DATA_SAMPLE_RE.pattern + r"|^(.*)$", re.MULTILINE)
+
+
+def _matches_to_array(matches, node_index):
+    out = np.empty(len(matches), dtype=SAMPLE_DTYPE)
+    if not matches:
+        return out
+    columns = list(zip(*matches))
+    lookup = {name: node_index.index_of(name) for name in set(columns[0])}
+    out["node"] = np.fromiter(map(lookup.__getitem__, columns[0]), dtype=np.uint16, count=len(matches))
+    out["ts_us"] = np.array(columns[1], dtype=np.int64) * 1000
+    for name, column in zip(SAMPLE_FIELDS, columns[2:8]):
+        out[name] = np.array(column, dtype=np.float64)
+    return out
+
+
+def _tuples_to_array(samples, node_index):
+    return np.array(
+        [(node_index.index_of(s[0]),) + s[1:] for s in samples],
+        dtype=SAMPLE_DTYPE,
+    ).reshape(len(samples))
+
+
+def _frames_to_array(frames, node_index):
+    out = np.empty(len(frames), dtype=SAMPLE_DTYPE)
+    numbers = frames["node"]
+    lookup = np.zeros(256, dtype=np.uint16)
+    for number in np.unique(numbers).tolist():
+        lookup[number] = node_index.index_of(NODE_NAME_FORMAT.format(number))
+    out["node"] = lookup[numbers]
+    out["ts_us"] = frames["ts_ms"].astype(np.int64) * 1000
+    values = frame_values(frames)
+    for i, name in enumerate(SAMPLE_FIELDS):
+        out[name] = values[:, i]
+    return out
+
+
+def parse_lines_to_array(lines, node_index):
+    """Parse a batch of lines into a SAMPLE_DTYPE array, keeping line order.
+
+    Returns ``(samples, other_lines)`` where ``other_lines`` are the lines
+    that are not samples (handshakes, debug output, garbage) for the caller
+    to handle with ``parse_line``.  ``bytes`` items are binary frame bodies;
+    frames that fail their checks are reported as one "Invalid binary frame"
+    line each.
+    """
+    pending, pending_pos = lines, range(len(lines))
+    parts, positions = [], []
+    bad_frames = 0
+    if bytes in map(type, lines):
+        frame_pos = [i for i, line in enumerate(lines) if line.__class__ is bytes]
+        frame_set = set(frame_pos)
+        pending_pos = [i for i in range(len(lines)) if i not in frame_set]
+        pending = [lines[i] for i in pending_pos]
+        frames, ok = decode_frames([lines[i] for i in frame_pos])
+        bad_frames = len(frame_pos) - len(frames)
+        if len(frames):
+            parts.append(_frames_to_array(frames, node_index))
+            positions.append(np.asarray(frame_pos)[ok] if bad_frames else frame_pos)
+    for regex in (_JSON_BATCH_RE, _DATA_BATCH_RE):
+        if not pending:
+            break
+        rows = regex.findall("\n".join(pending))
+        # The timestamp group is never empty for a canonical line
+        odd = [i for i, row in enumerate(rows) if not row[1]]
+        if not odd:
+            parts.append(_matches_to_array(rows, node_index))
+            positions.append(pending_pos)
+            pending = []
+            break
+        if len(odd) < len(rows):
+            odd_set = set(odd)
+            good = [i for i in range(len(rows)) if i not in odd_set]
+            parts.append(_matches_to_array([rows[i] for i in good], node_index))
+            positions.append([pending_pos[i] for i in good])
+        pending = [pending[i] for i in odd]
+        pending_pos = [pending_pos[i] for i in odd]
+
+    # Whatever is left is chatter or a sample outside the canonical layout
+    other_lines = []
+    samples, sample_pos = [], []
+    for pos, line in zip(pending_pos, pending):
+        sample = parse_sample(line)
+        if sample is None:
+            other_lines.append(line)
+        else:
+            samples.append(sample)
+            sample_pos.append(pos)
+    if samples:
+        parts.append(_tuples_to_array(samples, node_index))
+        positions.append(sample_pos)
+    other_lines.extend(["Invalid binary frame"] * bad_frames)
+
+    if not parts:
+        result = np.empty(0, dtype=SAMPLE_DTYPE)
+    elif len(parts) == 1:
+        result = parts[0]
+    else:
+        result = np.concatenate(parts)
+        result = result[np.argsort(np.concatenate(positions), kind="stable")]
+    return result, other_lines
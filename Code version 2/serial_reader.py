@@ -0,0 +1,106 @@
+"""Chunked line reader for the ESP32 serial bridge.
+
+Instead of one ``readline()`` per sample, the reader drains everything that is
+waiting on the port in a single ``read()``, splits it into lines itself and
+keeps the incomplete trailing line until the next read.  Complete lines are
+collected and handed to the consumer as one batch on a fixed cadence.
+
+When the stream carries binary sample frames (0x00-delimited, see
+binary_frames.py) the frame bodies are returned as ``bytes`` items among the
+text lines, in arrival order.
+"""
+import time
+
+from binary_frames import FRAME_DELIMITER, split_stream
+from latency import LATENCY
+
+# --- Reader configuration ---
+READ_CHUNK_MAX = 65536      # Upper bound for a single read() call (bytes)
+MAX_PARTIAL_BYTES = 4096    # A "line" longer than this without '\n' is garbage
+BATCH_INTERVAL_S = 0.02     # Hand a batch to the consumer every 20 ms
+
+
+class ChunkedLineReader:
+    """Reads whole chunks from a serial-like object and returns complete lines."""
+
+    def __init__(self, ser, encoding='utf-8', max_chunk=READ_CHUNK_MAX):
+        self.ser = ser
+        self.encoding = encoding
+        self.max_chunk = max_chunk
+        self._partial = b""
+        self.bytes_read = 0
+        self.lines_read = 0
+        self.partial_dropped = 0
+        self.frames_read = 0
+
+    def read_lines(self):
+        """Drain the port once and return the list of complete, non-empty lines.
+
+        When nothing is waiting, a single byte is requested so the call blocks
+        for at most the port timeout instead of spinning.
+        """
+        waiting = self.ser.in_waiting
+        chunk = self.ser.read(min(waiting, self.max_chunk) if waiting else 1)
+        if not chunk:
+            return []
+        self.bytes_read += len(chunk)
+        return self.feed(chunk)
+
+    def feed(self, chunk):
+        """Split ``chunk`` (bytes) into lines, keeping the trailing partial line."""
+        data = self._partial + chunk if self._partial else chunk
+        if FRAME_DELIMITER in data:
+            return self._feed_mixed(data)
+        complete, sep, partial = data.rpartition(b"\n")
+        if len(partial) > MAX_PARTIAL_BYTES:
+            self.partial_dropped += 1
+            partial = b""
+        self._partial = partial
+        if not sep:
+            return []
+        lines = [line.strip() for line in complete.decode(self.encoding, errors='ignore').split("\n")]
+        lines = [line for line in lines if line]
+        self.lines_read += len(lines)
+        return lines
+
+    def _feed_mixed(self, data):
+        items, partial, dropped = split_stream(data, self.encoding)
+        if len(partial) > MAX_PARTIAL_BYTES:
+            dropped += 1
+            partial = b""
+        self._partial = partial
+        self.partial_dropped += dropped
+        frames = sum(1 for item in items if item.__class__ is bytes)
+        self.frames_read += frames
+        self.lines_read += len(items) - frames
+        return items
+
+    def reset(self):
+        self._partial = b""
+
+
+def read_line_batches(reader, on_batch, should_run, interval=BATCH_INTERVAL_S):
+    """Read lines until ``should_run()`` is False, calling ``on_batch(lines)`` every ``interval`` seconds.
+
+    Lines arriving between two deadlines are delivered together, so the
+    consumer sees at most ``1 / interval`` calls per second regardless of the
+    sample rate.  Exceptions from the port propagate to the caller.
+    """
+    batch = []
+    first_read = None  # perf_counter() when the batch's first line was read
+    deadline = time.monotonic() + interval
+    while should_run():
+        lines = reader.read_lines()
+        if lines:
+            if not batch:
+                first_read = time.perf_counter()
+            batch.extend(lines)
+        now = time.monotonic()
+        if now >= deadline:
+            if batch:
+                LATENCY.record("read", time.perf_counter() - first_read)
+                on_batch(batch)
+                batch = []
+            deadline = now + interval
+    if batch:
+        on_batch(batch)
@@ -0,0 +1,450 @@
+"""Stand-in for the ESP32 serial bridge, replaying recordings from data/.
+
+Recorded sessions are replayed as the line protocol EspServer.py reads:
+JSON sample lines (esp8266_fixing.ino), ``DATA:`` lines (ESP8266_Node.ino)
+or binary sample frames (binary_frames.py), HELLO/WELCOME handshake
+lines (again every DATA_PACKET_RESET_THRESHOLD packets, like the nodes
+do), server uptime, WiFi client count and separators.  The number of
+nodes, replay speed, send jitter and line corruption rate are
+configurable; binary frames carry the node number in one byte, so nodes
+above 255 cannot use them.
+
+Two ways to attach it:
+
+* ``SimulatedSerial`` - an in-process object with the pyserial calls the
+  reader uses (``in_waiting``, ``read``, ``write``, ``close``), for
+  ``IngestEngine.start_reader`` and load tests;
+* a pseudo terminal (Linux/macOS) that EspServer.py or ingest_engine.py open
+  like a real port:
+
+    python serial_simulator.py --nodes 4 --speed 20          # prints /dev/pts/N
+    python EspServer.py --port /dev/pts/N
+    python serial_simulator.py --bench --nodes 8 --speed 50 --duration 10
+
+``CONFIG:<node>:<accel>:<gyro>:<srd>:<freq>`` commands written to the port
+are answered like EspServer.ino does and change that node's send rate.
+"""
+import argparse
+import glob
+import heapq
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from binary_frames import encode_frame, node_number
+from recording_loader import read_nodes
+
+DEFAULT_RECORDINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "0707", "*.csv")
+DATA_PACKET_RESET_THRESHOLD = 200  # Nodes re-send HELLO after this many packets
+UPTIME_INTERVAL_S = 10  # Simulated seconds between uptime/client-count chatter
+SEPARATOR = "-" * 50
+TICK_S = 0.005
+LINE_FORMATS = ("json", "data", "binary", "mixed")
+
+
+def load_recordings(pattern=DEFAULT_RECORDINGS, min_rows=50):
+    """[(name, rel_time_s, values (n, 6))] for every CSV matching ``pattern``."""
+    recordings = []
+    for path in sorted(glob.glob(pattern)):
+        for node_id, (ts_us, values) in read_nodes(path).items():
+            if len(ts_us) < min_rows:
+                continue
+            recordings.append((os.path.basename(path), _relative_times(ts_us), values))
+    return recordings
+
+
+def _relative_times(ts_us):
+    """Seconds since the first sample, with gaps, wraps and steps replaced by the median period."""
+    dt = np.diff(ts_us.astype(np.int64)) / 1e6
+    valid = dt[(dt > 0) & (dt < 1.0)]
+    period = float(np.median(valid)) if len(valid) else 0.1
+    dt = np.where((dt > 0) & (dt < 1.0), dt, period)
+    return np.concatenate(([0.0], np.cumsum(dt)))
+
+
+def encode_lines(lines, encoding="utf-8"):
+    """Wire bytes for generator output (text lines and binary frames)."""
+    return b"".join(line if line.__class__ is bytes else line.encode(encoding, errors="replace")
+                    for line in lines)
+
+
+def corrupt_line(line, rng):
+    """Damage one output line the ways a noisy UART does; ``line`` ends with a newline."""
+    kind = rng.randrange(4)
+    if isinstance(line, bytes):  # Binary frame between 0x00 delimiters
+        body = bytearray(line[1:-1])
+        pos = rng.randrange(len(body))
+        if kind == 0:  # Truncated, closing delimiter lost
+            return line[:1 + pos]
+        if kind == 1:  # Flipped bit
+            body[pos] ^= 1 << rng.randrange(8)
+        elif kind == 2:  # Dropped byte
+            del body[pos]
+        else:  # Lost opening delimiter
+            return line[1:]
+        return line[:1] + bytes(body) + line[-1:]
+    body = line[:-1]
+    if kind == 0 and len(body) > 1:  # Truncated
+        return body[:rng.randrange(1, len(body))] + "\n"
+    if kind == 1 and body:  # Garbled byte
+        pos = rng.randrange(len(body))
+        return body[:pos] + rng.choice("\x00#?�") + body[pos + 1:] + "\n"
+    if kind == 2 and body:  # Dropped byte
+        pos = rng.randrange(len(body))
+        return body[:pos] + body[pos + 1:] + "\n"
+    return body  # Lost newline: merges with the next line
+
+
+class _Node:
+    def __init__(self, node_id, rel_time, values, start_ms, line_format):
+        self.node_id = node_id
+        self.rel_time = rel_time
+        self.values = values
+        self.start_ms = start_ms
+        self.line_format = line_format
+        self.length = float(rel_time[-1] + (rel_time[-1] / max(len(rel_time) - 1, 1)))
+        self.native_hz = (len(rel_time) - 1) / rel_time[-1] if rel_time[-1] > 0 else 10.0
+        self.every = 1  # Send 1 of N samples (changed by CONFIG)
+        self.accel_range = 0  # MPU6050 range codes used by binary frames (changed by CONFIG)
+        self.gyro_range = 0
+        self.number = node_number(node_id) if line_format == "binary" else None
+        self.index = 0
+        self.loops = 0
+        self.packets = 0
+        self.counter = 0
+
+    def next_time(self):
+        return self.loops * self.length + self.rel_time[self.index]
+
+    def advance(self):
+        self.index += self.every
+        if self.index >= len(self.rel_time):
+            self.index %= len(self.rel_time)
+            self.loops += 1
+
+
+class LineGenerator:
+    """Produces the serial lines that are due at a given wall-clock time."""
+
+    def __init__(self, recordings, nodes=4, speed=1.0, jitter_ms=0.0, corruption=0.0,
+                 line_format="json", chatter=True, seed=0):
+        if not recordings:
+            raise ValueError("No recordings to replay")
+        if line_format not in LINE_FORMATS:
+            raise ValueError(f"line_format must be one of {LINE_FORMATS}")
+        self.rng = random.Random(seed)
+        self.speed = speed
+        self.jitter_ms = jitter_ms
+        self.corruption = corruption
+        self.chatter = chatter
+        self.nodes = {}
+        for i in range(nodes):
+            _, rel_time, values = recordings[i % len(recordings)]
+            node_format = line_format if line_format != "mixed" else LINE_FORMATS[i % 3]
+            node_id = f"Sensor_{i + 1}"
+            self.nodes[node_id] = _Node(node_id, rel_time, values, self.rng.randrange(0, 60000), node_format)
+        self.lines_generated = 0
+        self.samples_generated = 0
+        self.lines_corrupted = 0
+        self._heap = []  # (due sim time, seq, line)
+        self._seq = 0
+        self._started = None
+        self._horizon = 0.0
+        self._next_uptime = 0.0
+        self._lock = threading.Lock()
+
+    def _push(self, due, line):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, line))
+
+    def _handshake(self, node, due):
+        millis = int(due * 1000)
+        self._push(due, f"Received HELLO from Node ID: {node.node_id}\n")
+        self._push(due, f"SUCCESS: Sent WELCOME to {node.node_id} -> WELCOME:{node.node_id}:{millis}\n")
+
+    def _sample_line(self, node):
+        ax, ay, az, gx, gy, gz = node.values[node.index].tolist()
+        ts_ms = node.start_ms + int(node.next_time() * 1000)
+        if node.line_format == "binary":
+            return encode_frame(node.number, node.packets, ts_ms, (ax, ay, az, gx, gy, gz),
+                                accel_range=node.accel_range, gyro_range=node.gyro_range)
+        if node.line_format == "data":
+            return (f"DATA:{node.node_id}:MPU6050:{ts_ms}:"
+                    f"{ax:.3f}:{ay:.3f}:{az:.3f}:{gx:.3f}:{gy:.3f}:{gz:.3f}:{25.0 + node.counter % 7 * 0.01:.2f}\n")
+        return (f'{{"id":"{node.node_id}","ts":{ts_ms},"ax":{ax:.3f},"ay":{ay:.3f},"az":{az:.3f},'
+                f'"gx":{gx:.3f},"gy":{gy:.3f},"gz":{gz:.3f}}}\n')
+
+    def _generate(self, horizon):
+        jitter_s = self.jitter_ms / 1000.0 * self.speed  # Wall-clock jitter in simulated seconds
+        for node in self.nodes.values():
+            while node.next_time() <= horizon:
+                due = node.next_time()
+                if node.packets % DATA_PACKET_RESET_THRESHOLD == 0:
+                    self._handshake(node, due)
+                if jitter_s:
+                    due += abs(self.rng.gauss(0.0, jitter_s))
+                self._push(due, self._sample_line(node))
+                node.packets += 1
+                node.counter += 1
+                self.samples_generated += 1
+                node.advance()
+        while self.chatter and self._next_uptime <= horizon:
+            due = self._next_uptime
+            self._push(due, SEPARATOR + "\n")
+            self._push(due, f"Server Uptime: {int(due)} seconds\n")
+            self._push(due, f"DEBUG: WiFi SoftAP Connected Clients (WiFi layer): --- {len(self.nodes)} clients\n")
+            self._push(due, SEPARATOR + "\n")
+            self._next_uptime += UPTIME_INTERVAL_S
+
+    def due_lines(self, now=None):
+        """All lines due at wall-clock ``now`` (first call starts the clock)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._started is None:
+                self._started = now
+            sim_now = (now - self._started) * self.speed
+            self._generate(sim_now + self.jitter_ms / 1000.0 * self.speed * 4)
+            out = []
+            while self._heap and self._heap[0][0] <= sim_now:
+                line = heapq.heappop(self._heap)[2]
+                if self.corruption and self.rng.random() < self.corruption:
+                    line = corrupt_line(line, self.rng)
+                    self.lines_corrupted += 1
+                out.append(line)
+            self.lines_generated += len(out)
+            return out
+
+    def handle_command(self, command):
+        """Answer a line written to the port the way EspServer.ino does."""
+        command = command.strip()
+        with self._lock:
+            if command.startswith("CONFIG:"):
+                parts = command.split(":")
+                if len(parts) != 6:
+                    return "ERROR: Invalid CONFIG format.\n"
+                try:
+                    accel, gyro, sample, freq = (int(p) for p in parts[2:])
+                except ValueError:
+                    return "ERROR: Invalid CONFIG values.\n"
+                if accel < 0 or gyro < 0 or sample < 0 or freq <= 0:
+                    return "ERROR: Invalid CONFIG values.\n"
+                node = self.nodes.get(parts[1])
+                if node is None:
+                    return "ERROR: Node ID not found.\n"
+                node.every = max(1, int(round(node.native_hz / freq)))
+                node.accel_range = accel if accel <= 3 else 0  # Out-of-range codes reset like the firmware
+                node.gyro_range = gyro if gyro <= 3 else 0
+                return f"Sent CONFIG to {node.node_id}: {command}\n"
+            if command == "LIST_CLIENTS":
+                return "".join(f"Node: {n.node_id}, IP: 192.168.4.{i + 2}, Port: 1234\n"
+                               for i, n in enumerate(self.nodes.values())) or "No clients connected.\n"
+            return f"Unknown command: {command}\n"
+
+
+class SimulatedSerial:
+    """In-process serial port fed by a LineGenerator (pyserial-compatible subset).
+
+    ``baud`` limits the byte rate like the real UART (8N1: baud / 10 bytes/s);
+    None delivers everything as soon as it is due.
+    """
+
+    def __init__(self, generator, baud=None, encoding="utf-8"):
+        self.generator = generator
+        self.baud = baud
+        self.encoding = encoding
+        self.port = "simulated"
+        self.is_open = True
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self._buffer = bytearray()
+        self._budget = 0.0
+        self._last = None
+
+    def _fill(self):
+        now = time.monotonic()
+        lines = self.generator.due_lines(now)
+        if lines:
+            self._buffer += encode_lines(lines, self.encoding)
+        if self.baud:
+            if self._last is not None:
+                self._budget = min(self._budget + (now - self._last) * self.baud / 10.0, self.baud / 10.0)
+            self._last = now
+            overflow = len(self._buffer) - 65536  # ESP32 TX buffer plus host driver, roughly
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.bytes_dropped += overflow
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise OSError("Port is closed")
+        self._fill()
+        if self.baud:
+            return min(len(self._buffer), int(self._budget))
+        return len(self._buffer)
+
+    def read(self, size=1):
+        available = self.in_waiting
+        if not available:
+            time.sleep(TICK_S)
+            available = self.in_waiting
+        size = min(size, available)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        if self.baud:
+            self._budget -= size
+        self.bytes_sent += size
+        return data
+
+    def write(self, data):
+        reply = ""
+        for command in data.decode(self.encoding, errors="replace").splitlines():
+            reply += self.generator.handle_command(command)
+        self._buffer += reply.encode(self.encoding)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+class PtySimulator:
+    """Serves a LineGenerator on a pseudo terminal; ``port_name`` is the device to open."""
+
+    def __init__(self, generator, baud=None):
+        import tty
+
+        self.generator = generator
+        self.baud = baud
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        tty.setraw(self.master)
+        self.port_name = os.ttyname(slave)
+        self._slave = slave  # Kept open so the device exists until stop()
+        self.running = False
+        self._threads = []
+
+    def start(self):
+        self.running = True
+        for target in (self._write_loop, self._command_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        os.close(self.master)
+        os.close(self._slave)
+
+    def _write_loop(self):
+        pending = b""
+        last = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            lines = self.generator.due_lines(now)
+            if lines:
+                pending += encode_lines(lines)
+            limit = len(pending) if not self.baud else int((now - last) * self.baud / 10.0)
+            if pending and limit:
+                try:
+                    written = os.write(self.master, pending[:limit])
+                except OSError:
+                    break
+                pending = pending[written:]
+            last = now
+            time.sleep(TICK_S)
+
+    def _command_loop(self):
+        import select
+
+        buffer = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master, 1024)
+            except OSError:
+                break
+            while b"\n" in buffer:
+                command, buffer = buffer.split(b"\n", 1)
+                reply = self.generator.handle_command(command.decode("utf-8", errors="replace"))
+                try:
+                    os.write(self.master, reply.encode("utf-8"))
+                except OSError:
+                    return
+
+
+def run_bench(generator, duration, baud=None, out=None):
+    """Drive an IngestEngine from a SimulatedSerial and print its throughput."""
+    from ingest_engine import IngestEngine
+
+    engine = IngestEngine(log=lambda level, text: None)
+    port = SimulatedSerial(generator, baud=baud)
+    engine.start_reader(port)
+    if out:
+        engine.start_recording(out, "simulated")
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < duration and engine.running:
+            time.sleep(1.0)
+            s = engine.stats()
+            print(f"{s['elapsed_s']:5.1f}s  generated {generator.samples_generated:>9,}  "
+                  f"parsed {s['samples']:>9,} ({s['samples_per_s']:,.0f}/s)  "
+                  f"other {s['other_lines']:,}  corrupted {generator.lines_corrupted:,}  "
+                  f"rows written {s['rows_written']:,}")
+    finally:
+        engine.close()
+    if port.bytes_dropped:
+        print(f"UART overflow dropped {port.bytes_dropped:,} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay data/ recordings as the ESP32 serial protocol")
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS, help="glob of CSV recordings to replay")
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="send-time jitter per line (wall ms)")
+    parser.add_argument("--corruption", type=float, default=0.0, help="fraction of lines to damage")
+    parser.add_argument("--line-format", choices=LINE_FORMATS, default="json")
+    parser.add_argument("--no-chatter", action="store_true", help="only sample and handshake lines")
+    parser.add_argument("--baud", type=int, default=0, help="limit the byte rate like a UART (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bench", action="store_true", help="run IngestEngine in-process instead of a pty")
+    parser.add_argument("--duration", type=float, default=10.0, help="bench duration in seconds")
+    parser.add_argument("--out", help="bench: also record into this directory")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.recordings)
+    try:
+        generator = LineGenerator(recordings, nodes=args.nodes, speed=args.speed, jitter_ms=args.jitter_ms,
+                                  corruption=args.corruption, line_format=args.line_format,
+                                  chatter=not args.no_chatter, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Replaying {len(recordings)} recordings as {args.nodes} nodes at {args.speed}x")
+    if args.bench:
+        run_bench(generator, args.duration, baud=args.baud or None, out=args.out)
+        return
+
+    sim = PtySimulator(generator, baud=args.baud or None)
+    sim.start()
+    print(f"Simulated port: {sim.port_name}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Shared-memory ring of parsed samples, one writer process, any number of readers.
+
+Layout of one ``multiprocessing.shared_memory`` block:
+
+    header   HEADER_FIELDS int64 slots (capacity, rows written, pid, state,
+             heartbeat, reader counters)
+    names    MAX_NODES x NAME_BYTES utf-8 node IDs; SAMPLE_DTYPE "node" values
+             index this table (the writer's NodeIndex)
+    rows     capacity x SAMPLE_DTYPE
+
+The writer copies a batch into the rows and then advances ``written``; a
+reader keeps its own cursor and copies everything between its cursor and
+``written``.  Readers never block the writer.  A reader that falls more than
+``capacity`` rows behind skips ahead and counts the rows as lost.  So does a
+copy whose rows were overwritten while it ran.
+
+    ring = SharedSampleRing.create(capacity)         # supervisor
+    ring = SharedSampleRing.attach(ring.name)        # reader process / analytics script
+    reader = RingReader(ring); samples = reader.read()
+"""
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sensor_parser import SAMPLE_DTYPE
+
+RING_MAGIC = 0x53414D5052494E47  # "SAMPRING"
+RING_CAPACITY = 1 << 16  # Rows per ring (~3.8 MB): ~80 s of 8 nodes at 100 Hz between two reads
+MAX_NODES = 256
+NAME_BYTES = 32
+
+# Header slots
+H_MAGIC, H_CAPACITY, H_WRITTEN, H_PID, H_STATE, H_HEARTBEAT_MS, H_NODES, H_LINES, H_OTHER, H_BYTES, H_ERRORS = range(11)
+HEADER_FIELDS = 16
+
+# Reader process states
+STATE_STARTING = 0
+STATE_RUNNING = 1
+STATE_STOPPED = 2
+STATE_FAILED = 3
+STATE_NAMES = ("starting", "running", "stopped", "failed")
+
+
+def _attach_shm(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix" and multiprocessing.parent_process() is None:
+        # An unrelated process has its own resource tracker, which would unlink the ring at exit
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedSampleRing:
+    """Ring of SAMPLE_DTYPE rows in shared memory, see the module docstring."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != RING_MAGIC:
+            raise ValueError(f"{shm.name} is not a sample ring")
+        self.capacity = int(self.header[H_CAPACITY])
+        names_offset = HEADER_FIELDS * 8
+        self._names = np.ndarray((MAX_NODES, NAME_BYTES), dtype=np.uint8, buffer=shm.buf, offset=names_offset)
+        self.rows = np.ndarray(self.capacity, dtype=SAMPLE_DTYPE, buffer=shm.buf,
+                               offset=names_offset + MAX_NODES * NAME_BYTES)
+        self._published = int(self.header[H_NODES])
+        self._names_cache = []
+
+    @staticmethod
+    def _size(capacity):
+        return HEADER_FIELDS * 8 + MAX_NODES * NAME_BYTES + capacity * SAMPLE_DTYPE.itemsize
+
+    @classmethod
+    def create(cls, capacity=RING_CAPACITY):
+        shm = shared_memory.SharedMemory(create=True, size=cls._size(capacity))
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_CAPACITY] = capacity
+        header[H_MAGIC] = RING_MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shm(name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        return int(self.header[H_WRITTEN])
+
+    def close(self):
+        """Detach; the owner also removes the block."""
+        self.header = self._names = self.rows = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # --- Writer side ---
+    def publish_names(self, names):
+        """Make node IDs ``names[published:]`` visible; call before writing rows that use them."""
+        for idx in range(self._published, min(len(names), MAX_NODES)):
+            raw = names[idx].encode("utf-8")[:NAME_BYTES]
+            self._names[idx] = 0
+            self._names[idx, :len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+        if len(names) > self._published:
+            self._published = min(len(names), MAX_NODES)
+            self.header[H_NODES] = self._published
+
+    def write(self, samples):
+        n = len(samples)
+        if not n:
+            return
+        cap = self.capacity
+        if n > cap:
+            samples = samples[-cap:]
+        written = int(self.header[H_WRITTEN])
+        start = (written + n - len(samples)) % cap
+        first = min(len(samples), cap - start)
+        self.rows[start:start + first] = samples[:first]
+        if first < len(samples):
+            self.rows[:len(samples) - first] = samples[first:]
+        self.header[H_WRITTEN] = written + n  # Readers only look at rows below this
+
+    def set_state(self, state, pid=None):
+        if pid is not None:
+            self.header[H_PID] = pid
+        self.header[H_STATE] = state
+
+    def heartbeat(self, lines=None, other_lines=None, bytes_received=None):
+        header = self.header
+        header[H_HEARTBEAT_MS] = int(time.time() * 1000)
+        if lines is not None:
+            header[H_LINES] = lines
+            header[H_OTHER] = other_lines
+            header[H_BYTES] = bytes_received
+
+    def count_error(self):
+        self.header[H_ERRORS] += 1
+
+    # --- Reader side ---
+    def node_names(self):
+        count = int(self.header[H_NODES])
+        cache = self._names_cache
+        for idx in range(len(cache), count):
+            cache.append(self._names[idx].tobytes().rstrip(b"\x00").decode("utf-8", errors="replace"))
+        return cache
+
+    def status(self):
+        """Counters of the writer process, readable from any process."""
+        header = self.header
+        heartbeat = int(header[H_HEARTBEAT_MS])
+        return {
+            "pid": int(header[H_PID]),
+            "state": STATE_NAMES[int(header[H_STATE])],
+            "heartbeat_age_s": time.time() - heartbeat / 1000.0 if heartbeat else None,
+            "samples": int(header[H_WRITTEN]),
+            "lines": int(header[H_LINES]),
+            "other_lines": int(header[H_OTHER]),
+            "bytes": int(header[H_BYTES]),
+            "errors": int(header[H_ERRORS]),
+            "nodes": int(header[H_NODES]),
+        }
+
+
+class RingReader:
+    """One consumer's cursor on a SharedSampleRing."""
+
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.cursor = 0 if from_start else ring.written
+        self.rows_read = 0
+        self.rows_lost = 0
+
+    def read(self, max_rows=None):
+        """Copy of the rows written since the last call (SAMPLE_DTYPE, writer's node indices)."""
+        ring = self.ring
+        cap = ring.capacity
+        written = ring.written
+        if written - self.cursor > cap:
+            self.rows_lost += written - cap - self.cursor
+            self.cursor = written - cap
+        if max_rows is not None:
+            written = min(written, self.cursor + max_rows)
+        n = written - self.cursor
+        if n <= 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        start = self.cursor % cap
+        first = min(n, cap - start)
+        if first == n:
+            out = ring.rows[start:start + n].copy()
+        else:
+            out = np.concatenate((ring.rows[start:], ring.rows[:n - first]))
+        # Rows the writer overwrote while they were being copied are not trustworthy
+        overwritten = ring.written - cap - self.cursor
+        if overwritten > 0:
+            self.rows_lost += min(overwritten, n)
+            out = out[overwritten:]
+        self.cursor = written
+        self.rows_read += len(out)
+        return out
@@ -0,0 +1,433 @@
+"""Repair of node timestamps: outliers, steps and clock drift.
+
+Nodes stamp samples with ``serverMillisAtHandshake + (millis() -
+clientMillisAtHandshake)`` and re-handshake every
+DATA_PACKET_RESET_THRESHOLD packets.  The stored ``ts_us`` is that value
+x 1000, so a recording has:
+
+* jitter of about +-1 ms around the send period (the node's loop timing);
+* small steps at each re-handshake, as the node re-syncs to the server clock.
+  The steps add up to the node's clock drift;
+* discontinuities: node reboots, clock wraps, and the odd sample that is
+  minutes off (seen in data/ recordings as isolated -330 s / +332 s jumps).
+
+``repair_timestamps`` works on one node's whole series, vectorized:
+
+1. The period is the median positive interval.  Every interval is
+   ``k`` periods (k >= 1, so gaps from lost packets are kept) plus a
+   residual.
+2. Isolated outliers are replaced by the midpoint of their neighbours.  An
+   outlier is a sample whose two intervals are both abnormal while the
+   interval across it is normal.
+3. Residuals above the jitter tolerance are steps.  Non-positive intervals
+   and intervals above ``max_gap_us`` are discontinuities: one period is
+   assumed to have passed.
+4. Removing all steps gives a continuous series on the node's clock.  A
+   line fitted through the cumulative re-sync steps against the slot index
+   gives the drift, which is then spread evenly over the samples.  The result
+   has no steps, follows the server clock, and is anchored to the raw
+   timestamps of the longest discontinuity-free section.
+
+``StreamingTimestampRepair`` applies the same rules to SAMPLE_DTYPE batches
+as they arrive (IngestEngine ``repair_timestamps=True``).  Only a sample that
+looks like a discontinuity is held back, until the next sample tells whether
+it was an outlier; ``flush()`` releases it at the end of a stream.  Rows come
+out in arrival order.
+
+    python timestamp_repair.py report ../data/0707
+    python timestamp_repair.py repair ../data/0707 --out ../data/repaired
+    python timestamp_repair.py resample ../data/0707/a.csv ../data/0707/b.csv --rate 10 --out grid.csv
+"""
+import argparse
+import collections
+import os
+
+import numpy as np
+
+from sensor_parser import SAMPLE_DTYPE
+
+JITTER_TOLERANCE_US = 3000  # Minimum |residual| treated as a step (real jitter is about +-1 ms)
+MAX_GAP_US = 60_000_000  # Longer intervals are discontinuities, not lost packets
+DEFAULT_PERIOD_US = 100_000  # Until enough intervals are seen (firmware default 10 Hz)
+MIN_INTERVALS = 8  # Intervals needed for a period estimate in streaming mode
+
+RepairResult = collections.namedtuple(
+    "RepairResult", "ts_us slots period_us drift_ppm outliers steps discontinuities jitter_us")
+
+
+def estimate_period(ts_us, default=DEFAULT_PERIOD_US):
+    dt = np.diff(np.asarray(ts_us, dtype=np.int64))
+    dt = dt[(dt > 0) & (dt < MAX_GAP_US)]
+    return float(np.median(dt)) if len(dt) else float(default)
+
+
+def _classify(dt, period, tolerance, max_gap):
+    """(slots per interval, residual, is_step, is_discontinuity) for intervals ``dt``."""
+    broken = (dt <= 0) | (dt > max_gap)
+    k = np.where(broken, 1, np.maximum(np.rint(dt / period), 1)).astype(np.int64)
+    residual = dt - k * period
+    step = ~broken & (np.abs(residual) > tolerance)
+    return k, residual, step, broken
+
+
+def _drift_per_slot(x, y, section):
+    """Slope of the cumulative re-sync offset ``y`` against slot ``x`` at each step.
+
+    Each discontinuity-free ``section`` gets its own intercept: a reboot both
+    resets the offset and hides the step it coincides with.  A single step is
+    just an offset (e.g. the first packet after boot), so a section needs at
+    least two steps to count.
+    """
+    sxx = sxy = 0.0
+    for sec in np.unique(section).tolist():
+        mask = section == sec
+        if np.count_nonzero(mask) < 2:
+            continue
+        dx = x[mask] - x[mask].mean()
+        sxx += float(np.dot(dx, dx))
+        sxy += float(np.dot(dx, y[mask] - y[mask].mean()))
+    return sxy / sxx if sxx else 0.0
+
+
+def repair_timestamps(ts_us, period_us=None, tolerance_us=None, max_gap_us=MAX_GAP_US):
+    """Repair one node's timestamps (int64 us, arrival order); returns a RepairResult."""
+    ts = np.array(ts_us, dtype=np.int64)
+    n = len(ts)
+    if n < 3:
+        return RepairResult(ts, np.arange(n, dtype=np.int64), float(period_us or estimate_period(ts)),
+                            0.0, np.zeros(n, dtype=bool), 0, 0, 0.0)
+    period = float(period_us or estimate_period(ts))
+    dt = np.diff(ts)
+    if tolerance_us is None:
+        normal = dt[(dt > 0) & (dt < max_gap_us)]
+        k = np.maximum(np.rint(normal / period), 1)
+        mad = np.median(np.abs(normal - k * period)) if len(normal) else 0.0
+        tolerance_us = max(JITTER_TOLERANCE_US, 6.0 * mad)
+
+    # 2. Isolated outliers: both intervals around a sample abnormal, the span across it normal
+    _, _, step, broken = _classify(dt, period, tolerance_us, max_gap_us)
+    abnormal = step | broken
+    span = dt[:-1] + dt[1:]
+    _, _, span_step, span_broken = _classify(span, period, tolerance_us, max_gap_us)
+    outlier_inner = abnormal[:-1] & abnormal[1:] & ~span_step & ~span_broken
+    outliers = np.zeros(n, dtype=bool)
+    outliers[1:-1] = outlier_inner
+    if outlier_inner.any():
+        idx = np.flatnonzero(outliers)
+        ts[idx] = ts[idx - 1] + span[idx - 1] // 2
+        dt = np.diff(ts)
+
+    # 3./4. Steps and discontinuities, then the drift of the re-sync steps
+    k, residual, step, broken = _classify(dt, period, tolerance_us, max_gap_us)
+    slots = np.concatenate(([0], np.cumsum(k)))
+    removed = np.where(step | broken, residual, 0).astype(np.float64)
+    continuous = ts - np.concatenate(([0.0], np.cumsum(removed)))
+    resync = np.concatenate(([0.0], np.cumsum(np.where(step, residual, 0.0))))
+    section = np.cumsum(broken)
+    drift_per_slot = _drift_per_slot(slots[1:][step].astype(np.float64), resync[1:][step], section[step])
+    corrected = continuous + drift_per_slot * slots
+
+    # Anchor: raw timestamps of the longest section without discontinuities
+    cuts = np.concatenate(([0], np.flatnonzero(broken) + 1, [n]))
+    longest = int(np.argmax(np.diff(cuts)))
+    section = slice(cuts[longest], cuts[longest + 1])
+    corrected += np.median(ts[section] - corrected[section])
+
+    jitter = residual[~step & ~broken]
+    return RepairResult(
+        ts_us=np.rint(corrected).astype(np.int64),
+        slots=slots,
+        period_us=period,
+        drift_ppm=drift_per_slot / period * 1e6,
+        outliers=outliers,
+        steps=int(np.count_nonzero(step)),
+        discontinuities=int(np.count_nonzero(broken)),
+        jitter_us=float(np.std(jitter)) if len(jitter) else 0.0,
+    )
+
+
+class _NodeState:
+    __slots__ = ("period", "intervals", "last_raw", "last_out", "slot", "held", "held_seq", "fit", "pooled",
+                 "resync", "drift_per_slot", "outliers", "steps", "discontinuities")
+
+    def __init__(self):
+        self.period = None
+        self.intervals = []  # Intervals seen before the period is known
+        self.last_raw = None  # Raw timestamp of the last accepted sample
+        self.last_out = None  # Its corrected timestamp
+        self.slot = 0
+        self.held = None  # Row with an abnormal interval, waiting for the next sample
+        self.held_seq = None  # Its arrival number
+        self.fit = np.zeros(5)  # Sums n, x, y, xx, xy of (slot, cumulative re-sync offset) at steps, this section
+        self.pooled = np.zeros(2)  # Centered sums xx, xy of the sections before the last discontinuity
+        self.resync = 0.0
+        self.drift_per_slot = 0.0
+        self.outliers = self.steps = self.discontinuities = 0
+
+
+class StreamingTimestampRepair:
+    """Per-node timestamp repair of SAMPLE_DTYPE batches (node indices of one NodeIndex).
+
+    Corrected timestamps are anchored to the first sample of each node.  Until
+    MIN_INTERVALS intervals give a period, samples pass unchanged.  Being
+    causal, drift is only corrected from the second re-sync step on; the batch
+    repair of the recording is more accurate.
+    """
+
+    def __init__(self, period_us=None, tolerance_us=JITTER_TOLERANCE_US, max_gap_us=MAX_GAP_US):
+        self.period_us = period_us
+        self.tolerance_us = tolerance_us
+        self.max_gap_us = max_gap_us
+        self._nodes = collections.defaultdict(_NodeState)
+        self._seq = 0  # Arrival number of the next row
+
+    def reset(self):
+        self._nodes.clear()
+        self._seq = 0
+
+    def process(self, samples):
+        """Return ``samples`` with repaired ``ts_us``, in arrival order; a row may be held back until the next batch."""
+        if not len(samples):
+            return samples
+        seq = np.arange(self._seq, self._seq + len(samples), dtype=np.int64)
+        self._seq += len(samples)
+        nodes = samples["node"]
+        unique = np.unique(nodes)
+        if len(unique) == 1:
+            # A held row arrived before this batch, so the order is already right
+            return self._process_node(self._nodes[int(unique[0])], samples.copy(), seq)[0]
+        return self._in_arrival_order([self._process_node(self._nodes[idx], samples[nodes == idx], seq[nodes == idx])
+                                       for idx in unique.tolist()])
+
+    def flush(self):
+        """Release the rows held back, deciding them without a next sample (end of stream or recording)."""
+        parts = [self._process_node(state, state.held[:0], state.held_seq[:0], final=True)
+                 for state in self._nodes.values() if state.held is not None]
+        return self._in_arrival_order(parts) if parts else np.empty(0, dtype=SAMPLE_DTYPE)
+
+    @staticmethod
+    def _in_arrival_order(parts):
+        rows = np.concatenate([p[0] for p in parts])
+        return rows[np.argsort(np.concatenate([p[1] for p in parts]), kind="stable")]
+
+    def _process_node(self, state, rows, seq, final=False):
+        """(repaired rows, their arrival numbers) of one node."""
+        if state.held is not None:
+            rows, seq = np.concatenate((state.held, rows)), np.concatenate((state.held_seq, seq))
+            state.held = state.held_seq = None
+        raw = rows["ts_us"].astype(np.int64)
+        if state.last_raw is None:
+            state.last_raw = state.last_out = int(raw[0])
+            head, head_seq = rows[:1], seq[:1]
+            raw, rows, seq = raw[1:], rows[1:], seq[1:]
+        else:
+            head, head_seq = rows[:0], seq[:0]
+        if state.period is None:
+            self._learn_period(state, raw)
+            if state.period is None:
+                if len(raw):
+                    state.last_raw = state.last_out = int(raw[-1])
+                return np.concatenate((head, rows)), np.concatenate((head_seq, seq))
+        if not len(raw):
+            return head, head_seq
+
+        dt = np.diff(raw, prepend=state.last_raw)
+        k, residual, step, broken = _classify(dt, state.period, self.tolerance_us, self.max_gap_us)
+        if step.any() or broken.any():
+            out, keep = self._process_slow(state, raw, final)
+            if not keep[-1]:
+                state.held, state.held_seq = rows[-1:].copy(), seq[-1:]
+            rows, seq = rows[keep], seq[keep]
+            rows["ts_us"] = out[keep]
+            return np.concatenate((head, rows)), np.concatenate((head_seq, seq))
+        # Plain jitter (the usual case): vectorized
+        slots = np.cumsum(k)
+        out = state.last_out + (raw - state.last_raw) + state.drift_per_slot * slots
+        state.slot += int(slots[-1])
+        state.last_raw = int(raw[-1])
+        state.last_out = float(out[-1])
+        rows["ts_us"] = np.rint(out).astype(np.int64)
+        return np.concatenate((head, rows)), np.concatenate((head_seq, seq))
+
+    def _learn_period(self, state, raw):
+        previous = state.last_raw
+        state.intervals.extend(np.diff(raw, prepend=previous).tolist() if len(raw) else [])
+        if self.period_us:
+            state.period = float(self.period_us)
+            return
+        good = [d for d in state.intervals if 0 < d < self.max_gap_us]
+        if len(good) >= MIN_INTERVALS:
+            state.period = float(np.median(good))
+            state.intervals = []
+
+    def _classify_one(self, dt, period):
+        k, residual, step, broken = _classify(np.array([dt]), period, self.tolerance_us, self.max_gap_us)
+        return int(k[0]), float(residual[0]), bool(step[0]), bool(broken[0])
+
+    def _process_slow(self, state, raw, final=False):
+        """Sample by sample, with the same outlier rule as repair_timestamps (``final``: hold nothing back)."""
+        period = state.period
+        out = np.zeros(len(raw), dtype=np.int64)
+        keep = np.ones(len(raw), dtype=bool)
+        for j in range(len(raw)):
+            dt = int(raw[j]) - state.last_raw
+            k, residual, step, broken = self._classify_one(dt, period)
+            if (step or broken) and j + 1 == len(raw):
+                if not final:
+                    # The next sample decides between outlier and step
+                    keep[j] = False
+                    break
+            elif step or broken:
+                span = int(raw[j + 1]) - state.last_raw
+                _, _, span_step, span_broken = self._classify_one(span, period)
+                _, _, next_step, next_broken = self._classify_one(int(raw[j + 1]) - int(raw[j]), period)
+                if (next_step or next_broken) and not span_step and not span_broken:
+                    state.outliers += 1
+                    raw[j] = state.last_raw + span // 2
+                    dt = int(raw[j]) - state.last_raw
+                    k, residual, step, broken = self._classify_one(dt, period)
+            if broken:
+                state.discontinuities += 1
+                self._close_section(state)
+                advance = period * k  # One period is assumed to have passed
+            elif step:
+                state.steps += 1
+                state.resync += residual
+                slot = float(state.slot + k)
+                state.fit += (1.0, slot, state.resync, slot * slot, slot * state.resync)
+                sxx, sxy = state.pooled + self._centered(state.fit)
+                state.drift_per_slot = sxy / sxx if sxx else 0.0
+                advance = dt - residual
+            else:
+                advance = dt
+            state.slot += k
+            state.last_out += advance + state.drift_per_slot * k
+            state.last_raw = int(raw[j])
+            out[j] = round(state.last_out)
+        return out, keep
+
+    @staticmethod
+    def _centered(fit):
+        n, sx, sy, sxx, sxy = fit
+        if n < 2:
+            return np.zeros(2)
+        return np.array((sxx - sx * sx / n, sxy - sx * sy / n))
+
+    def _close_section(self, state):
+        state.pooled += self._centered(state.fit)
+        state.fit[:] = 0
+        state.resync = 0.0
+
+    def stats(self):
+        return {
+            idx: {
+                "period_us": s.period,
+                "drift_ppm": s.drift_per_slot / s.period * 1e6 if s.period else 0.0,
+                "outliers": s.outliers,
+                "steps": s.steps,
+                "discontinuities": s.discontinuities,
+            }
+            for idx, s in self._nodes.items()
+        }
+
+
+def repair_samples(samples, **options):
+    """Batch-repair a SAMPLE_DTYPE array (any mix of nodes); returns (copy, {node index: RepairResult})."""
+    out = samples.copy()
+    results = {}
+    nodes = samples["node"]
+    for idx in np.unique(nodes).tolist():
+        mask = nodes == idx
+        result = repair_timestamps(samples["ts_us"][mask], **options)
+        out["ts_us"][mask] = result.ts_us
+        results[idx] = result
+    return out, results
+
+
+# --- Command line ---
+def _load_nodes(paths):
+    from recording_loader import read_nodes
+
+    nodes = {}
+    for path in paths:
+        for node_id, (ts_us, values) in read_nodes(path).items():
+            key = node_id if node_id not in nodes else f"{node_id}@{os.path.splitext(os.path.basename(path))[0]}"
+            nodes[key] = (ts_us, values)
+    return nodes
+
+
+def _report_line(name, result):
+    span = (result.ts_us[-1] - result.ts_us[0]) / 1e6 if len(result.ts_us) else 0.0
+    return (f"{name:<48}{len(result.ts_us):>7} rows {span:9.1f} s  period {result.period_us / 1000:7.2f} ms  "
+            f"jitter {result.jitter_us / 1000:5.2f} ms  outliers {int(result.outliers.sum()):>3}  "
+            f"steps {result.steps:>3}  breaks {result.discontinuities:>3}  drift {result.drift_ppm:8.1f} ppm")
+
+
+def _cmd_report(args):
+    from columnar_format import iter_csv_files
+    from recording_loader import read_nodes
+
+    for path in iter_csv_files(args.path):
+        for node_id, (ts_us, _) in read_nodes(path).items():
+            print(_report_line(f"{os.path.basename(path)}:{node_id}", repair_timestamps(ts_us)))
+
+
+def _cmd_repair(args):
+    from columnar_format import iter_csv_files
+    from recorder import CSV_HEADER, format_csv_rows
+    from recording_loader import read_nodes
+    from sensor_parser import SAMPLE_FIELDS
+
+    os.makedirs(args.out, exist_ok=True)
+    for path in iter_csv_files(args.path):
+        target = os.path.join(args.out, os.path.basename(path))
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(CSV_HEADER)
+            for node_id, (ts_us, values) in read_nodes(path).items():
+                result = repair_timestamps(ts_us)
+                rows = np.zeros(len(ts_us), dtype=SAMPLE_DTYPE)
+                rows["ts_us"] = result.ts_us
+                for i, name in enumerate(SAMPLE_FIELDS):
+                    rows[name] = values[:, i]
+                f.write(format_csv_rows(node_id, rows))
+                print(_report_line(f"{os.path.basename(path)}:{node_id}", result))
+        print(f"  -> {target}")
+
+
+def _cmd_resample(args):
+    from resampler import resample_uniform, write_grid_csv
+
+    nodes = _load_nodes(args.paths)
+    if not args.raw:
+        nodes = {name: (repair_timestamps(ts).ts_us, values) for name, (ts, values) in nodes.items()}
+    grid = resample_uniform(nodes, args.rate, method=args.method)
+    write_grid_csv(args.out, grid)
+    coverage = grid.valid.mean(axis=0) if len(grid.ts_us) else []
+    print(f"{len(grid.ts_us)} grid rows at {args.rate} Hz -> {args.out}")
+    for name, share in zip(grid.node_ids, coverage):
+        print(f"  {name:<48} coverage {share * 100:5.1f} %")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timestamp repair and uniform-grid resampling of recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("report", help="period, jitter, outliers, steps and drift per node")
+    p.add_argument("path", help="CSV file or directory")
+    p.set_defaults(func=_cmd_report)
+    p = sub.add_parser("repair", help="write copies of CSV recordings with repaired timestamps")
+    p.add_argument("path", help="CSV file or directory")
+    p.add_argument("--out", required=True, help="output directory")
+    p.set_defaults(func=_cmd_repair)
+    p = sub.add_parser("resample", help="put several recordings on one uniform time grid")
+    p.add_argument("paths", nargs="+", help="CSV recordings (one or more nodes each)")
+    p.add_argument("--rate", type=float, default=10.0, help="grid rate in Hz")
+    p.add_argument("--method", choices=("linear", "nearest"), default="linear")
+    p.add_argument("--raw", action="store_true", help="skip timestamp repair")
+    p.add_argument("--out", required=True, help="output CSV")
+    p.set_defaults(func=_cmd_resample)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
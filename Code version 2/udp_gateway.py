@@ -0,0 +1,244 @@
+"""Host-side UDP gateway: the protocol of EspServer.ino without the serial hop.
+
+Nodes send to UDP port 1234 (ESP8266_Node.ino, esp8266_fixing.ino).  The
+ESP32 answers HELLO with WELCOME, broadcasts SERVER_HEARTBEAT every 5 s,
+forwards CONFIG commands and drops clients silent for 30 s, re-printing every
+packet over a 115200-baud serial link.  ``UdpGateway`` does the same on the
+host with asyncio and hands the packets to the ingest path as lines.  Handshakes
+and timeouts are reported with the same text the serial bridge prints, so
+parsing, node state, recording and the GUI are unchanged.
+
+The host must be on the nodes' network (e.g. joined to the ESP32_AP WiFi or
+with the nodes' server IP pointed at it).  For a loopback test:
+
+    python udp_gateway.py --port 1234                   # terminal 1
+    python udp_node_sim.py --server 127.0.0.1 --nodes 4 # terminal 2
+"""
+import argparse
+import asyncio
+import time
+
+from binary_frames import FRAME_DELIMITER, split_stream
+
+UDP_PORT = 1234
+HEARTBEAT_INTERVAL_S = 5.0
+CLIENT_TIMEOUT_S = 30.0
+BATCH_INTERVAL_S = 0.02
+
+
+class ClientInfo:
+    __slots__ = ("node_id", "node_type", "addr", "last_seen", "accel", "gyro", "srd", "freq", "packets")
+
+    def __init__(self, node_id, node_type, addr, now):
+        self.node_id = node_id
+        self.node_type = node_type
+        self.addr = addr
+        self.last_seen = now
+        self.accel = self.gyro = self.srd = self.freq = 0
+        self.packets = 0
+
+
+class UdpGateway(asyncio.DatagramProtocol):
+    """Receives node packets, answers the handshake and batches lines for ``on_lines(lines)``."""
+
+    def __init__(self, on_lines, batch_interval=BATCH_INTERVAL_S, heartbeat_interval=HEARTBEAT_INTERVAL_S,
+                 client_timeout=CLIENT_TIMEOUT_S, broadcast=None, log=None):
+        self.on_lines = on_lines
+        self.batch_interval = batch_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.client_timeout = client_timeout
+        self.broadcast = broadcast  # e.g. "192.168.4.255"; heartbeats are also sent to every client
+        self.log = log or (lambda level, text: print(f"[{level}] {text}"))
+        self.clients = {}  # node_id -> ClientInfo
+        self._addr_to_node = {}
+        self._lines = []
+        self.transport = None
+        self.loop = None
+        self.local_addr = None
+        self._stop = None
+        self._started = time.monotonic()
+        self.packets_received = 0
+        self.bytes_received = 0
+
+    def millis(self):
+        return int((time.monotonic() - self._started) * 1000)
+
+    # --- asyncio.DatagramProtocol ---
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        if data[:1] == FRAME_DELIMITER:  # Binary sample frame(s), see binary_frames.py
+            self._touch(addr)
+            self._lines.extend(split_stream(data)[0])
+            return
+        text = data.decode("utf-8", errors="replace").strip()
+        if text.startswith("HELLO:"):
+            self._handle_hello(text, addr)
+        elif text.startswith("{") or text.startswith("DATA:"):
+            self._touch(addr)
+            self._lines.append(text)
+        elif not text.startswith("SERVER_HEARTBEAT"):
+            self._lines.append(f"Unknown UDP packet from {addr[0]}: '{text}'")
+
+    def _touch(self, addr):
+        node_id = self._addr_to_node.get(addr)
+        if node_id is not None:
+            client = self.clients[node_id]
+            client.last_seen = time.monotonic()
+            client.packets += 1
+
+    def error_received(self, exc):
+        self.log("WARN", f"UDP error: {exc}")
+
+    # --- Protocol ---
+    def _handle_hello(self, text, addr):
+        # HELLO:<id>:<type>[:<accel>:<gyro>:<srd>[:<freq>]] (version 2 nodes leave out freq)
+        parts = text.split(":")
+        if len(parts) < 3 or not parts[1]:
+            self._lines.append("ERROR: Malformed HELLO packet.")
+            return
+        node_id, node_type = parts[1], parts[2]
+        now = time.monotonic()
+        client = self.clients.get(node_id)
+        if client is None:
+            client = self.clients[node_id] = ClientInfo(node_id, node_type, addr, now)
+        else:
+            self._addr_to_node.pop(client.addr, None)
+            client.addr = addr
+            client.last_seen = now
+        if len(parts) >= 6:
+            try:
+                client.accel, client.gyro, client.srd = (int(p) for p in parts[3:6])
+                if len(parts) >= 7:
+                    client.freq = int(parts[6])
+            except ValueError:
+                pass
+        self._addr_to_node[addr] = node_id
+        welcome = f"WELCOME:{node_id}:{self.millis()}"
+        self.transport.sendto(welcome.encode(), addr)
+        self._lines.append(f"Received HELLO from Node ID: {node_id}")
+        self._lines.append(f"SUCCESS: Sent WELCOME to {node_id} -> {welcome}")
+
+    def _send_heartbeat(self):
+        packet = f"SERVER_HEARTBEAT:{self.millis()}".encode()
+        if self.broadcast:
+            self.transport.sendto(packet, (self.broadcast, UDP_PORT))
+        for client in self.clients.values():
+            self.transport.sendto(packet, client.addr)
+
+    def _expire_clients(self):
+        now = time.monotonic()
+        for node_id, client in list(self.clients.items()):
+            if now - client.last_seen > self.client_timeout:
+                self._lines.append(f"Client timeout: {node_id}")
+                self._addr_to_node.pop(client.addr, None)
+                del self.clients[node_id]
+
+    def _flush(self):
+        if self._lines:
+            lines, self._lines = self._lines, []
+            self.on_lines(lines)
+
+    # --- Commands (same text as EspServer.ino over serial) ---
+    def send_config(self, node_id, accel, gyro, srd, freq):
+        """Send CONFIG to a node; returns the reply line EspServer.ino would print."""
+        if accel < 0 or gyro < 0 or srd < 0 or freq <= 0:
+            return "ERROR: Invalid CONFIG values."
+        client = self.clients.get(node_id)
+        if client is None or self.transport is None:
+            return "ERROR: Node ID not found."
+        packet = f"CONFIG:{node_id}:{accel}:{gyro}:{srd}:{freq}"
+        self.loop.call_soon_threadsafe(self.transport.sendto, packet.encode(), client.addr)
+        client.accel, client.gyro, client.srd, client.freq = accel, gyro, srd, freq
+        return f"Sent CONFIG to {node_id}: {packet}"
+
+    def handle_command(self, command):
+        """Handle a serial-style command line (CONFIG:..., LIST_CLIENTS); returns the reply."""
+        command = command.strip()
+        if command.startswith("CONFIG:"):
+            parts = command.split(":")
+            if len(parts) != 6:
+                return "ERROR: Invalid CONFIG format."
+            try:
+                accel, gyro, srd, freq = (int(p) for p in parts[2:])
+            except ValueError:
+                return "ERROR: Invalid CONFIG values."
+            return self.send_config(parts[1], accel, gyro, srd, freq)
+        if command == "LIST_CLIENTS":
+            if not self.clients:
+                return "No clients connected."
+            now = time.monotonic()
+            return "\n".join(
+                f"Node: {c.node_id}, IP: {c.addr[0]}, Port: {c.addr[1]}, "
+                f"Last Seen: {int((now - c.last_seen) * 1000)}ms, "
+                f"Accel: {c.accel}, Gyro: {c.gyro}, SRD: {c.srd}"
+                for c in self.clients.values())
+        return f"Unknown command: {command}"
+
+    # --- Running ---
+    async def serve(self, host="0.0.0.0", port=UDP_PORT, ready=None):
+        """Run until stop(); ``ready`` (threading.Event) is set once the socket is bound."""
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: self, local_addr=(host, port), allow_broadcast=True)
+        self.local_addr = transport.get_extra_info("sockname")
+        if ready is not None:
+            ready.set()
+        next_heartbeat = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush()
+                now = time.monotonic()
+                if now >= next_heartbeat:
+                    self._send_heartbeat()
+                    self._expire_clients()
+                    next_heartbeat = now + self.heartbeat_interval
+        finally:
+            self._flush()
+            transport.close()
+
+    def stop(self):
+        """Thread-safe: make serve() return."""
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+
+def main():
+    from ingest_engine import IngestEngine
+
+    parser = argparse.ArgumentParser(description="UDP gateway for the sensor nodes (replaces the ESP32 serial bridge)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--broadcast", help="heartbeat broadcast address, e.g. 192.168.4.255")
+    parser.add_argument("--out", help="directory to record into (no recording if omitted)")
+    parser.add_argument("--name", default="sensor_data")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    engine = IngestEngine()
+    engine.open_udp(args.host, args.port, broadcast=args.broadcast)
+    engine.log("INFO", f"Đang nghe UDP {args.host}:{args.port}")
+    if args.out:
+        engine.start_recording(args.out, args.name)
+    try:
+        while engine.running:
+            time.sleep(args.stats_interval)
+            s = engine.stats()
+            engine.log("STATS", f"{s['samples']} samples ({s['samples_per_s']:.1f}/s), nodes={s['nodes']}, "
+                                f"rows written={s['rows_written']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Stand-in for ESP8266 sensor nodes talking UDP to the gateway.
+
+Each simulated node behaves like esp8266_fixing.ino:
+- It sends ``HELLO:<id>:<type>`` every 5 s until it gets ``WELCOME:<id>:<server millis>``.
+- It then sends JSON samples at its data frequency, timestamped in server millis.
+- It handshakes again after DATA_PACKET_RESET_THRESHOLD packets, or after
+  3 missed SERVER_HEARTBEATs.
+- It applies ``CONFIG:<id>:<accel>:<gyro>:<srd>:<freq>``.
+
+With ``--binary`` samples go out as binary frames (binary_frames.py) instead
+of JSON.
+
+Samples come from data/ recordings (``--replay``) or a synthetic leg-press
+motion.  Together with udp_gateway.py this tests the UDP path on loopback:
+
+    python udp_gateway.py --port 1234
+    python udp_node_sim.py --server 127.0.0.1 --nodes 4 --freq 50
+"""
+import argparse
+import asyncio
+import math
+import time
+
+from binary_frames import encode_frame, node_number
+from udp_gateway import UDP_PORT
+
+DATA_PACKET_RESET_THRESHOLD = 200
+HANDSHAKE_RETRY_INTERVAL_S = 5.0
+SERVER_HEARTBEAT_TIMEOUT_S = 10.0
+MAX_HEARTBEAT_FAILURES = 3
+
+
+class SimulatedNode(asyncio.DatagramProtocol):
+    def __init__(self, node_id, server, freq=10, node_type="MPU6050", samples=None, rate_hz=None, binary=False):
+        self.node_id = node_id
+        self.binary = binary
+        self.number = node_number(node_id) if binary else None
+        self.server = server
+        self.freq = freq
+        self.node_type = node_type
+        self.samples = samples  # Optional (n, 6) array to replay
+        self.rate_hz = rate_hz  # Native rate of ``samples``
+        self.accel = self.gyro = self.srd = 0
+        self.transport = None
+        self.handshake_completed = False
+        self.server_millis_at_handshake = 0
+        self.client_millis_at_handshake = 0
+        self.last_heartbeat = time.monotonic()
+        self.heartbeat_failures = 0
+        self.packet_counter = 0
+        self.packets_sent = 0
+        self.handshakes = 0
+        self._started = time.monotonic()
+
+    def millis(self):
+        return int((time.monotonic() - self._started) * 1000)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        text = data.decode("utf-8", errors="replace").strip()
+        if text.startswith("SERVER_HEARTBEAT:"):
+            self.last_heartbeat = time.monotonic()
+            self.heartbeat_failures = 0
+        elif text.startswith("WELCOME:"):
+            parts = text.split(":")
+            if len(parts) >= 3 and parts[1] == self.node_id:
+                self.server_millis_at_handshake = int(parts[2])
+                self.handshake_completed = True
+                self.handshakes += 1
+                self.last_heartbeat = time.monotonic()
+        elif text.startswith("CONFIG:"):
+            parts = text.split(":")
+            if len(parts) == 6 and parts[1] == self.node_id:
+                self.accel, self.gyro, self.srd, freq = (int(p) for p in parts[2:])
+                if freq > 0:
+                    self.freq = freq
+
+    def send_hello(self):
+        self.client_millis_at_handshake = self.millis()
+        self.transport.sendto(f"HELLO:{self.node_id}:{self.node_type}".encode(), self.server)
+
+    def sample(self, t):
+        if self.samples is not None:
+            row = self.samples[int(t * self.rate_hz) % len(self.samples)]
+            return row.tolist()
+        # Slow leg-press cycle (~3 s) plus a little noise-like ripple
+        phase = 2 * math.pi * t / 3.0
+        return [0.05 * math.sin(phase), 0.02 * math.sin(7 * phase), 1.0 + 0.3 * math.sin(phase),
+                40 * math.cos(phase), 5 * math.sin(3 * phase), 2 * math.cos(5 * phase)]
+
+    def send_sample(self):
+        t = time.monotonic() - self._started
+        ts = self.server_millis_at_handshake + (self.millis() - self.client_millis_at_handshake)
+        values = self.sample(t)
+        if self.binary:
+            packet = encode_frame(self.number, self.packets_sent, ts, values,
+                                  accel_range=min(self.accel, 3), gyro_range=min(self.gyro, 3))
+        else:
+            ax, ay, az, gx, gy, gz = values
+            packet = (f'{{"id":"{self.node_id}","ts":{ts},"ax":{ax:.3f},"ay":{ay:.3f},"az":{az:.3f},'
+                      f'"gx":{gx:.3f},"gy":{gy:.3f},"gz":{gz:.3f}}}').encode()
+        self.transport.sendto(packet, self.server)
+        self.packets_sent += 1
+        self.packet_counter += 1
+        if self.packet_counter >= DATA_PACKET_RESET_THRESHOLD:
+            self.handshake_completed = False  # Re-initiate handshake, like the firmware
+            self.packet_counter = 0
+
+    async def run(self, stop):
+        next_hello = 0.0
+        next_send = time.monotonic()
+        while not stop.is_set():
+            now = time.monotonic()
+            if not self.handshake_completed:
+                if now >= next_hello:
+                    self.send_hello()
+                    next_hello = now + HANDSHAKE_RETRY_INTERVAL_S
+                await asyncio.sleep(0.01)
+                next_send = time.monotonic()
+                continue
+            next_hello = 0.0
+            if now - self.last_heartbeat > SERVER_HEARTBEAT_TIMEOUT_S:
+                self.heartbeat_failures += 1
+                self.last_heartbeat = now
+                if self.heartbeat_failures >= MAX_HEARTBEAT_FAILURES:
+                    self.handshake_completed = False
+                    self.heartbeat_failures = 0
+                    continue
+            if now >= next_send:
+                self.send_sample()
+                next_send += 1.0 / self.freq
+                if next_send < now:  # Fell behind: do not burst to catch up
+                    next_send = now + 1.0 / self.freq
+            await asyncio.sleep(max(0.0, min(next_send - time.monotonic(), 0.05)))
+
+
+async def run_nodes(args):
+    loop = asyncio.get_running_loop()
+    recordings = None
+    if args.replay:
+        from serial_simulator import load_recordings
+
+        recordings = load_recordings(args.replay)
+    nodes = []
+    for i in range(args.nodes):
+        samples = rate_hz = None
+        if recordings:
+            _, rel_time, samples = recordings[i % len(recordings)]
+            rate_hz = (len(rel_time) - 1) / rel_time[-1]
+        node = SimulatedNode(f"{args.prefix}{i + 1}", (args.server, args.port), freq=args.freq,
+                             samples=samples, rate_hz=rate_hz, binary=args.binary)
+        await loop.create_datagram_endpoint(lambda node=node: node, local_addr=(args.bind, 0))
+        nodes.append(node)
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(node.run(stop)) for node in nodes]
+    start = time.monotonic()
+    try:
+        while args.duration <= 0 or time.monotonic() - start < args.duration:
+            await asyncio.sleep(1.0)
+            sent = sum(node.packets_sent for node in nodes)
+            ready = sum(node.handshake_completed for node in nodes)
+            print(f"{time.monotonic() - start:5.1f}s  packets sent {sent:,}  handshaked {ready}/{len(nodes)}")
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks)
+        for node in nodes:
+            node.transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ESP8266 nodes sending UDP to the gateway")
+    parser.add_argument("--server", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--prefix", default="Sensor_")
+    parser.add_argument("--freq", type=int, default=10, help="data send frequency (Hz)")
+    parser.add_argument("--replay", help="glob of CSV recordings to replay instead of synthetic motion")
+    parser.add_argument("--binary", action="store_true", help="send binary sample frames instead of JSON")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run (0 = until Ctrl+C)")
+    args = parser.parse_args()
+    if args.binary:
+        try:
+            for i in range(args.nodes):
+                node_number(f"{args.prefix}{i + 1}")
+        except ValueError as e:
+            parser.error(f"--binary: {e}")
+    try:
+        asyncio.run(run_nodes(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()